@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+原子写入JSON文件
+先把内容完整序列化（数据无法序列化时不会动到原文件），写入同一目录下的临时文件并fsync，
+再用os.replace替换目标文件，最后fsync目录使替换本身落盘。
+进程崩溃或断电时目标文件要么是旧内容，要么是新内容，不会出现写了一半的文件；
+每次写入使用不同的临时文件名，并发写入同一文件时后完成的一方生效，内容不会交错。
+"""
+
+import os
+import json
+import tempfile
+
+
+def fsync_directory(directory):
+    """把目录项的修改（新建、重命名）刷到磁盘；不支持打开目录的平台（Windows）直接跳过"""
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_bytes_atomic(path, data):
+    """原子替换文件内容"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(directory)
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """序列化为JSON并原子写入，dump_kwargs传给json.dumps（默认保留非ASCII字符）"""
+    dump_kwargs.setdefault('ensure_ascii', False)
+    write_bytes_atomic(path, json.dumps(data, **dump_kwargs).encode('utf-8'))
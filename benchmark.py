@@ -0,0 +1,640 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试脚本
+使用data文件夹中的样例图片和按比例放大的合成照片目录，测量图片处理流程和HTTP服务器的性能
+运行方式：
+    python benchmark.py thumbnails [--limit N] [--repeat N]     对比完整解码与draft解码生成缩略图
+    python benchmark.py pipeline [--limit N] [--repeat N]       逐张测量解码/缩放/编码耗时
+    python benchmark.py exif [--repeat N]                       EXIF提取吞吐量
+    python benchmark.py http [--photos 1000,10000,100000]       进程内HTTP压测，输出p50/p99延迟和每秒请求数
+    python benchmark.py compare base.json new.json              对比两次运行的结果
+每个测试都可以加 --output result.json 保存机器可读的结果（含提交号和运行环境），用于跨提交对比。
+"""
+
+import os
+import io
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+import http.client
+from urllib.parse import quote
+
+from PIL import Image, ImageChops, ImageStat
+
+from generate_thumbnails import (
+    THUMBNAIL_MAX_WIDTH, THUMBNAIL_MAX_HEIGHT, RENDITION_FORMATS,
+    RENDITION_SAVE_FORMATS, RENDITION_SAVE_OPTIONS, REDUCING_GAP,
+    decode_for_sizes, make_placeholder, rendition_plan, resize_image, list_source_images
+)
+from storage_layout import thumbnail_path_for
+from extract_exif import extract_exif_batch, extract_exif_data, DEFAULT_WORKERS as EXIF_WORKERS
+
+# 结果文件格式版本
+RESULT_VERSION = 1
+
+# HTTP压测：默认的合成照片目录规模、并发连接数和每个场景的请求数
+DEFAULT_HTTP_PHOTOS = (1000,)
+DEFAULT_CONCURRENCY = 8
+DEFAULT_REQUESTS = 500
+# /save-json每次提交整个目录（10万张照片时约几十MB），默认只测少量请求
+DEFAULT_SAVE_REQUESTS = 20
+# 合成目录中的标签数量（分页查询按标签筛选）
+SYNTHETIC_TAGS = 20
+# 压测站点需要的页面文件
+SITE_FILES = ('index.html', 'admin.html', 'script.js', 'styles.css')
+
+# compare中变化超过该比例的指标会被标记
+COMPARE_THRESHOLD = 0.05
+
+
+def list_sample_images(limit=None):
+    """列出data文件夹中的样例图片（包括分片目录中的原图）"""
+    files = sorted(list_source_images())
+    return files[:limit] if limit else files
+
+
+def thumbnail_size(width, height):
+    """与generate_thumbnails.py相同的缩略图尺寸计算"""
+    ratio = min(THUMBNAIL_MAX_WIDTH / width, THUMBNAIL_MAX_HEIGHT / height, 1)
+    return int(width * ratio), int(height * ratio)
+
+
+def decoded_bytes(img):
+    """解码后像素缓冲区的大小（峰值内存的主要部分）"""
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+
+def thumbnail_full_decode(path):
+    """旧流程：完整解码后直接LANCZOS缩放"""
+    with Image.open(path) as img:
+        size = thumbnail_size(*img.size)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGB')
+        img.load()
+        peak = decoded_bytes(img)
+        return img.resize(size, Image.Resampling.LANCZOS), peak
+
+
+def thumbnail_draft_decode(path):
+    """新流程：draft解码 + reduce + LANCZOS（generate_thumbnails.resize_image）"""
+    with Image.open(path) as img:
+        size = thumbnail_size(*img.size)
+        thumbnail = resize_image(img, size)
+        return thumbnail, decoded_bytes(img)
+
+
+def encode_jpeg(img):
+    """按缩略图参数编码JPEG，返回字节数"""
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=85, optimize=True)
+    return buffer.tell()
+
+
+def psnr(a, b):
+    """两张同尺寸图片的峰值信噪比（dB），越高越接近"""
+    diff = ImageChops.difference(a.convert('RGB'), b.convert('RGB'))
+    stat = ImageStat.Stat(diff)
+    mse = sum(stat.sum2) / (a.size[0] * a.size[1] * 3)
+    if mse == 0:
+        return float('inf')
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def time_call(func, path, repeat):
+    """重复执行取中位数耗时（秒），并返回最后一次的结果"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def bench_thumbnails(limit=None, repeat=3):
+    """缩略图解码基准：逐张对比两种流程"""
+    paths = list_sample_images(limit)
+    if not paths:
+        print("❌ 在data文件夹中没有找到图片文件")
+        return None
+        
+    rows = []
+    print(f"{'文件':<40} {'完整解码':>10} {'draft解码':>10} {'加速':>7} {'内存(MB)':>15} {'PSNR':>8}")
+    for path in paths:
+        full_time, (full_thumb, full_peak) = time_call(thumbnail_full_decode, path, repeat)
+        draft_time, (draft_thumb, draft_peak) = time_call(thumbnail_draft_decode, path, repeat)
+        quality = psnr(full_thumb, draft_thumb)
+        rows.append({
+            'name': os.path.basename(path),
+            'fullSeconds': full_time,
+            'draftSeconds': draft_time,
+            'speedup': full_time / draft_time,
+            'fullDecodedBytes': full_peak,
+            'draftDecodedBytes': draft_peak,
+            'psnr': quality,
+            'fullJpegBytes': encode_jpeg(full_thumb),
+            'draftJpegBytes': encode_jpeg(draft_thumb)
+        })
+        memory = f"{full_peak / 2**20:.1f}→{draft_peak / 2**20:.1f}"
+        print(f"{os.path.basename(path)[:40]:<40} {full_time * 1000:>8.1f}ms {draft_time * 1000:>8.1f}ms "
+              f"{full_time / draft_time:>6.1f}x {memory:>15} {quality:>6.1f}dB")
+              
+    total_full = sum(r['fullSeconds'] for r in rows)
+    total_draft = sum(r['draftSeconds'] for r in rows)
+    finite_psnr = [r['psnr'] for r in rows if math.isfinite(r['psnr'])]
+    print("\n" + "="*50)
+    print(f"📸 图片数：{len(rows)}")
+    print(f"⏱️  完整解码总耗时：{total_full:.2f}s，draft解码总耗时：{total_draft:.2f}s，"
+          f"加速 {total_full / total_draft:.1f}x")
+    print(f"🧠 平均解码内存：{statistics.mean(r['fullDecodedBytes'] for r in rows) / 2**20:.1f}MB → "
+          f"{statistics.mean(r['draftDecodedBytes'] for r in rows) / 2**20:.1f}MB")
+    if finite_psnr:
+        print(f"🎨 画质（PSNR，越高越好，>40dB肉眼难以分辨）：最低 {min(finite_psnr):.1f}dB，"
+              f"平均 {statistics.mean(finite_psnr):.1f}dB")
+    return rows
+
+
+def timed(func, *args):
+    """执行一次，返回 (耗时秒数, 结果)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def encode_image(img, fmt):
+    """按派生图参数编码到内存，返回字节数"""
+    buffer = io.BytesIO()
+    img.save(buffer, RENDITION_SAVE_FORMATS[fmt], **RENDITION_SAVE_OPTIONS[fmt])
+    return buffer.tell()
+
+
+def pipeline_stages(path, formats=RENDITION_FORMATS):
+    """按generate_thumbnails.process_image的步骤处理一张图片（输出写到内存），返回各阶段耗时（秒）"""
+    stages = {'open': 0.0, 'decode': 0.0, 'resize': 0.0, 'encode': 0.0, 'placeholder': 0.0}
+    start = time.perf_counter()
+    with Image.open(path) as img:
+        width, height = img.size
+        ratio = min(THUMBNAIL_MAX_WIDTH / width, THUMBNAIL_MAX_HEIGHT / height, 1)
+        thumbnail_size = (int(width * ratio), int(height * ratio))
+        targets = [thumbnail_size] + rendition_plan(width, height)
+        stages['open'] = time.perf_counter() - start
+        
+        stages['decode'], img = timed(decode_for_sizes, img, targets)
+        decode_time, _ = timed(img.load)
+        stages['decode'] += decode_time
+        
+        outputs = 0
+        for index, size in enumerate(targets):
+            resize_time, resized = timed(img.resize, size, Image.Resampling.LANCZOS, None, REDUCING_GAP)
+            stages['resize'] += resize_time
+            for fmt in (('jpeg',) if index == 0 else formats):
+                encode_time, _ = timed(encode_image, resized, fmt)
+                stages['encode'] += encode_time
+                outputs += 1
+        stages['placeholder'], _ = timed(make_placeholder, img, (width, height))
+    stages['total'] = time.perf_counter() - start
+    return stages, {'width': width, 'height': height, 'outputs': outputs}
+
+
+def bench_pipeline(limit=None, repeat=1, formats=RENDITION_FORMATS):
+    """派生图流程基准：每张图片一次解码，测量打开、解码、缩放、编码、占位信息各阶段的耗时"""
+    paths = list_sample_images(limit)
+    if not paths:
+        print("❌ 在data文件夹中没有找到图片文件")
+        return None
+    
+    stage_names = ('open', 'decode', 'resize', 'encode', 'placeholder', 'total')
+    rows = []
+    print(f"{'文件':<40} {'尺寸':>11} " + ' '.join(f'{name:>11}' for name in stage_names))
+    for path in paths:
+        runs = [pipeline_stages(path, formats) for _ in range(repeat)]
+        info = runs[-1][1]
+        row = {'name': os.path.basename(path), **info}
+        for name in stage_names:
+            row[f'{name}Seconds'] = statistics.median(stages[name] for stages, _ in runs)
+        rows.append(row)
+        print(f"{row['name'][:40]:<40} {info['width']:>5}x{info['height']:<5} "
+              + ' '.join(f"{row[f'{name}Seconds'] * 1000:>9.1f}ms" for name in stage_names))
+    
+    summary = {'name': 'total', 'images': len(rows)}
+    for name in stage_names:
+        summary[f'{name}Seconds'] = sum(row[f'{name}Seconds'] for row in rows)
+    summary['imagesPerSecond'] = len(rows) / summary['totalSeconds']
+    rows.append(summary)
+    print("\n" + "="*50)
+    print(f"📸 图片数：{len(paths)}，格式：{', '.join(formats)}，单进程 {summary['imagesPerSecond']:.2f} 张/秒")
+    print("⏱️  " + '，'.join(f"{name} {summary[f'{name}Seconds']:.2f}s" for name in stage_names))
+    return rows
+
+
+def bench_exif(repeat=3, workers=EXIF_WORKERS):
+    """EXIF提取基准：逐张串行和extract_exif_batch多线程并行的吞吐量"""
+    paths = list_sample_images()
+    if not paths:
+        print("❌ 在data文件夹中没有找到图片文件")
+        return None
+    
+    serial = []
+    for _ in range(repeat):
+        elapsed, _ = timed(lambda: [extract_exif_data(path) for path in paths])
+        serial.append(elapsed)
+    parallel = []
+    for _ in range(repeat):
+        elapsed, _ = timed(extract_exif_batch, paths, None, None, None, workers)
+        parallel.append(elapsed)
+    
+    rows = [
+        {'name': 'serial', 'images': len(paths), 'seconds': statistics.median(serial)},
+        {'name': 'parallel', 'images': len(paths), 'workers': workers, 'seconds': statistics.median(parallel)}
+    ]
+    for row in rows:
+        row['imagesPerSecond'] = row['images'] / row['seconds']
+        row['msPerImage'] = row['seconds'] * 1000 / row['images']
+    print(f"📸 图片数：{len(paths)}")
+    print(f"🔍 串行：{rows[0]['imagesPerSecond']:.0f} 张/秒（{rows[0]['msPerImage']:.2f}ms/张）")
+    print(f"🔍 并行（{workers} 线程）：{rows[1]['imagesPerSecond']:.0f} 张/秒（{rows[1]['msPerImage']:.2f}ms/张）")
+    return rows
+
+
+def template_photos():
+    """合成目录的模板照片：优先使用photos.json中的照片（含EXIF、派生图等字段），否则按data中的图片生成"""
+    try:
+        with open('photos.json', 'r', encoding='utf-8') as f:
+            photos = json.load(f).get('photos', [])
+    except (FileNotFoundError, ValueError):
+        photos = []
+    photos = [p for p in photos if isinstance(p, dict) and os.path.exists(p.get('src', ''))]
+    if not photos:
+        photos = [{'src': path.replace(os.sep, '/'), 'title': os.path.basename(path), 'description': '', 'tags': []}
+                  for path in list_sample_images()]
+    return photos
+
+
+def synthetic_catalog(count, templates):
+    """按模板循环生成count张照片的目录；每张照片有唯一ID、标题和合成标签，图片文件指向真实的样例图片"""
+    photos = []
+    for index in range(count):
+        photo = dict(templates[index % len(templates)])
+        photo['id'] = index + 1
+        photo['title'] = f"{photo.get('title') or '照片'} #{index + 1}"
+        tags = photo.get('tags') if isinstance(photo.get('tags'), list) else []
+        photo['tags'] = tags + [f'标签{index % SYNTHETIC_TAGS}']
+        photos.append(photo)
+    return {'photos': photos}
+
+
+def link_or_copy(source, target):
+    """把仓库中的目录/文件放进压测站点：优先符号链接，不支持时复制"""
+    source = os.path.abspath(source)
+    try:
+        os.symlink(source, target, target_is_directory=os.path.isdir(source))
+    except (OSError, NotImplementedError):
+        if os.path.isdir(source):
+            shutil.copytree(source, target)
+        else:
+            shutil.copy2(source, target)
+
+
+def prepare_site(site, count, templates):
+    """在临时目录中搭建压测站点：页面文件、data/、thumbnails/和路径索引（链接到仓库）以及合成的photos.json"""
+    for name in SITE_FILES + ('data', 'thumbnails', 'renditions', 'storage.db'):
+        if os.path.exists(name):
+            link_or_copy(name, os.path.join(site, name))
+    catalog = synthetic_catalog(count, templates)
+    with open(os.path.join(site, 'photos.json'), 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False)
+    return catalog
+
+
+def percentile(sorted_values, fraction):
+    """最近秩法分位数"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_load(port, make_request, requests, concurrency):
+    """进程内压测：concurrency个长连接并发发送requests个请求
+    
+    make_request(i) 返回 (method, path, body, headers)。
+    返回延迟分布（毫秒）、每秒请求数、失败数和接收的字节数。
+    """
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+    latencies = []
+    errors = []
+    received = [0]
+    results_lock = threading.Lock()
+    
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        local_latencies = []
+        local_bytes = 0
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                break
+            method, path, body, headers = make_request(index)
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                local_bytes += len(response.read())
+                if response.status >= 400:
+                    raise RuntimeError(f'{method} {path} 返回 {response.status}')
+                local_latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                with results_lock:
+                    errors.append(str(e))
+        connection.close()
+        with results_lock:
+            latencies.extend(local_latencies)
+            received[0] += local_bytes
+    
+    threads = [threading.Thread(target=worker) for _ in range(min(concurrency, requests))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    return {
+        'requests': requests,
+        'concurrency': min(concurrency, requests),
+        'errors': len(errors),
+        'firstError': errors[0] if errors else None,
+        'seconds': elapsed,
+        'requestsPerSecond': len(latencies) / elapsed if elapsed else 0.0,
+        'p50Ms': percentile(latencies, 0.5) * 1000 if latencies else None,
+        'p90Ms': percentile(latencies, 0.9) * 1000 if latencies else None,
+        'p99Ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'maxMs': latencies[-1] * 1000 if latencies else None,
+        'bytesReceived': received[0]
+    }
+
+
+def http_scenarios(catalog, requests, save_requests):
+    """压测场景：名称 -> (请求数, 并发上限, make_request)"""
+    photos = catalog['photos']
+    pages = max(1, math.ceil(len(photos) / 12))
+    originals = list_sample_images()
+    thumbnails = [path for path in map(thumbnail_path_for, originals) if os.path.isfile(path)]
+    save_body = catalog
+    rng = random.Random(0)
+    
+    def api_page(index):
+        params = f'page={rng.randint(1, pages)}&size=12'
+        if index % 2:
+            params += f"&tag={quote(f'标签{index % SYNTHETIC_TAGS}')}"
+        return 'GET', f'/api/photos?{params}', None, {}
+    
+    def thumbnail(index):
+        return 'GET', '/' + thumbnails[index % len(thumbnails)].replace(os.sep, '/'), None, {}
+    
+    def original(index):
+        return 'GET', f'/{originals[index % len(originals)]}', None, {}
+    
+    def photos_json(index):
+        return 'GET', '/photos.json', None, {'Accept-Encoding': 'gzip'}
+    
+    def save_json(index):
+        # 每次修改一张照片的描述，数据库和导出都有真实的写入
+        photo = save_body['photos'][index % len(save_body['photos'])]
+        photo['description'] = f'benchmark {index}'
+        body = json.dumps(save_body, ensure_ascii=False).encode('utf-8')
+        return 'POST', '/save-json', body, {'Content-Type': 'application/json'}
+    
+    scenarios = {'api-page': (requests, None, api_page)}
+    if thumbnails:
+        scenarios['thumbnails'] = (requests, None, thumbnail)
+    if originals:
+        scenarios['originals'] = (requests, None, original)
+    scenarios['photos-json'] = (requests, None, photos_json)
+    # 保存整个目录是串行化的写操作，单连接测量
+    scenarios['save-json'] = (save_requests, 1, save_json)
+    return scenarios
+
+
+def bench_http(sizes=DEFAULT_HTTP_PHOTOS, requests=DEFAULT_REQUESTS, concurrency=DEFAULT_CONCURRENCY,
+               save_requests=DEFAULT_SAVE_REQUESTS, scenarios=None):
+    """HTTP服务器基准：在临时目录中按每种规模搭建合成站点，启动AdminHandler并在进程内压测"""
+    import server
+    from catalog_store import CatalogStore
+    
+    templates = template_photos()
+    if not templates:
+        print("❌ 在data文件夹中没有找到图片文件")
+        return None
+    
+    rows = []
+    repo = os.getcwd()
+    server.AdminHandler.access_log = 'off'
+    print(f"{'规模/场景':<22} {'请求':>6} {'并发':>4} {'req/s':>9} {'p50':>9} {'p99':>9} {'max':>9} {'失败':>4}")
+    for count in sizes:
+        with tempfile.TemporaryDirectory(prefix='gallery-bench-') as site:
+            catalog = prepare_site(site, count, templates)
+            os.chdir(site)
+            httpd = None
+            try:
+                # 每种规模使用独立的数据库和空的静态文件缓存
+                server.catalog_store = CatalogStore(os.path.join(site, 'photos.db'))
+                server.static_cache.clear()
+                load_time, _ = timed(server.catalog_store.sync_from_json)
+                httpd = server.ThreadPoolHTTPServer(('127.0.0.1', 0), server.AdminHandler)
+                port = httpd.server_address[1]
+                threading.Thread(target=httpd.serve_forever, daemon=True).start()
+                print(f"📦 {count} 张照片：导入数据库 {load_time:.2f}s")
+                
+                for name, (total, limit, make_request) in http_scenarios(catalog, requests, save_requests).items():
+                    if scenarios and name not in scenarios:
+                        continue
+                    workers = min(concurrency, limit) if limit else concurrency
+                    result = run_load(port, make_request, total, workers)
+                    rows.append({'name': f'{count}/{name}', 'photos': count, 'scenario': name, **result})
+                    print(f"{f'{count}/{name}':<22} {total:>6} {result['concurrency']:>4} "
+                          f"{result['requestsPerSecond']:>9.1f} {format_ms(result['p50Ms'])} "
+                          f"{format_ms(result['p99Ms'])} {format_ms(result['maxMs'])} {result['errors']:>4}")
+                    if result['firstError']:
+                        print(f"   ⚠️  {result['firstError']}")
+            finally:
+                if httpd is not None:
+                    httpd.shutdown()
+                    httpd.server_close()
+                server.export_scheduler.cancel()
+                server.catalog_store.close()
+                os.chdir(repo)
+    return rows
+
+
+def format_ms(value):
+    return f"{value:>7.1f}ms" if value is not None else f"{'-':>9}"
+
+
+def peak_rss_bytes():
+    """进程的峰值常驻内存（字节）；不支持的平台（Windows）返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def git_commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def environment():
+    """运行环境，写入结果文件，对比时确认两次运行可比"""
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pillow': Image.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    }
+
+
+def write_report(path, suite, parameters, rows):
+    """保存机器可读的结果：每一行都有唯一的name，compare按name对齐两次运行"""
+    report = {
+        'version': RESULT_VERSION,
+        'suite': suite,
+        'environment': environment(),
+        'parameters': parameters,
+        'peakRssBytes': peak_rss_bytes(),
+        'results': rows
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"💾 结果已保存到 {path}")
+
+
+def compare_reports(base_path, new_path, threshold=COMPARE_THRESHOLD):
+    """按name对齐两次运行的结果，列出每个数值指标的变化"""
+    with open(base_path, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+    if base.get('suite') != new.get('suite'):
+        print(f"⚠️  两个结果属于不同的测试：{base.get('suite')} / {new.get('suite')}")
+    print(f"基准：{base['environment'].get('commit')}  新：{new['environment'].get('commit')}")
+    
+    base_rows = {row['name']: row for row in base.get('results', [])}
+    for row in new.get('results', []):
+        previous = base_rows.get(row['name'])
+        if previous is None:
+            continue
+        changes = []
+        for key, value in row.items():
+            old = previous.get(key)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            if old == value or not old:
+                continue
+            delta = (value - old) / old
+            marker = ' ⚠️' if abs(delta) >= threshold else ''
+            changes.append(f"{key} {old:.4g}→{value:.4g} ({delta:+.1%}){marker}")
+        if changes:
+            print(f"{row['name']}: " + '，'.join(changes))
+    for key in ('peakRssBytes',):
+        if base.get(key) and new.get(key):
+            print(f"{key}: {base[key] / 2**20:.1f}MB → {new[key] / 2**20:.1f}MB")
+
+
+def parse_sizes(value):
+    try:
+        sizes = tuple(int(item) for item in value.split(',') if item.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError('需要逗号分隔的整数，例如 1000,10000')
+    if not sizes or min(sizes) < 1:
+        raise argparse.ArgumentTypeError('照片数必须大于0')
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='照片画廊性能基准测试')
+    subparsers = parser.add_subparsers(dest='suite', required=True)
+    
+    thumbnails = subparsers.add_parser('thumbnails', help='对比完整解码与draft解码生成缩略图')
+    thumbnails.add_argument('--limit', type=int, default=None, help='最多测试多少张图片')
+    thumbnails.add_argument('--repeat', type=int, default=3, help='每张图片重复次数（取中位数）')
+    
+    pipeline = subparsers.add_parser('pipeline', help='逐张测量派生图流程的解码、缩放、编码耗时')
+    pipeline.add_argument('--limit', type=int, default=None, help='最多测试多少张图片')
+    pipeline.add_argument('--repeat', type=int, default=1, help='每张图片重复次数（取中位数）')
+    
+    exif = subparsers.add_parser('exif', help='EXIF提取吞吐量')
+    exif.add_argument('--repeat', type=int, default=3, help='重复次数（取中位数）')
+    exif.add_argument('--workers', type=int, default=EXIF_WORKERS, help='并行提取的线程数（默认%(default)s）')
+    
+    http_parser = subparsers.add_parser('http', help='进程内HTTP压测（缩略图、原图、photos.json、分页查询、保存）')
+    http_parser.add_argument('--photos', type=parse_sizes, default=DEFAULT_HTTP_PHOTOS,
+                             help='合成照片目录的规模，逗号分隔，例如 1000,10000,100000（默认1000）')
+    http_parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='每个场景的请求数（默认%(default)s）')
+    http_parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='并发连接数（默认%(default)s）')
+    http_parser.add_argument('--save-requests', type=int, default=DEFAULT_SAVE_REQUESTS,
+                             help='/save-json 的请求数（默认%(default)s）')
+    http_parser.add_argument('--scenarios', default=None,
+                             help='只运行指定场景，逗号分隔：api-page,thumbnails,originals,photos-json,save-json')
+    
+    for sub in (thumbnails, pipeline, exif, http_parser):
+        sub.add_argument('--output', default=None, help='把结果保存为JSON文件')
+    
+    compare = subparsers.add_parser('compare', help='对比两个结果文件')
+    compare.add_argument('base', help='基准结果（例如优化前的提交）')
+    compare.add_argument('new', help='新结果')
+    compare.add_argument('--threshold', type=float, default=COMPARE_THRESHOLD,
+                         help='变化超过该比例时标记（默认%(default)s）')
+    
+    args = parser.parse_args(argv)
+    if args.suite == 'compare':
+        compare_reports(args.base, args.new, args.threshold)
+        return 0
+    
+    parameters = {key: value for key, value in vars(args).items() if key not in ('suite', 'output')}
+    if args.suite == 'thumbnails':
+        rows = bench_thumbnails(limit=args.limit, repeat=max(1, args.repeat))
+    elif args.suite == 'pipeline':
+        rows = bench_pipeline(limit=args.limit, repeat=max(1, args.repeat))
+    elif args.suite == 'exif':
+        rows = bench_exif(repeat=max(1, args.repeat), workers=max(1, args.workers))
+    else:
+        scenarios = set(args.scenarios.split(',')) if args.scenarios else None
+        rows = bench_http(sizes=args.photos, requests=max(1, args.requests), concurrency=max(1, args.concurrency),
+                          save_requests=max(1, args.save_requests), scenarios=scenarios)
+    if rows is None:
+        return 1
+    
+    peak = peak_rss_bytes()
+    if peak:
+        print(f"🧠 峰值内存（RSS）：{peak / 2**20:.1f}MB")
+    if args.output:
+        write_report(args.output, args.suite, parameters, rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+照片目录拆分脚本
+把photos.json拆分为首屏需要的精简索引和按需加载的详情分块：
+- catalog/index.json：网格需要的字段（标题、标签、缩略图、派生图等）
+- catalog/details-<n>.json：EXIF等只在灯箱中显示的字段，每块包含连续的若干张照片
+运行方式：python build_catalog.py（服务器保存photos.json时会自动重新生成）
+"""
+
+import os
+import json
+
+from atomic_file import write_json_atomic
+
+CATALOG_DIR = 'catalog'
+CATALOG_VERSION = 1
+
+# 只在灯箱中使用、不放进索引的字段
+DETAIL_FIELDS = ('exif',)
+
+# 每个详情分块包含的照片数；灯箱前后翻页通常命中同一个分块
+DETAIL_CHUNK_SIZE = 24
+
+
+def split_catalog(photos_data):
+    """把photos.json的内容拆分为 (索引, [详情分块])"""
+    photos = photos_data.get('photos', []) if isinstance(photos_data, dict) else photos_data
+    index = []
+    chunks = []
+    for position, photo in enumerate(photos):
+        chunk = position // DETAIL_CHUNK_SIZE
+        if chunk == len(chunks):
+            chunks.append({})
+        entry = {key: value for key, value in photo.items() if key not in DETAIL_FIELDS}
+        detail = {key: photo[key] for key in DETAIL_FIELDS if photo.get(key)}
+        if detail:
+            # 索引中只记录分块编号，灯箱打开时再加载
+            entry['detail'] = chunk
+            chunks[chunk][photo.get('src', '')] = detail
+        index.append(entry)
+
+    return {
+        'version': CATALOG_VERSION,
+        'count': len(index),
+        'detailChunkSize': DETAIL_CHUNK_SIZE,
+        'photos': index
+    }, chunks
+
+
+def write_catalog(photos_data, catalog_dir=CATALOG_DIR):
+    """生成catalog目录，删除多余的旧分块；返回 (照片数, 分块数)"""
+    index, chunks = split_catalog(photos_data)
+    os.makedirs(catalog_dir, exist_ok=True)
+
+    # 先写分块再写索引，索引引用的分块一定已经存在
+    for chunk, details in enumerate(chunks):
+        write_json_atomic(os.path.join(catalog_dir, f'details-{chunk}.json'), {'photos': details},
+                          separators=(',', ':'))
+    write_json_atomic(os.path.join(catalog_dir, 'index.json'), index, separators=(',', ':'))
+
+    for name in os.listdir(catalog_dir):
+        if name.startswith('details-') and name.endswith('.json'):
+            number = name[len('details-'):-len('.json')]
+            if not number.isdigit() or int(number) >= len(chunks):
+                os.remove(os.path.join(catalog_dir, name))
+    return index['count'], len(chunks)
+
+
+def build_catalog(catalog_path='photos.json', catalog_dir=CATALOG_DIR):
+    """读取photos.json并生成catalog目录"""
+    if not os.path.exists(catalog_path):
+        print(f"❌ 错误：{catalog_path} 不存在")
+        return
+
+    with open(catalog_path, 'r', encoding='utf-8') as f:
+        photos_data = json.load(f)
+
+    count, chunk_count = write_catalog(photos_data, catalog_dir)
+    index_size = os.path.getsize(os.path.join(catalog_dir, 'index.json'))
+
+    print(f"✅ 已生成 {catalog_dir}/index.json：{count} 张照片，{index_size / 1024:.1f}KB")
+    print(f"📦 详情分块：{chunk_count} 个（每块 {DETAIL_CHUNK_SIZE} 张照片）")
+    print(f"📁 原始数据：{catalog_path} {os.path.getsize(catalog_path) / 1024:.1f}KB")
+
+
+if __name__ == '__main__':
+    build_catalog()
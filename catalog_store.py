@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+照片目录存储（SQLite）
+照片数据保存在photos.db中，每张照片一行，修改单张照片只写入这一行；
+photos.json变为导出文件，在需要时由数据库重新生成（静态托管仍然使用它）。
+数据库使用WAL模式：读取不会阻塞写入，写入在事务中完成，进程中途退出也不会留下写了一半的目录。
+运行方式：python catalog_store.py import|export
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from atomic_file import write_json_atomic
+from search_index import SEARCH_INDEX_VERSION, photo_terms as search_terms, query_terms
+
+CATALOG_DB_PATH = 'photos.db'
+CATALOG_JSON_PATH = 'photos.json'
+
+# 等待其他连接释放写锁的最长时间（毫秒）
+BUSY_TIMEOUT_MS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photos (
+    id PRIMARY KEY,
+    position INTEGER NOT NULL,
+    src TEXT,
+    taken_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS photo_tags (
+    photo_id NOT NULL REFERENCES photos(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    position INTEGER,
+    taken_at TEXT,
+    PRIMARY KEY (photo_id, tag)
+);
+CREATE TABLE IF NOT EXISTS photo_terms (
+    term TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    photo_id NOT NULL REFERENCES photos(id) ON DELETE CASCADE,
+    PRIMARY KEY (term, position, photo_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 标签表冗余保存照片的顺序和拍摄时间，(标签, 排序键)索引即为按序排列的照片ID列表，
+# 按标签分页时直接按索引顺序读取一页，不需要对整个标签的照片排序
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_photos_position ON photos(position);
+CREATE INDEX IF NOT EXISTS idx_photos_src ON photos(src);
+DROP INDEX IF EXISTS idx_photos_taken_at;
+CREATE INDEX IF NOT EXISTS idx_photos_taken ON photos(taken_at, position);
+DROP INDEX IF EXISTS idx_photo_tags_tag;
+CREATE INDEX IF NOT EXISTS idx_photo_tags_position ON photo_tags(tag, position);
+CREATE INDEX IF NOT EXISTS idx_photo_tags_taken ON photo_tags(tag, taken_at, position);
+CREATE INDEX IF NOT EXISTS idx_photo_terms_photo ON photo_terms(photo_id, term);
+"""
+
+# 倒排表（检索词 -> 照片）的主键按显示顺序排列，同一检索词的照片即为按序排列的ID列表；
+# (照片, 检索词)索引用于判断某张照片是否包含其他检索词
+
+# 分页查询支持的排序方式：显示顺序、拍摄时间从旧到新、拍摄时间从新到旧
+SORT_ORDERS = {
+    'position': 'position',
+    'taken': 'taken_at, position',
+    '-taken': 'taken_at DESC, position DESC'
+}
+DEFAULT_SORT = 'position'
+
+# 搜索结果最多精确计数到这个数，命中更多时只报告“超过”，宽泛的查询不必数完所有命中的照片
+SEARCH_COUNT_LIMIT = 1000
+
+
+class GenerationConflict(Exception):
+    """乐观并发检查失败：客户端读取之后目录已被其他写入修改"""
+
+    def __init__(self, current):
+        super().__init__(f'照片目录已被修改（当前版本 {current}）')
+        self.current = current
+
+
+def parse_photo_id(value):
+    """URL中的照片ID：纯数字按整数处理，与photos.json中的数字ID一致"""
+    return int(value) if value.isdigit() else value
+
+
+def photo_taken_at(photo):
+    """照片的拍摄时间（EXIF中的takenAt），用于按日期索引"""
+    exif = photo.get('exif')
+    return exif.get('takenAt') if isinstance(exif, dict) else None
+
+
+def photo_tags(photo):
+    """照片的标签列表（去重，忽略非字符串）"""
+    tags = photo.get('tags')
+    if not isinstance(tags, list):
+        return []
+    return list(dict.fromkeys(tag for tag in tags if isinstance(tag, str)))
+
+
+def encode_photo(photo):
+    return json.dumps(photo, ensure_ascii=False, separators=(',', ':'))
+
+
+class CatalogStore:
+    """照片目录数据库，每个线程使用独立的连接"""
+
+    def __init__(self, path=CATALOG_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # 自动提交模式，事务由transaction()显式控制
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+            connection.execute('PRAGMA journal_mode = WAL')
+            # WAL模式下NORMAL即可保证断电后数据库一致，只可能丢失最后几个事务
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute('PRAGMA foreign_keys = ON')
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.executescript(SCHEMA)
+                    self._migrate(connection)
+                    connection.executescript(INDEXES)
+                    self._ensure_search_index(connection)
+                    self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    def _migrate(self, connection):
+        """旧版数据库的标签表没有排序列，补上列并从照片表回填"""
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(photo_tags)')}
+        if 'position' in columns:
+            return
+        connection.executescript("""
+            BEGIN IMMEDIATE;
+            ALTER TABLE photo_tags ADD COLUMN position INTEGER;
+            ALTER TABLE photo_tags ADD COLUMN taken_at TEXT;
+            UPDATE photo_tags SET
+                position = (SELECT position FROM photos WHERE photos.id = photo_tags.photo_id),
+                taken_at = (SELECT taken_at FROM photos WHERE photos.id = photo_tags.photo_id);
+            COMMIT;
+        """)
+
+    def _ensure_search_index(self, connection):
+        """倒排表为旧版分词规则生成（或尚未建立）时，按当前规则重建"""
+        row = connection.execute("SELECT value FROM meta WHERE key = 'search_version'").fetchone()
+        if row is not None and row[0] == str(SEARCH_INDEX_VERSION):
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM photo_terms')
+            for photo_id, position, data in connection.execute('SELECT id, position, data FROM photos').fetchall():
+                self._write_terms(connection, photo_id, json.loads(data), position)
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('search_version', ?)",
+                               (str(SEARCH_INDEX_VERSION),))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    @contextmanager
+    def transaction(self, expected_generation=None):
+        """写事务：开始时即取得写锁，多个写入方依次执行而不会互相覆盖
+
+        实际修改了数据的写事务把目录版本号加一；没有改动任何行（照片不存在、内容相同）时回滚，
+        版本号不变，其他客户端持有的版本号仍然有效。expected_generation不为None时先检查版本号，
+        不一致说明客户端读取之后目录已被修改，抛出GenerationConflict且不写入。
+        """
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            generation = self.generation()
+            if expected_generation is not None and expected_generation != generation:
+                raise GenerationConflict(generation)
+            changes = connection.total_changes
+            yield connection
+            changed = connection.total_changes != changes
+            if changed:
+                self.set_meta('generation', str(generation + 1))
+                generation += 1
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT' if changed else 'ROLLBACK')
+        self._local.generation = generation
+
+    @property
+    def last_generation(self):
+        """当前线程最近一次提交的写事务产生的版本号"""
+        return getattr(self._local, 'generation', None)
+
+    def close(self):
+        """关闭当前线程的连接"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    # ---- 读取 ----
+
+    def generation(self):
+        """目录版本号，每次写入加一"""
+        return int(self.get_meta('generation') or 0)
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM photos').fetchone()[0]
+
+    def get(self, photo_id):
+        """按ID读取单张照片，不存在时返回None"""
+        row = self.connection.execute('SELECT data FROM photos WHERE id = ?', (photo_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_photos(self):
+        """按显示顺序返回所有照片"""
+        rows = self.connection.execute('SELECT data FROM photos ORDER BY position, rowid')
+        return [json.loads(data) for data, in rows]
+
+    def query(self, tag=None, page=1, size=12, sort=DEFAULT_SORT):
+        """按标签筛选、排序并分页，返回 (本页照片, 符合条件的照片总数)
+
+        分页和计数都走索引，只读取本页的照片行。
+        """
+        order = SORT_ORDERS[sort]
+        offset = (page - 1) * size
+        connection = self.connection
+        if tag is None:
+            total = self.count()
+            rows = connection.execute(f'SELECT data FROM photos ORDER BY {order} LIMIT ? OFFSET ?',
+                                      (size, offset))
+            return [json.loads(data) for data, in rows], total
+
+        total = connection.execute('SELECT COUNT(*) FROM photo_tags WHERE tag = ?', (tag,)).fetchone()[0]
+        ids = [photo_id for photo_id, in connection.execute(
+            f'SELECT photo_id FROM photo_tags WHERE tag = ? ORDER BY {order} LIMIT ? OFFSET ?',
+            (tag, size, offset)
+        )]
+        return self._photos_by_ids(ids), total
+
+    def _photos_by_ids(self, ids):
+        """按给定的ID顺序读取照片"""
+        if not ids:
+            return []
+        placeholders = ', '.join('?' * len(ids))
+        data_by_id = dict(self.connection.execute(f'SELECT id, data FROM photos WHERE id IN ({placeholders})', ids))
+        return [json.loads(data_by_id[photo_id]) for photo_id in ids if photo_id in data_by_id]
+
+    def search(self, query, tag=None, page=1, size=12, sort=DEFAULT_SORT):
+        """全文搜索，所有检索词都命中的照片按sort排序分页
+
+        返回 (本页照片, 命中总数, 总数是否精确)；命中超过SEARCH_COUNT_LIMIT张时总数为该上限。
+        有命中照片较少的检索词时只检查它倒排列表中的照片；所有检索词都很宽泛时按排序索引
+        顺序逐张检查，读够一页即可停止，两种情况都不需要取出全部命中的照片。
+        """
+        terms = query_terms(query)
+        if not terms:
+            return [], 0, True
+        connection = self.connection
+
+        # 每个条件：(表, 条件, 参数)
+        conditions = []
+        for term, prefix in terms:
+            if prefix:
+                # BINARY排序下，以term开头的词都落在[term, term + U+10FFFF)之间
+                conditions.append(('photo_terms', 'term >= ? AND term < ?', (term, term + '\U0010ffff')))
+            else:
+                conditions.append(('photo_terms', 'term = ?', (term,)))
+        if tag is not None:
+            conditions.append(('photo_tags', 'tag = ?', (tag,)))
+        counts = [
+            connection.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {where} LIMIT ?)',
+                               params + (SEARCH_COUNT_LIMIT,)).fetchone()[0]
+            for table, where, params in conditions
+        ]
+        if not min(counts):
+            return [], 0, True
+
+        where = []
+        params = []
+        if min(counts) < SEARCH_COUNT_LIMIT:
+            table, driver_where, driver_params = conditions.pop(counts.index(min(counts)))
+            where.append(f'd.id IN (SELECT photo_id FROM {table} WHERE {driver_where})')
+            params.extend(driver_params)
+        for table, condition, condition_params in conditions:
+            where.append(f'EXISTS (SELECT 1 FROM {table} WHERE photo_id = d.id AND {condition})')
+            params.extend(condition_params)
+        where = ' AND '.join(where)
+
+        total = connection.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM photos d WHERE {where} LIMIT ?)',
+                                   params + [SEARCH_COUNT_LIMIT + 1]).fetchone()[0]
+        exact = total <= SEARCH_COUNT_LIMIT
+        total = min(total, SEARCH_COUNT_LIMIT)
+        ids = [photo_id for photo_id, in connection.execute(
+            f'SELECT d.id FROM photos d WHERE {where} ORDER BY {SORT_ORDERS[sort]} LIMIT ? OFFSET ?',
+            params + [size, (page - 1) * size]
+        )]
+        return self._photos_by_ids(ids), total, exact
+
+    def tag_counts(self):
+        """每个标签的照片数（按标签排序），用于标签筛选按钮"""
+        rows = self.connection.execute('SELECT tag, COUNT(*) FROM photo_tags GROUP BY tag ORDER BY tag')
+        return {tag: count for tag, count in rows}
+
+    def export_document(self):
+        """生成与photos.json相同结构的字典"""
+        document = json.loads(self.get_meta('document') or '{}')
+        document['photos'] = self.list_photos()
+        return document
+
+    def get_meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    # ---- 写入 ----
+
+    def _write_photo(self, connection, photo, position):
+        """写入一行照片及其标签（调用方处于写事务中）"""
+        photo_id = photo['id']
+        taken_at = photo_taken_at(photo)
+        connection.execute(
+            'INSERT INTO photos (id, position, src, taken_at, data) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET position = excluded.position, src = excluded.src, '
+            'taken_at = excluded.taken_at, data = excluded.data',
+            (photo_id, position, photo.get('src'), taken_at, encode_photo(photo))
+        )
+        connection.execute('DELETE FROM photo_tags WHERE photo_id = ?', (photo_id,))
+        connection.executemany('INSERT INTO photo_tags (photo_id, tag, position, taken_at) VALUES (?, ?, ?, ?)',
+                               [(photo_id, tag, position, taken_at) for tag in photo_tags(photo)])
+        self._write_terms(connection, photo_id, photo, position)
+
+    def _write_terms(self, connection, photo_id, photo, position):
+        """重写单张照片在倒排表中的检索词（调用方处于写事务中）"""
+        connection.execute('DELETE FROM photo_terms WHERE photo_id = ?', (photo_id,))
+        connection.executemany('INSERT INTO photo_terms (term, position, photo_id) VALUES (?, ?, ?)',
+                               [(term, position, photo_id) for term in search_terms(photo)])
+
+    def _next_id(self, connection):
+        row = connection.execute("SELECT MAX(id) FROM photos WHERE typeof(id) = 'integer'").fetchone()
+        return (row[0] or 0) + 1
+
+    def _next_position(self, connection):
+        row = connection.execute('SELECT MAX(position) FROM photos').fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def upsert(self, photo, expected_generation=None):
+        """新增或整体替换单张照片，没有ID时自动分配；返回 (照片, 是否新增)"""
+        photo = dict(photo)
+        with self.transaction(expected_generation) as connection:
+            if photo.get('id') is None:
+                photo['id'] = self._next_id(connection)
+            row = connection.execute('SELECT position FROM photos WHERE id = ?', (photo['id'],)).fetchone()
+            position = row[0] if row else self._next_position(connection)
+            self._write_photo(connection, photo, position)
+        return photo, row is None
+
+    def update(self, photo_id, fields, expected_generation=None):
+        """合并部分字段到单张照片，照片不存在时返回None"""
+        with self.transaction(expected_generation) as connection:
+            row = connection.execute('SELECT position, data FROM photos WHERE id = ?', (photo_id,)).fetchone()
+            if row is None:
+                return None
+            photo = json.loads(row[1])
+            photo.update(fields)
+            photo['id'] = photo_id
+            self._write_photo(connection, photo, row[0])
+        return photo
+
+    def delete(self, photo_id, expected_generation=None):
+        """删除单张照片，返回是否存在"""
+        with self.transaction(expected_generation) as connection:
+            cursor = connection.execute('DELETE FROM photos WHERE id = ?', (photo_id,))
+        return cursor.rowcount > 0
+
+    def update_by_src(self, updates):
+        """把按src索引的字段更新合并进对应照片，字段值与现有内容相同的照片不改写
+
+        返回 (内容有变化的照片数, 没有匹配到照片的更新 {src: 字段})；没有照片变化时版本号不变。
+        """
+        changed = 0
+        remaining = dict(updates)
+        with self.transaction() as connection:
+            for src in list(remaining):
+                rows = connection.execute('SELECT position, data FROM photos WHERE src = ?', (src,)).fetchall()
+                if not rows:
+                    continue
+                fields = remaining.pop(src)
+                for position, data in rows:
+                    photo = json.loads(data)
+                    if all(photo.get(key, object()) == value for key, value in fields.items()):
+                        continue
+                    photo.update(fields)
+                    self._write_photo(connection, photo, position)
+                    changed += 1
+        return changed, remaining
+
+    def replace_all(self, photos_data, expected_generation=None):
+        """用完整的photos.json内容替换目录，只改写内容或顺序变化的行
+
+        返回变化的照片数（新增、修改、移动、删除）。
+        """
+        photos = photos_data.get('photos', [])
+        document = {key: value for key, value in photos_data.items() if key != 'photos'}
+        changed = 0
+        with self.transaction(expected_generation) as connection:
+            existing = {
+                photo_id: (position, data)
+                for photo_id, position, data in connection.execute('SELECT id, position, data FROM photos')
+            }
+            numbered = [photo['id'] for photo in photos if isinstance(photo.get('id'), int)]
+            next_id = max([self._next_id(connection) - 1] + numbered) + 1
+            seen = set()
+            for position, photo in enumerate(photos):
+                if photo.get('id') is None or photo['id'] in seen:
+                    photo = dict(photo, id=next_id)
+                    next_id += 1
+                seen.add(photo['id'])
+                if existing.get(photo['id']) != (position, encode_photo(photo)):
+                    self._write_photo(connection, photo, position)
+                    changed += 1
+            removed = [(photo_id,) for photo_id in existing if photo_id not in seen]
+            connection.executemany('DELETE FROM photos WHERE id = ?', removed)
+            changed += len(removed)
+            encoded = json.dumps(document, ensure_ascii=False)
+            if self.get_meta('document') != encoded:
+                self.set_meta('document', encoded)
+        return changed
+
+    # ---- 与photos.json同步 ----
+
+    def _record_json_stat(self, json_path):
+        stat = os.stat(json_path)
+        self.set_meta('json_stat', f'{stat.st_size}:{stat.st_mtime_ns}')
+
+    def import_json(self, json_path=CATALOG_JSON_PATH):
+        """从photos.json导入，返回照片数"""
+        with open(json_path, 'r', encoding='utf-8') as f:
+            photos_data = json.load(f)
+        self.replace_all(photos_data)
+        self._record_json_stat(json_path)
+        return len(photos_data.get('photos', []))
+
+    def export_json(self, json_path=CATALOG_JSON_PATH):
+        """把数据库导出为photos.json（原子替换），返回导出的内容"""
+        photos_data = self.export_document()
+        write_json_atomic(json_path, photos_data, indent=2)
+        self._record_json_stat(json_path)
+        return photos_data
+
+    def json_changed(self, json_path=CATALOG_JSON_PATH):
+        """photos.json是否在数据库之外被修改过（手动编辑、git pull等）"""
+        try:
+            stat = os.stat(json_path)
+        except FileNotFoundError:
+            return False
+        return self.get_meta('json_stat') != f'{stat.st_size}:{stat.st_mtime_ns}'
+
+    def sync_from_json(self, json_path=CATALOG_JSON_PATH):
+        """数据库为空或photos.json在外部被修改时重新导入，返回导入的照片数（未导入时为None）"""
+        if not os.path.exists(json_path):
+            return None
+        if self.count() and not self.json_changed(json_path):
+            return None
+        return self.import_json(json_path)
+
+
+def main(argv):
+    if len(argv) != 1 or argv[0] not in ('import', 'export'):
+        print("用法：python catalog_store.py import|export")
+        print("  import  从photos.json导入到photos.db")
+        print("  export  从photos.db导出photos.json")
+        return 1
+
+    store = CatalogStore()
+    if argv[0] == 'import':
+        if not os.path.exists(CATALOG_JSON_PATH):
+            print(f"❌ 错误：{CATALOG_JSON_PATH} 不存在")
+            return 1
+        count = store.import_json()
+        print(f"✅ 已从 {CATALOG_JSON_PATH} 导入 {count} 张照片到 {CATALOG_DB_PATH}")
+    else:
+        photos_data = store.export_json()
+        print(f"✅ 已从 {CATALOG_DB_PATH} 导出 {len(photos_data['photos'])} 张照片到 {CATALOG_JSON_PATH}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+派生图缓存清单
+按原图内容哈希 + 生成参数记录缩略图和派生图，实现增量生成：
+- 原图的大小和修改时间未变化时直接跳过，不读取、不解码
+- 大小或修改时间变化时重新计算内容哈希，内容确实改变才重新生成
+- 原图被删除或输出改名后，旧的派生文件会被清理（其他原图仍在使用的除外）
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import Counter
+
+from atomic_file import write_json_atomic
+
+# 清单文件位置和格式版本
+MANIFEST_PATH = 'derivatives.json'
+MANIFEST_VERSION = 1
+
+# 计算哈希时每次读取的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """流式计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def recipe_key(params):
+    """生成参数（尺寸、质量、格式等）的指纹，参数变化时所有派生图都需要重新生成"""
+    encoded = json.dumps(params, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class DerivativeManifest:
+    """派生图缓存清单
+    
+    entries结构：
+        { 原图路径: {
+            'size': 字节数, 'mtime_ns': 修改时间, 'sha256': 内容哈希, 'recipe': 参数指纹,
+            'thumbnail': 缩略图路径, 'renditions': 派生图列表, 'outputs': [所有输出文件],
+            'placeholder': 占位信息（尺寸、主色调、模糊预览）
+        } }
+    """
+    
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.entries = {}
+        # 每个输出文件被多少个条目引用；内容相同的原图共用同一组派生图
+        self._references = Counter()
+        self._lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """读取清单；文件不存在、损坏或版本不符时从空清单开始"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get('version') == MANIFEST_VERSION:
+            self.entries = data.get('sources', {})
+            self._references = Counter(path for entry in self.entries.values()
+                                       for path in set(entry.get('outputs', [])))
+    
+    def save(self):
+        """原子写入清单（先写临时文件再替换）"""
+        with self._lock:
+            data = {'version': MANIFEST_VERSION, 'sources': self.entries}
+            write_json_atomic(self.path, data, indent=1)
+    
+    def get(self, source_path):
+        """返回原图的清单条目（可能为None）"""
+        with self._lock:
+            entry = self.entries.get(source_path)
+            return dict(entry) if entry else None
+    
+    def lookup_fresh(self, source_path, recipe, stat):
+        """原图未变化且所有输出都存在时返回缓存条目，否则返回None
+        
+        只比较文件大小和修改时间，不读取原图内容。
+        """
+        entry = self.get(source_path)
+        if entry is None or entry.get('recipe') != recipe:
+            return None
+        if entry.get('size') != stat.st_size or entry.get('mtime_ns') != stat.st_mtime_ns:
+            return None
+        if not all(os.path.exists(path) for path in entry.get('outputs', [])):
+            return None
+        return entry
+    
+    def record(self, source_path, size, mtime_ns, sha256, recipe, thumbnail, renditions, outputs,
+               placeholder=None):
+        """记录一次生成结果，并删除该原图不再使用、也没有被其他条目引用的旧输出文件"""
+        with self._lock:
+            previous = self.entries.get(source_path)
+            self.entries[source_path] = {
+                'size': size,
+                'mtime_ns': mtime_ns,
+                'sha256': sha256,
+                'recipe': recipe,
+                'thumbnail': thumbnail,
+                'renditions': renditions,
+                'outputs': sorted(outputs),
+                'placeholder': placeholder
+            }
+            previous_outputs = set(previous.get('outputs', [])) if previous else set()
+            self._references.update(set(outputs))
+            self._references.subtract(previous_outputs)
+            unreferenced = [path for path in previous_outputs - set(outputs) if self._references[path] <= 0]
+            for path in unreferenced:
+                del self._references[path]
+        for path in unreferenced:
+            remove_file(path)
+    
+    def collect_garbage(self):
+        """清理已删除原图的派生文件
+        
+        原图已被删除的条目移出清单，删除其输出中没有被其他条目引用的文件。
+        只按清单记录的输出删除，不遍历派生图目录（分片目录有数万个子目录）。
+        返回删除的文件数。
+        """
+        removed = 0
+        with self._lock:
+            dead = [src for src in self.entries if not os.path.exists(src)]
+            dead_entries = [self.entries.pop(src) for src in dead]
+            for entry in dead_entries:
+                self._references.subtract(set(entry.get('outputs', [])))
+            unreferenced = {path for entry in dead_entries for path in entry.get('outputs', [])
+                            if self._references[path] <= 0}
+            for path in unreferenced:
+                del self._references[path]
+        
+        for path in unreferenced:
+            removed += remove_file(path)
+        return removed
+
+
+def remove_file(path):
+    """删除文件，文件不存在时忽略；返回实际删除的数量"""
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
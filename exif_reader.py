@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+只读取文件头的EXIF解析器
+按JPEG段结构跳转，只读取APP1（Exif）段，到图像数据（SOS）之前就停止，
+不经过Pillow的格式识别和图像对象，也不接触像素数据。
+返回值与Pillow的 Image._getexif() 相同：{标签ID: 值}，EXIF子IFD合并到顶层，GPS信息放在0x8825下。
+"""
+
+import struct
+
+# EXIF子IFD和GPS IFD的指针标签
+EXIF_IFD_TAG = 0x8769
+GPS_IFD_TAG = 0x8825
+
+# TIFF文件没有段结构，最多读取这么多字节查找IFD
+TIFF_HEADER_BYTES = 256 * 1024
+
+# TIFF数据类型：(struct格式, 每个值的字节数)
+TIFF_TYPES = {
+    1: ('B', 1),   # BYTE
+    2: ('s', 1),   # ASCII
+    3: ('H', 2),   # SHORT
+    4: ('L', 4),   # LONG
+    5: ('LL', 8),  # RATIONAL
+    6: ('b', 1),   # SBYTE
+    7: ('s', 1),   # UNDEFINED
+    8: ('h', 2),   # SSHORT
+    9: ('l', 4),   # SLONG
+    10: ('ll', 8), # SRATIONAL
+    11: ('f', 4),  # FLOAT
+    12: ('d', 8),  # DOUBLE
+    13: ('L', 4)   # IFD
+}
+
+# JPEG中没有长度字段的标记
+JPEG_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+
+def read_exif(path):
+    """读取图片的EXIF，没有EXIF或格式不支持时返回None"""
+    with open(path, 'rb') as f:
+        return read_exif_stream(f)
+
+
+def read_exif_stream(f):
+    """从已打开的文件（或已读入内存的io.BytesIO）解析EXIF，从当前文件开头读取"""
+    head = f.read(12)
+    if head[:2] == b'\xff\xd8':
+        f.seek(2)
+        data = _jpeg_exif_segment(f)
+    elif head[:4] in (b'II*\x00', b'MM\x00*'):
+        f.seek(0)
+        data = f.read(TIFF_HEADER_BYTES)
+    elif head[:8] == b'\x89PNG\r\n\x1a\n':
+        f.seek(8)
+        data = _png_exif_chunk(f)
+    elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        data = _webp_exif_chunk(f)
+    else:
+        return None
+    if not data:
+        return None
+    # 部分软件在PNG/WebP的EXIF块中也保留了JPEG的Exif前缀
+    if data.startswith(b'Exif\x00\x00'):
+        data = data[6:]
+    return parse_tiff(data)
+
+
+def _jpeg_exif_segment(f):
+    """按段跳转到APP1 Exif段，只读取该段内容"""
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        # 标记之间可能有填充的0xFF
+        while code == 0xFF:
+            byte = f.read(1)
+            if not byte:
+                return None
+            code = byte[0]
+        if code in JPEG_STANDALONE_MARKERS:
+            continue
+        if code in (0xDA, 0xD9):
+            # 到达图像数据或文件结尾，没有EXIF
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0] - 2
+        if length < 0:
+            # 段长度至少包含长度字段本身的2字节，更小说明文件损坏；否则会读入整个文件或向回跳转
+            return None
+        if code == 0xE1:
+            segment = f.read(length)
+            if segment.startswith(b'Exif\x00\x00'):
+                return segment[6:]
+            continue
+        f.seek(length, 1)
+
+
+def _png_exif_chunk(f):
+    """在IDAT之前查找eXIf块"""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, kind = struct.unpack('>I4s', header)
+        if kind == b'eXIf':
+            return f.read(length)
+        if kind in (b'IDAT', b'IEND'):
+            return None
+        f.seek(length + 4, 1)
+
+
+def _webp_exif_chunk(f):
+    """在RIFF容器中查找EXIF块"""
+    f.seek(12)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        kind, length = struct.unpack('<4sI', header)
+        if kind == b'EXIF':
+            return f.read(length)
+        f.seek(length + (length & 1), 1)
+
+
+def parse_tiff(data):
+    """解析TIFF结构的EXIF数据，返回与Pillow _getexif()相同结构的字典"""
+    if len(data) < 8 or data[:2] not in (b'II', b'MM'):
+        return None
+    order = '<' if data[:2] == b'II' else '>'
+    offset = struct.unpack(order + 'L', data[4:8])[0]
+
+    result = _read_ifd(data, order, offset)
+    if result is None:
+        return None
+    exif_offset = result.get(EXIF_IFD_TAG)
+    if isinstance(exif_offset, int):
+        result.update(_read_ifd(data, order, exif_offset) or {})
+    gps_offset = result.get(GPS_IFD_TAG)
+    if isinstance(gps_offset, int):
+        result[GPS_IFD_TAG] = _read_ifd(data, order, gps_offset) or {}
+    return result
+
+
+def _read_ifd(data, order, offset):
+    """读取一个IFD中的所有条目；偏移越界时返回None"""
+    if offset <= 0 or offset + 2 > len(data):
+        return None
+    count = struct.unpack(order + 'H', data[offset:offset + 2])[0]
+    entries = {}
+    position = offset + 2
+    for _ in range(count):
+        if position + 12 > len(data):
+            break
+        tag, kind, number = struct.unpack(order + 'HHL', data[position:position + 8])
+        value = _read_value(data, order, kind, number, position + 8)
+        if value is not None:
+            entries[tag] = value
+        position += 12
+    return entries
+
+
+def _read_value(data, order, kind, number, field_offset):
+    """按类型解码条目的值（不超过4字节时直接存放在条目中，否则为偏移）"""
+    if kind not in TIFF_TYPES:
+        return None
+    fmt, size = TIFF_TYPES[kind]
+    total = size * number
+    if total <= 4:
+        start = field_offset
+    else:
+        start = struct.unpack(order + 'L', data[field_offset:field_offset + 4])[0]
+    raw = data[start:start + total]
+    if len(raw) < total:
+        return None
+
+    if kind == 2:
+        # ASCII：去掉结尾的NUL；优先按UTF-8解码，失败时按Latin-1
+        raw = raw[:-1] if raw.endswith(b'\x00') else raw
+        try:
+            return raw.decode('utf-8')
+        except UnicodeDecodeError:
+            return raw.decode('latin-1')
+    if kind in (1, 7):
+        return bytes(raw)
+
+    values = struct.unpack(order + fmt * number, raw)
+    if kind in (5, 10):
+        # 有理数用浮点数表示，str()结果与Pillow的IFDRational一致
+        values = tuple(
+            numerator / denominator if denominator else float('nan')
+            for numerator, denominator in zip(values[::2], values[1::2])
+        )
+    return values[0] if number == 1 else values
@@ -1,199 +1,395 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-EXIF元数据提取脚本
-从图片中提取相机、镜头、光圈、焦距、快门速度等拍摄信息
-运行方式：python extract_exif.py
-"""
-
-import os
-import json
-from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
-
-def extract_exif_data(image_path):
-    """提取图片的EXIF元数据"""
-    try:
-        with Image.open(image_path) as img:
-            exif_data = img._getexif()
-            if exif_data is None:
-                return None
-            
-            exif_info = {}
-            
-            # 常见的EXIF标签映射
-            exif_tags = {
-                'Make': '相机品牌',
-                'Model': '相机型号',
-                'Software': '软件',
-                'DateTime': '拍摄时间',
-                'Artist': '摄影师',
-                'Copyright': '版权信息',
-                'ExifImageWidth': '图片宽度',
-                'ExifImageLength': '图片高度',
-                'Orientation': '方向',
-                'XResolution': 'X分辨率',
-                'YResolution': 'Y分辨率',
-                'ResolutionUnit': '分辨率单位',
-                'YCbCrPositioning': 'YCbCr定位',
-                'ExifOffset': 'EXIF偏移',
-                'ExifVersion': 'EXIF版本',
-                'FlashPixVersion': 'FlashPix版本',
-                'ColorSpace': '色彩空间',
-                'ComponentsConfiguration': '组件配置',
-                'CompressedBitsPerPixel': '压缩位/像素',
-                'PixelXDimension': '像素X尺寸',
-                'PixelYDimension': '像素Y尺寸',
-                'UserComment': '用户注释',
-                'DateTimeOriginal': '原始拍摄时间',
-                'DateTimeDigitized': '数字化时间',
-                'SubsecTime': '子秒时间',
-                'SubsecTimeOriginal': '原始子秒时间',
-                'SubsecTimeDigitized': '数字化子秒时间',
-                'ExposureTime': '曝光时间',
-                'FNumber': '光圈值',
-                'ExposureProgram': '曝光程序',
-                'SpectralSensitivity': '光谱灵敏度',
-                'ISOSpeedRatings': 'ISO感光度',
-                'OECF': '光电转换函数',
-                'ExifVersion': 'EXIF版本',
-                'DateTimeOriginal': '原始拍摄时间',
-                'DateTimeDigitized': '数字化时间',
-                'ComponentsConfiguration': '组件配置',
-                'CompressedBitsPerPixel': '压缩位/像素',
-                'ShutterSpeedValue': '快门速度值',
-                'ApertureValue': '光圈值',
-                'BrightnessValue': '亮度值',
-                'ExposureBiasValue': '曝光偏差值',
-                'MaxApertureValue': '最大光圈值',
-                'SubjectDistance': '主体距离',
-                'MeteringMode': '测光模式',
-                'LightSource': '光源',
-                'Flash': '闪光灯',
-                'FocalLength': '焦距',
-                'SubjectArea': '主体区域',
-                'MakerNote': '制造商注释',
-                'UserComment': '用户注释',
-                'SubsecTime': '子秒时间',
-                'SubsecTimeOriginal': '原始子秒时间',
-                'SubsecTimeDigitized': '数字化子秒时间',
-                'FlashPixVersion': 'FlashPix版本',
-                'ColorSpace': '色彩空间',
-                'PixelXDimension': '像素X尺寸',
-                'PixelYDimension': '像素Y尺寸',
-                'RelatedSoundFile': '相关音频文件',
-                'InteroperabilityIFDPointer': '互操作性IFD指针',
-                'FlashEnergy': '闪光灯能量',
-                'SpatialFrequencyResponse': '空间频率响应',
-                'FocalPlaneXResolution': '焦平面X分辨率',
-                'FocalPlaneYResolution': '焦平面Y分辨率',
-                'FocalPlaneResolutionUnit': '焦平面分辨率单位',
-                'SubjectLocation': '主体位置',
-                'ExposureIndex': '曝光指数',
-                'SensingMethod': '感光方法',
-                'FileSource': '文件源',
-                'SceneType': '场景类型',
-                'CFAPattern': 'CFA模式',
-                'CustomRendered': '自定义渲染',
-                'ExposureMode': '曝光模式',
-                'WhiteBalance': '白平衡',
-                'DigitalZoomRatio': '数字变焦比',
-                'FocalLengthIn35mmFilm': '35mm胶片等效焦距',
-                'SceneCaptureType': '场景捕获类型',
-                'GainControl': '增益控制',
-                'Contrast': '对比度',
-                'Saturation': '饱和度',
-                'Sharpness': '锐度',
-                'DeviceSettingDescription': '设备设置描述',
-                'SubjectDistanceRange': '主体距离范围',
-                'ImageUniqueID': '图片唯一ID',
-                'CameraOwnerName': '相机所有者姓名',
-                'BodySerialNumber': '机身序列号',
-                'LensSpecification': '镜头规格',
-                'LensMake': '镜头品牌',
-                'LensModel': '镜头型号',
-                'LensSerialNumber': '镜头序列号'
-            }
-            
-            # 提取EXIF信息
-            for tag_id, value in exif_data.items():
-                tag_name = TAGS.get(tag_id, tag_id)
-                if tag_name in exif_tags:
-                    exif_info[exif_tags[tag_name]] = str(value)
-            
-            # 处理特殊值
-            if '曝光时间' in exif_info:
-                try:
-                    exposure_time = float(exif_info['曝光时间'])
-                    if exposure_time < 1:
-                        exif_info['曝光时间'] = f"1/{int(1/exposure_time)}秒"
-                    else:
-                        exif_info['曝光时间'] = f"{exposure_time}秒"
-                except:
-                    pass
-            
-            if '光圈值' in exif_info:
-                try:
-                    f_number = float(exif_info['光圈值'])
-                    exif_info['光圈值'] = f"f/{f_number:.1f}"
-                except:
-                    pass
-            
-            if '焦距' in exif_info:
-                try:
-                    focal_length = float(exif_info['焦距'])
-                    exif_info['焦距'] = f"{focal_length}mm"
-                except:
-                    pass
-            
-            if 'ISO感光度' in exif_info:
-                exif_info['ISO感光度'] = f"ISO {exif_info['ISO感光度']}"
-            
-            return exif_info
-            
-    except Exception as e:
-        print(f"提取EXIF数据时出错 {image_path}: {str(e)}")
-        return None
-
-def update_photos_with_exif():
-    """更新photos.json文件，添加EXIF元数据"""
-    try:
-        # 读取现有的photos.json
-        with open('photos.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        photos = data.get('photos', [])
-        updated_count = 0
-        
-        print("🔄 开始提取图片EXIF元数据...")
-        
-        for photo in photos:
-            if 'src' in photo and photo['src'].startswith('data/'):
-                image_path = photo['src']
-                
-                if os.path.exists(image_path):
-                    exif_data = extract_exif_data(image_path)
-                    if exif_data:
-                        # 添加EXIF数据到照片信息中
-                        photo['exif'] = exif_data
-                        updated_count += 1
-                        print(f"✅ 已提取 {image_path} 的EXIF数据")
-                    else:
-                        print(f"⚠️  未找到 {image_path} 的EXIF数据")
-                else:
-                    print(f"❌ 图片文件不存在: {image_path}")
-        
-        # 保存更新后的数据
-        with open('photos.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        print(f"\n🎉 EXIF元数据提取完成！")
-        print(f"✅ 成功更新 {updated_count} 张照片")
-        print(f"📁 数据已保存到: photos.json")
-        print("💡 现在可以刷新网页，查看灯箱中的元数据信息")
-        
-    except Exception as e:
-        print(f"❌ 更新photos.json时出错: {str(e)}")
-
-if __name__ == '__main__':
-    update_photos_with_exif()
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EXIF元数据提取脚本
+从图片中提取相机、镜头、光圈、焦距、快门速度等拍摄信息
+只读取文件头中的EXIF段，多线程并行处理，原图未变化的照片自动跳过
+运行方式：python extract_exif.py [--workers N] [--force]
+"""
+
+import io
+import os
+import re
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from atomic_file import write_json_atomic
+from build_catalog import write_catalog
+from catalog_store import CatalogStore
+from exif_reader import read_exif, read_exif_stream
+
+# 增量提取状态：记录每张原图上次提取时的大小和修改时间
+EXIF_STATE_PATH = 'exif_state.json'
+
+# 默认并行线程数：读取文件头主要是I/O等待，线程数可以多于CPU核心数
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+
+class ExifState:
+    """EXIF增量提取状态
+
+    entries结构：{ 原图路径: {'size': 字节数, 'mtime_ns': 修改时间, 'hasExif': 是否有EXIF} }
+    """
+    
+    def __init__(self, path=EXIF_STATE_PATH):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('sources', {})
+        except (FileNotFoundError, ValueError):
+            pass
+    
+    def is_fresh(self, source_path, stat, has_exif):
+        """原图自上次提取后没有变化，并且photos.json中的结果仍然存在时返回True"""
+        entry = self.entries.get(source_path)
+        if entry is None or entry.get('size') != stat.st_size or entry.get('mtime_ns') != stat.st_mtime_ns:
+            return False
+        # 上次提取到了EXIF但photos.json中已经没有了（例如被管理面板覆盖），需要重新提取
+        return has_exif or not entry.get('hasExif')
+    
+    def record(self, source_path, size, mtime_ns, has_exif):
+        self.entries[source_path] = {
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'hasExif': has_exif
+        }
+    
+    def save(self):
+        """原子写入状态文件"""
+        write_json_atomic(self.path, {'sources': self.entries})
+
+
+def extract_exif_batch(sources, extractor=None, state=None, existing=None, workers=DEFAULT_WORKERS,
+                       progress=None, should_stop=None):
+    """并行提取多张图片的EXIF
+    
+    extractor(path) 返回格式化后的EXIF字典（默认extract_exif_data）。
+    传入state（ExifState）时跳过自上次提取后没有变化的原图；
+    existing为photos.json中已有EXIF的原图路径集合，用于判断上次的结果是否还在。
+    progress(done, total, src, status) 在每张图片完成时调用，status为 extracted / empty / skipped。
+    should_stop() 返回True时不再提交新的图片。
+    返回 (updates, skipped)：updates为 {src: EXIF字典}，skipped为跳过的数量。
+    """
+    extractor = extractor or extract_exif_data
+    existing = existing or set()
+    sources = list(dict.fromkeys(sources))
+    total = len(sources)
+    updates = {}
+    done = 0
+    
+    # 先在当前线程用stat过滤掉未变化的原图，不打开文件
+    pending = []
+    for src in sources:
+        try:
+            stat = os.stat(src)
+        except OSError:
+            continue
+        if state is not None and state.is_fresh(src, stat, src in existing):
+            done += 1
+            if progress:
+                progress(done, total, src, 'skipped')
+            continue
+        pending.append((src, stat))
+    skipped = done
+    
+    def extract(item):
+        src, stat = item
+        if should_stop and should_stop():
+            return src, stat, None, False
+        return src, stat, extractor(src), True
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for src, stat, exif_data, attempted in pool.map(extract, pending):
+            if not attempted:
+                continue
+            if exif_data:
+                updates[src] = exif_data
+            if state is not None:
+                state.record(src, stat.st_size, stat.st_mtime_ns, bool(exif_data))
+            done += 1
+            if progress:
+                progress(done, total, src, 'extracted' if exif_data else 'empty')
+    
+    if state is not None:
+        state.save()
+    return updates, skipped
+
+
+def extract_exif_data(image_path, data=None):
+    """提取图片的EXIF元数据，返回规范化的EXIF字典（见normalize_exif）
+
+    data为已经读入内存的文件内容（生成派生图时一次读取），此时不再打开文件。
+    """
+    try:
+        tags = read_exif_stream(io.BytesIO(data)) if data is not None else read_exif(image_path)
+        return normalize_exif(tags)
+    except Exception as e:
+        print(f"提取EXIF数据时出错 {image_path}: {str(e)}")
+        return None
+
+
+def normalize_exif(tags):
+    """把原始EXIF标签（{标签ID: 值}）转换为固定字段、带类型的字典
+
+    数值字段保存为数字，有理数保存为浮点数，拍摄时间保存为ISO 8601字符串；
+    缺失的字段直接省略。没有任何可用字段时返回None。
+    """
+    if not tags:
+        return None
+    exif = {}
+    for field, (tag_id, convert) in EXIF_TAG_FIELDS.items():
+        value = convert(tags.get(tag_id))
+        if value is not None:
+            exif[field] = value
+    
+    taken_at = exif_datetime(tags.get(TAG_DATETIME_ORIGINAL) or tags.get(TAG_DATETIME_DIGITIZED),
+                             tags.get(TAG_OFFSET_TIME_ORIGINAL))
+    if taken_at:
+        exif['takenAt'] = taken_at
+    
+    gps = gps_coordinates(tags.get(TAG_GPS_INFO))
+    if gps:
+        exif['gps'] = gps
+    return {field: exif[field] for field in EXIF_FIELDS if field in exif} or None
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if not isinstance(value, str):
+        return None
+    value = value.strip().strip('\x00').strip()
+    # 部分机身在没有电子触点的镜头上写入'----'等占位符
+    return value if value.strip('-') else None
+
+
+def _integer(value):
+    if isinstance(value, tuple):
+        value = value[0] if value else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        return None
+    return int(value)
+
+
+def _decimal(value, digits=4):
+    if isinstance(value, tuple):
+        value = value[0] if value else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        return None
+    return round(float(value), digits)
+
+
+def _exposure(value):
+    """曝光时间保留6位有效数字（1/8000秒也不会被舍入为0）"""
+    value = _decimal(value, 12)
+    return float(f'{value:.6g}') if value else None
+
+
+def _aperture(value):
+    """光圈值：APEX值换算为F值"""
+    value = _decimal(value, 6)
+    return round(2 ** (value / 2), 1) if value is not None else None
+
+
+def exif_datetime(value, offset=None):
+    """'2022:10:23 17:15:54' + '+09:00' -> '2022-10-23T17:15:54+09:00'"""
+    value = _text(value)
+    if not value or len(value) < 19 or value.startswith('0000'):
+        return None
+    date, _, clock = value[:19].partition(' ')
+    result = f"{date.replace(':', '-')}T{clock}"
+    offset = _text(offset)
+    if offset and len(offset) == 6 and offset[0] in '+-':
+        result += offset
+    return result
+
+
+def gps_coordinates(gps):
+    """GPS IFD中的度分秒换算为十进制经纬度"""
+    if not isinstance(gps, dict):
+        return None
+    
+    def degrees(values, ref):
+        if not isinstance(values, tuple) or len(values) != 3 or any(v != v for v in values):
+            return None
+        result = values[0] + values[1] / 60 + values[2] / 3600
+        return round(-result if _text(ref) in ('S', 'W') else result, 6)
+    
+    latitude = degrees(gps.get(2), gps.get(1))
+    longitude = degrees(gps.get(4), gps.get(3))
+    if latitude is None or longitude is None:
+        return None
+    result = {'latitude': latitude, 'longitude': longitude}
+    altitude = _decimal(gps.get(6), 1)
+    if altitude is not None:
+        result['altitude'] = -altitude if gps.get(5) in (1, b'\x01') else altitude
+    return result
+
+
+# 规范化EXIF字段：字段名 -> (EXIF标签ID, 转换函数)
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_GPS_INFO = 0x8825
+EXIF_TAG_FIELDS = {
+    'make': (0x010F, _text),
+    'model': (0x0110, _text),
+    'lensMake': (0xA433, _text),
+    'lens': (0xA434, _text),
+    'focalLength': (0x920A, lambda v: _decimal(v, 1)),
+    'focalLength35mm': (0xA405, _integer),
+    'fNumber': (0x829D, lambda v: _decimal(v, 1)),
+    'exposureTime': (0x829A, _exposure),
+    'iso': (0x8827, _integer),
+    'exposureBias': (0x9204, lambda v: _decimal(v, 2)),
+    'exposureProgram': (0x8822, _integer),
+    'meteringMode': (0x9207, _integer),
+    'flash': (0x9209, _integer),
+    'whiteBalance': (0xA403, _integer),
+    'width': (0xA002, _integer),
+    'height': (0xA003, _integer),
+    'orientation': (0x0112, _integer),
+    'software': (0x0131, _text),
+    'artist': (0x013B, _text),
+    'copyright': (0x8298, _text)
+}
+
+# 字段的固定顺序（写入photos.json时按此顺序输出）
+EXIF_FIELDS = (
+    'make', 'model', 'lensMake', 'lens', 'focalLength', 'focalLength35mm', 'fNumber',
+    'exposureTime', 'iso', 'exposureBias', 'exposureProgram', 'meteringMode', 'flash',
+    'whiteBalance', 'takenAt', 'width', 'height', 'orientation', 'software', 'artist',
+    'copyright', 'gps'
+)
+
+
+# 旧版photos.json中的中文显示名 -> 规范化字段
+LEGACY_EXIF_KEYS = {
+    '相机品牌': 'make',
+    '相机型号': 'model',
+    '镜头品牌': 'lensMake',
+    '镜头型号': 'lens',
+    '焦距': 'focalLength',
+    '35mm胶片等效焦距': 'focalLength35mm',
+    '光圈值': 'fNumber',
+    '曝光时间': 'exposureTime',
+    'ISO感光度': 'iso',
+    '曝光偏差值': 'exposureBias',
+    '曝光程序': 'exposureProgram',
+    '测光模式': 'meteringMode',
+    '闪光灯': 'flash',
+    '白平衡': 'whiteBalance',
+    '像素X尺寸': 'width',
+    '像素Y尺寸': 'height',
+    '方向': 'orientation',
+    '软件': 'software',
+    '摄影师': 'artist',
+    '版权信息': 'copyright'
+}
+
+LEGACY_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)?')
+
+
+def is_legacy_exif(exif):
+    """旧版EXIF以中文显示名为键"""
+    return isinstance(exif, dict) and any(key in LEGACY_EXIF_KEYS or key == '原始拍摄时间' for key in exif)
+
+
+def migrate_legacy_exif(legacy):
+    """把旧版字符串EXIF（中文键）转换为规范化字典，不需要读取原图"""
+    tags = {}
+    for key, text in legacy.items():
+        field = LEGACY_EXIF_KEYS.get(key)
+        if field is None:
+            continue
+        tag_id, convert = EXIF_TAG_FIELDS[field]
+        if convert is _text:
+            tags[tag_id] = text
+            continue
+        match = LEGACY_NUMBER_PATTERN.search(str(text))
+        if not match:
+            continue
+        numerator, _, denominator = match.group(0).partition('/')
+        number = float(numerator) / float(denominator) if denominator else float(numerator)
+        if field == 'fNumber' and not str(text).startswith('f/'):
+            # 旧版提取器有时用ApertureValue（APEX值）覆盖了“光圈值”
+            number = _aperture(number)
+        tags[tag_id] = number
+    tags[TAG_DATETIME_ORIGINAL] = legacy.get('原始拍摄时间') or legacy.get('拍摄时间')
+    return normalize_exif(tags)
+
+
+def update_photos_with_exif(workers=DEFAULT_WORKERS, force=False):
+    """更新照片目录，添加EXIF元数据，并重新导出photos.json和catalog/"""
+    store = CatalogStore()
+    try:
+        # 读取照片目录（photos.json在外部被修改过时先重新导入）
+        store.sync_from_json()
+        photos = store.list_photos()
+        
+        print(f"🔄 开始提取图片EXIF元数据（{workers} 个线程）...")
+        
+        sources = []
+        for photo in photos:
+            if 'src' in photo and photo['src'].startswith('data/'):
+                image_path = photo['src']
+                if os.path.exists(image_path):
+                    sources.append(image_path)
+                else:
+                    print(f"❌ 图片文件不存在: {image_path}")
+        
+        def report_progress(done, total, image_path, status):
+            if status == 'extracted':
+                print(f"✅ 已提取 {image_path} 的EXIF数据")
+            elif status == 'empty':
+                print(f"⚠️  未找到 {image_path} 的EXIF数据")
+        
+        # --force时不读取增量状态，所有照片都重新提取
+        state = ExifState()
+        if force:
+            state.entries = {}
+        # 旧版字符串EXIF视为不存在，会被重新提取为规范化格式
+        existing = {photo['src'] for photo in photos
+                    if photo.get('exif') and 'src' in photo and not is_legacy_exif(photo['exif'])}
+        updates, skipped_count = extract_exif_batch(sources, state=state, existing=existing,
+                                                    workers=workers, progress=report_progress)
+        
+        # 添加EXIF数据到照片信息中；原图已不存在的旧版EXIF直接转换格式
+        field_updates = {src: {'exif': exif_data} for src, exif_data in updates.items() if exif_data}
+        migrated_count = 0
+        for photo in photos:
+            src = photo.get('src')
+            if src not in field_updates and is_legacy_exif(photo.get('exif')):
+                field_updates[src] = {'exif': migrate_legacy_exif(photo['exif'])}
+                migrated_count += 1
+        updated_count = len(updates)
+        
+        # 按src合并进照片目录，再导出photos.json和catalog/
+        if field_updates:
+            changed, _ = store.update_by_src(field_updates)
+            if changed:
+                write_catalog(store.export_json())
+        
+        print(f"\n🎉 EXIF元数据提取完成！")
+        print(f"✅ 成功更新 {updated_count} 张照片")
+        if migrated_count:
+            print(f"🔁 转换 {migrated_count} 张照片的旧版EXIF格式（原图不存在）")
+        if skipped_count:
+            print(f"⏭️  跳过 {skipped_count} 张未变化的照片（使用 --force 重新提取全部）")
+        print(f"📁 数据已保存到: photos.json")
+        print("💡 现在可以刷新网页，查看灯箱中的元数据信息")
+        
+    except Exception as e:
+        print(f"❌ 更新photos.json时出错: {str(e)}")
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='提取照片的EXIF元数据并写入photos.json')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'并行线程数（默认{DEFAULT_WORKERS}）')
+    parser.add_argument('--force', action='store_true', help='忽略增量状态，重新提取所有照片')
+    args = parser.parse_args()
+    update_photos_with_exif(workers=max(1, args.workers), force=args.force)
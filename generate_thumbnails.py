@@ -1,117 +1,669 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-缩略图生成脚本
-为现有的照片自动生成缩略图
-运行方式：python generate_thumbnails.py
-"""
-
-import os
-import shutil
-from PIL import Image
-
-def generate_thumbnails():
-    """为data文件夹中的所有图片生成缩略图"""
-    
-    # 检查Pillow库是否可用
-    try:
-        from PIL import Image
-        print("✅ Pillow库已安装")
-    except ImportError:
-        print("❌ 错误：Pillow库未安装")
-        print("💡 请运行：pip install Pillow")
-        return
-    
-    # 检查data文件夹是否存在
-    if not os.path.exists('data'):
-        print("❌ 错误：data文件夹不存在")
-        return
-    
-    # 创建thumbnails文件夹
-    if not os.path.exists('thumbnails'):
-        os.makedirs('thumbnails')
-        print("📁 创建thumbnails文件夹")
-    
-    # 支持的图片格式
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
-    
-    # 获取data文件夹中的所有文件
-    data_files = [f for f in os.listdir('data') if os.path.isfile(os.path.join('data', f))]
-    image_files = [f for f in data_files if any(f.lower().endswith(ext) for ext in image_extensions)]
-    
-    if not image_files:
-        print("❌ 在data文件夹中没有找到图片文件")
-        return
-    
-    print(f"📸 找到 {len(image_files)} 张图片")
-    print("🔄 开始生成缩略图...")
-    
-    success_count = 0
-    error_count = 0
-    
-    for filename in image_files:
-        try:
-            # 构建文件路径
-            source_path = os.path.join('data', filename)
-            thumbnail_path = os.path.join('thumbnails', filename)
-            
-            # 如果缩略图已存在，跳过
-            if os.path.exists(thumbnail_path):
-                print(f"⏭️  跳过 {filename}（缩略图已存在）")
-                continue
-            
-            # 打开图片
-            with Image.open(source_path) as img:
-                # 转换为RGB模式（处理RGBA等格式）
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # 计算缩略图尺寸（保持宽高比）
-                max_width = 400
-                max_height = 300
-                
-                # 获取原始尺寸
-                width, height = img.size
-                
-                # 计算缩放比例
-                ratio = min(max_width / width, max_height / height)
-                
-                # 如果图片已经很小，不需要缩放
-                if ratio >= 1:
-                    # 直接复制原图作为缩略图
-                    shutil.copy2(source_path, thumbnail_path)
-                    print(f"📋 复制 {filename}（原图已足够小）")
-                else:
-                    # 计算新尺寸
-                    new_width = int(width * ratio)
-                    new_height = int(height * ratio)
-                    
-                    # 生成缩略图
-                    thumbnail = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    
-                    # 保存缩略图，优化质量
-                    if filename.lower().endswith('.png'):
-                        # PNG格式保持原格式
-                        thumbnail.save(thumbnail_path, 'PNG', optimize=True)
-                    else:
-                        # 其他格式转换为JPEG
-                        thumbnail.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-                    
-                    print(f"✅ 生成 {filename} 缩略图 ({new_width}x{new_height})")
-                
-                success_count += 1
-                
-        except Exception as e:
-            print(f"❌ 处理 {filename} 时出错：{str(e)}")
-            error_count += 1
-    
-    print("\n" + "="*50)
-    print(f"🎉 缩略图生成完成！")
-    print(f"✅ 成功：{success_count} 张")
-    if error_count > 0:
-        print(f"❌ 失败：{error_count} 张")
-    print(f"📁 缩略图保存在：thumbnails/ 文件夹")
-    print("💡 现在可以刷新网页，浏览页面将使用缩略图，点击查看原图")
-
-if __name__ == '__main__':
-    generate_thumbnails()
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缩略图生成脚本
+为现有的照片自动生成缩略图和多尺寸响应式派生图（JPEG/WebP），使用多进程并行处理
+每张原图只读取一次：同一份内容用于计算哈希、解析EXIF和解码，服务器的上传处理也使用这里的流程
+运行方式：python generate_thumbnails.py [--workers N] [--formats jpeg,webp] [--exif]
+"""
+
+import io
+import os
+import base64
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from build_catalog import write_catalog
+from catalog_store import CatalogStore
+from derivative_cache import (
+    DerivativeManifest, file_digest, recipe_key
+)
+from extract_exif import extract_exif_data, ExifState
+from storage_layout import PathIndex, shard_path, thumbnail_path_for
+
+# 图片处理库
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# 缩略图配置
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_MAX_WIDTH = 400
+THUMBNAIL_MAX_HEIGHT = 300
+
+# 响应式派生图配置：浏览器根据srcset/sizes只下载需要的分辨率
+RENDITION_DIR = 'renditions'
+RENDITION_WIDTHS = (400, 800, 1600, 2560)
+RENDITION_EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'avif': 'avif'}
+RENDITION_SAVE_FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP', 'avif': 'AVIF'}
+RENDITION_SAVE_OPTIONS = {
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+    'webp': {'quality': 80, 'method': 4},
+    'avif': {'quality': 60}
+}
+# 占位信息：最长边PLACEHOLDER_SIZE像素的模糊预览（base64 data URI，约200字节）和主色调，
+# 写入照片目录，前端在任何图片字节到达之前就能按原图比例排版并绘制预览
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_FORMATS = ('webp', 'jpeg')
+PLACEHOLDER_SAVE_OPTIONS = {'webp': {'quality': 30, 'method': 6}, 'jpeg': {'quality': 40}}
+PLACEHOLDER_MIME_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+# 计算主色调时量化的颜色数
+DOMINANT_COLORS = 3
+
+# 生成流程版本：缩放/编码逻辑变化时递增，使缓存清单中的所有派生图失效
+PIPELINE_VERSION = 1
+
+# EXIF方向标签及对应的旋转/翻转操作（派生图替代原图显示，必须校正方向）
+EXIF_ORIENTATION_TAG = 0x0112
+ORIENTATION_TRANSPOSE = {}
+
+# 解码优化：JPEG按DCT缩放解码时保留的分辨率倍数，以及缩放前整数倍缩小的间隔
+DRAFT_OVERSAMPLE = 2
+REDUCING_GAP = 3.0
+
+# 不超过该大小的原图整个读入内存，哈希、EXIF和解码共用一次读取；更大的文件（大TIFF等）仍按路径分别读取
+SINGLE_READ_MAX_BYTES = 64 * 1024 * 1024
+
+# 支持的图片格式
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
+
+# 默认并行进程数：每个CPU核心一个进程
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+if PIL_AVAILABLE:
+    ORIENTATION_TRANSPOSE = {
+        2: Image.Transpose.FLIP_LEFT_RIGHT,
+        3: Image.Transpose.ROTATE_180,
+        4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE,
+        6: Image.Transpose.ROTATE_270,
+        7: Image.Transpose.TRANSVERSE,
+        8: Image.Transpose.ROTATE_90
+    }
+
+
+def supported_rendition_formats(formats):
+    """过滤掉当前Pillow无法编码的格式（WebP/AVIF依赖编译选项）"""
+    if not PIL_AVAILABLE:
+        return ()
+    Image.init()
+    return tuple(fmt for fmt in formats if RENDITION_SAVE_FORMATS.get(fmt) in Image.SAVE)
+
+
+# 默认生成JPEG和WebP；AVIF编码较慢，需要时通过 --formats 开启
+RENDITION_FORMATS = supported_rendition_formats(('jpeg', 'webp'))
+# 模糊预览优先用WebP（同样尺寸比JPEG小一半左右）
+PLACEHOLDER_FORMAT = (supported_rendition_formats(PLACEHOLDER_FORMATS) or ('jpeg',))[0]
+
+
+def read_source(source_path, size=None):
+    """把原图整个读入内存；超过SINGLE_READ_MAX_BYTES时返回None，由调用方按路径处理"""
+    if size is None:
+        size = os.path.getsize(source_path)
+    if size > SINGLE_READ_MAX_BYTES:
+        return None
+    with open(source_path, 'rb') as f:
+        return f.read()
+
+
+def decode_for_sizes(img, sizes):
+    """以尽量低的开销解码图片，保证分辨率足够缩放到sizes中的每个尺寸
+    
+    JPEG在解码阶段就可以按1/2、1/4、1/8在DCT域缩小（draft模式），
+    对24MP原图生成400px缩略图时，绝大部分像素根本不需要解码。
+    draft会保留至少目标尺寸DRAFT_OVERSAMPLE倍的分辨率，
+    之后先整数倍缩小（reduce），最后用LANCZOS重采样到目标尺寸，画质与完整解码基本一致。
+    必须在图片解码（load/convert）之前调用。
+    """
+    if img.format == 'JPEG':
+        max_width = max(width for width, _ in sizes)
+        max_height = max(height for _, height in sizes)
+        img.draft(None, (max_width * DRAFT_OVERSAMPLE, max_height * DRAFT_OVERSAMPLE))
+    
+    # 转换为RGB模式（处理RGBA等格式）
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    return img
+
+
+def resize_image(img, size):
+    """高质量缩放图片，尽量减少解码开销（见decode_for_sizes）"""
+    img = decode_for_sizes(img, [size])
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+
+def make_placeholder(img, display_size, transpose=None):
+    """计算照片的占位信息：显示尺寸、宽高比、主色调和模糊预览
+    
+    img可以是只读取了文件头的图片（此时按最小的draft比例解码），也可以是已经解码的图片；
+    display_size是按EXIF方向校正后的原图尺寸，transpose用于把预览校正为显示方向。
+    返回字典（字段名与照片目录一致）：
+        width, height   原图显示尺寸（像素）
+        aspectRatio     宽高比（宽/高）
+        dominantColor   主色调 #rrggbb
+        lqip            模糊预览 data URI
+    """
+    display_width, display_height = display_size
+    width, height = img.size
+    scale = PLACEHOLDER_SIZE / max(width, height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    
+    small = decode_for_sizes(img, [size])
+    if small.mode not in ('RGB', 'L'):
+        small = small.convert('RGB')
+    small = small.resize(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP).convert('RGB')
+    if transpose is not None:
+        small = small.transpose(transpose)
+    
+    # 主色调：量化为少量颜色后取像素数最多的一种，比平均色更接近观感
+    quantized = small.quantize(colors=DOMINANT_COLORS)
+    _, index = max(quantized.getcolors())
+    red, green, blue = quantized.getpalette()[index * 3:index * 3 + 3]
+    
+    buffer = io.BytesIO()
+    small.save(buffer, RENDITION_SAVE_FORMATS[PLACEHOLDER_FORMAT], **PLACEHOLDER_SAVE_OPTIONS[PLACEHOLDER_FORMAT])
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return {
+        'width': display_width,
+        'height': display_height,
+        'aspectRatio': round(display_width / display_height, 4),
+        'dominantColor': f'#{red:02x}{green:02x}{blue:02x}',
+        'lqip': f'data:{PLACEHOLDER_MIME_TYPES[PLACEHOLDER_FORMAT]};base64,{encoded}'
+    }
+
+
+def rendition_plan(width, height, widths=RENDITION_WIDTHS):
+    """根据原图显示尺寸计算要生成的派生图尺寸列表 [(宽, 高), ...]
+    
+    只缩小不放大；原图比最大档位小且宽度不等于任何档位时，额外保留一份原尺寸的派生图。
+    """
+    targets = [w for w in widths if w <= width]
+    if width < max(widths) and width not in targets:
+        targets.append(width)
+    return [(w, max(1, round(height * w / width))) for w in targets]
+
+
+def rendition_path(width, fmt, content_hash, rendition_dir=RENDITION_DIR):
+    """派生图路径：renditions/ab/cd/<原图sha256>_<宽度>.<扩展名>（URL格式，使用/分隔）
+    
+    与原图使用相同的分片目录；文件名由原图内容哈希决定，原图被修改后派生图自动换名，浏览器可以永久缓存，
+    内容相同的原图共用同一组派生图。
+    """
+    return shard_path(rendition_dir, content_hash, f'_{width}.{RENDITION_EXTENSIONS[fmt]}')
+
+
+def derivative_recipe(thumbnail_dir=THUMBNAIL_DIR, rendition_dir=RENDITION_DIR,
+                      rendition_formats=RENDITION_FORMATS, make_renditions=True):
+    """当前生成参数的指纹，写入缓存清单；参数变化时所有派生图都会重新生成"""
+    return recipe_key({
+        'pipeline': PIPELINE_VERSION,
+        'thumbnail': [thumbnail_dir, THUMBNAIL_MAX_WIDTH, THUMBNAIL_MAX_HEIGHT, 85],
+        'renditions': [rendition_dir, list(RENDITION_WIDTHS),
+                       {fmt: RENDITION_SAVE_OPTIONS[fmt] for fmt in rendition_formats}] if make_renditions else None
+    })
+
+
+def process_image(source_path, thumbnail_dir=THUMBNAIL_DIR, rendition_dir=RENDITION_DIR,
+                  rendition_formats=RENDITION_FORMATS, make_thumbnail=True, make_renditions=True,
+                  skip_existing=True, content_hash=None, source_data=None, with_exif=False):
+    """一次读取、一次解码生成缩略图和所有尺寸/格式的派生图
+    
+    在工作进程中运行，任何异常都会被捕获并写入结果，单张图片失败不影响其他图片。
+    原图内容只读取一次（source_data为调用方已经读入的内容），内容哈希、EXIF（with_exif）和解码都使用同一份数据。
+    先只读取文件头确定需要哪些输出，都已存在时只按最小的draft比例解码出占位信息；
+    否则按最大输出尺寸draft解码一次，再从同一份像素缩放出所有输出和占位信息。
+    返回结果字典：
+        source      原图路径
+        thumbnail   缩略图路径（失败时为None）
+        renditions  派生图列表 [{'width', 'height', 'jpeg', 'webp', ...}]
+        outputs     所有输出文件路径
+        sha256      原图内容哈希（生成派生图时计算）
+        placeholder 占位信息（尺寸、宽高比、主色调、模糊预览，见make_placeholder）
+        exif        规范化的EXIF（with_exif时提取，没有EXIF时为None）
+        exif_extracted  是否已提取EXIF（跳过或失败的图片为False，需要单独提取）
+        status      generated / copied / skipped / error
+        size        缩略图尺寸 (宽, 高)
+        error       错误信息
+    """
+    filename = os.path.basename(source_path)
+    thumbnail_path = thumbnail_path_for(source_path, thumbnail_dir)
+    result = {
+        'source': source_path,
+        'thumbnail': thumbnail_path if make_thumbnail else None,
+        'renditions': [],
+        'outputs': [],
+        'sha256': content_hash,
+        'placeholder': None,
+        'exif': None,
+        'exif_extracted': False,
+        'status': None,
+        'size': None,
+        'error': None
+    }
+    
+    try:
+        data = source_data
+        if data is None and ((make_renditions and content_hash is None) or with_exif):
+            data = read_source(source_path)
+        if make_renditions and content_hash is None:
+            content_hash = hashlib.sha256(data).hexdigest() if data is not None else file_digest(source_path)
+            result['sha256'] = content_hash
+        if with_exif:
+            result['exif'] = extract_exif_data(source_path, data)
+            result['exif_extracted'] = True
+        if make_thumbnail:
+            result['outputs'].append(thumbnail_path)
+        
+        # 打开图片（此时只读取了文件头，尚未解码像素）
+        with Image.open(io.BytesIO(data) if data is not None else source_path) as img:
+            # 获取原始尺寸
+            width, height = img.size
+            
+            # 缩略图：计算缩放比例（保持宽高比）
+            ratio = min(THUMBNAIL_MAX_WIDTH / width, THUMBNAIL_MAX_HEIGHT / height)
+            thumbnail_size = (width, height) if ratio >= 1 else (int(width * ratio), int(height * ratio))
+            result['size'] = thumbnail_size
+            thumbnail_needed = make_thumbnail and not (skip_existing and os.path.exists(thumbnail_path))
+            if thumbnail_needed:
+                # 分片布局的缩略图放在与原图相同的子目录中
+                os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            
+            # 派生图：按EXIF方向校正后的显示尺寸规划，缩放时仍使用原始方向的尺寸
+            orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+            transpose = ORIENTATION_TRANSPOSE.get(orientation)
+            rotated = orientation in (5, 6, 7, 8)
+            display_width, display_height = (height, width) if rotated else (width, height)
+            pending_renditions = []
+            if make_renditions:
+                for target_width, target_height in rendition_plan(display_width, display_height):
+                    entry = {'width': target_width, 'height': target_height}
+                    missing = []
+                    for fmt in rendition_formats:
+                        entry[fmt] = rendition_path(target_width, fmt, content_hash, rendition_dir)
+                        result['outputs'].append(entry[fmt])
+                        if not (skip_existing and os.path.exists(entry[fmt])):
+                            missing.append(fmt)
+                    result['renditions'].append(entry)
+                    if missing:
+                        raw_size = (target_height, target_width) if rotated else (target_width, target_height)
+                        pending_renditions.append((entry, raw_size, missing))
+            
+            # 如果图片已经很小，直接复制原图作为缩略图
+            thumbnail_copy = thumbnail_needed and ratio >= 1
+            if thumbnail_copy:
+                shutil.copy2(source_path, thumbnail_path)
+                thumbnail_needed = False
+            
+            if not thumbnail_needed and not pending_renditions:
+                result['placeholder'] = make_placeholder(img, (display_width, display_height), transpose)
+                result['status'] = 'copied' if thumbnail_copy else 'skipped'
+                return result
+            
+            # 按最大的输出尺寸解码一次
+            targets = [raw_size for _, raw_size, _ in pending_renditions]
+            if thumbnail_needed:
+                targets.append(thumbnail_size)
+            img = decode_for_sizes(img, targets)
+            
+            if thumbnail_needed:
+                thumbnail = img.resize(thumbnail_size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+                # 保存缩略图，优化质量
+                if filename.lower().endswith('.png'):
+                    # PNG格式保持原格式
+                    thumbnail.save(thumbnail_path, 'PNG', optimize=True)
+                else:
+                    # 其他格式转换为JPEG
+                    thumbnail.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
+            
+            if pending_renditions:
+                # 同一张原图的派生图都在同一个分片目录中
+                os.makedirs(os.path.dirname(shard_path(rendition_dir, content_hash, '')), exist_ok=True)
+            for entry, raw_size, missing in pending_renditions:
+                rendition = img.resize(raw_size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+                if transpose is not None:
+                    rendition = rendition.transpose(transpose)
+                for fmt in missing:
+                    rendition.save(entry[fmt], RENDITION_SAVE_FORMATS[fmt], **RENDITION_SAVE_OPTIONS[fmt])
+            
+            # 像素已经解码，占位信息直接从同一份像素缩小（必须在上面的缩放之后，否则会按预览尺寸draft）
+            result['placeholder'] = make_placeholder(img, (display_width, display_height), transpose)
+            
+            result['status'] = 'generated'
+            return result
+    
+    except Exception as e:
+        result['status'] = 'error'
+        result['thumbnail'] = None
+        result['renditions'] = []
+        result['outputs'] = []
+        result['placeholder'] = None
+        result['exif_extracted'] = False
+        result['error'] = str(e)
+        return result
+
+
+def refresh_derivatives(source_path, previous=None, recipe=None, content_hash=None, **options):
+    """增量生成单张图片的派生图（在工作进程中运行）
+    
+    原图大小或修改时间变化后调用：重新计算内容哈希，
+    内容和生成参数都与缓存清单一致时只更新文件状态，否则强制重新生成所有输出。
+    清单条目缺少占位信息（旧版本生成）时保留已有输出，只补算占位信息。
+    content_hash为调用方已知的内容哈希（例如上传时边写边算的SHA-256），此时不再为哈希读取文件；
+    否则原图读入内存一次，哈希和后续的解码共用这份内容。
+    """
+    data = None
+    try:
+        stat = os.stat(source_path)
+        if content_hash is None:
+            data = read_source(source_path, stat.st_size)
+            content_hash = hashlib.sha256(data).hexdigest() if data is not None else file_digest(source_path)
+    except OSError as e:
+        return error_result(source_path, e)
+    
+    unchanged = bool(previous and previous.get('sha256') == content_hash and previous.get('recipe') == recipe
+                     and all(os.path.exists(path) for path in previous.get('outputs', [])))
+    if unchanged and previous.get('placeholder'):
+        result = cached_result(source_path, previous)
+    else:
+        result = process_image(source_path, skip_existing=unchanged, content_hash=content_hash,
+                               source_data=data, **options)
+    result['sha256'] = content_hash
+    result['stat'] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return result
+
+
+def cached_result(source_path, entry):
+    """根据缓存清单条目构造跳过结果"""
+    return {
+        'source': source_path,
+        'thumbnail': entry.get('thumbnail'),
+        'renditions': entry.get('renditions', []),
+        'outputs': entry.get('outputs', []),
+        'sha256': entry.get('sha256'),
+        'placeholder': entry.get('placeholder'),
+        'exif': None,
+        'exif_extracted': False,
+        'status': 'skipped',
+        'size': None,
+        'error': None
+    }
+
+
+def error_result(source_path, error):
+    """构造失败结果"""
+    return {
+        'source': source_path,
+        'thumbnail': None,
+        'renditions': [],
+        'outputs': [],
+        'sha256': None,
+        'placeholder': None,
+        'exif': None,
+        'exif_extracted': False,
+        'status': 'error',
+        'size': None,
+        'error': str(error)
+    }
+
+
+def create_thumbnail(source_path, thumbnail_dir=THUMBNAIL_DIR, skip_existing=True):
+    """只为单张图片生成缩略图（不生成派生图），结果格式同process_image"""
+    return process_image(source_path, thumbnail_dir=thumbnail_dir, make_renditions=False,
+                         skip_existing=skip_existing)
+
+
+def generate_thumbnails_parallel(source_paths, workers=DEFAULT_WORKERS, progress=None,
+                                 thumbnail_dir=THUMBNAIL_DIR, skip_existing=True,
+                                 renditions=True, rendition_formats=RENDITION_FORMATS, manifest=None,
+                                 should_stop=None, exif=False, content_hashes=None):
+    """使用进程池并行生成缩略图和派生图
+    
+    解码、缩放、编码都是CPU密集型操作，分散到多个进程才能用满多核。
+    传入manifest（DerivativeManifest）时按缓存清单增量生成：
+    未变化的原图在当前进程中直接跳过，只有变化的原图才会交给工作进程哈希和解码。
+    exif为True时在同一次读取中提取EXIF（结果的exif/exif_extracted字段）；
+    content_hashes为 {原图路径: 已知的SHA-256}，这些原图不再为计算哈希读取文件。
+    progress(done, total, result) 在每张图片完成时调用（在调用方进程中执行）。
+    should_stop() 返回True时取消尚未开始的图片，已完成的结果仍会写入缓存清单。
+    返回结果列表，顺序与source_paths一致；被取消的图片对应None。
+    """
+    source_paths = list(source_paths)
+    total = len(source_paths)
+    results = [None] * total
+    options = {
+        'thumbnail_dir': thumbnail_dir,
+        'rendition_formats': rendition_formats,
+        'make_renditions': renditions,
+        'with_exif': exif
+    }
+    recipe = derivative_recipe(thumbnail_dir, RENDITION_DIR, rendition_formats, renditions)
+    done = 0
+    
+    if not os.path.exists(thumbnail_dir):
+        os.makedirs(thumbnail_dir)
+    
+    def finish(index, result):
+        nonlocal done
+        if manifest is not None and 'stat' in result and result['status'] != 'error':
+            manifest.record(result['source'], result['stat']['size'], result['stat']['mtime_ns'],
+                            result['sha256'], recipe, result['thumbnail'], result['renditions'],
+                            result['outputs'], result['placeholder'])
+        results[index] = result
+        done += 1
+        if progress:
+            progress(done, total, result)
+    
+    # 找出需要交给工作进程的任务
+    tasks = []
+    for index, source_path in enumerate(source_paths):
+        if manifest is None:
+            tasks.append((index, process_image, (source_path,), dict(options, skip_existing=skip_existing)))
+            continue
+        try:
+            stat = os.stat(source_path)
+        except OSError as e:
+            finish(index, error_result(source_path, e))
+            continue
+        entry = manifest.lookup_fresh(source_path, recipe, stat)
+        if entry is not None and entry.get('placeholder'):
+            finish(index, cached_result(source_path, entry))
+        else:
+            previous = manifest.get(source_path)
+            known_hash = content_hashes.get(source_path) if content_hashes else None
+            tasks.append((index, refresh_derivatives, (source_path, previous, recipe, known_hash), options))
+    
+    # 任务很少或只用一个进程时，直接在当前进程处理，省去启动进程池的开销
+    if workers <= 1 or len(tasks) <= 1:
+        for index, func, args, kwargs in tasks:
+            if should_stop and should_stop():
+                break
+            finish(index, func(*args, **kwargs))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = {
+                pool.submit(func, *args, **kwargs): (index, args[0])
+                for index, func, args, kwargs in tasks
+            }
+            for future in as_completed(futures):
+                index, source_path = futures[future]
+                if future.cancelled():
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 工作进程异常退出（例如内存不足被杀死）
+                    result = error_result(source_path, e)
+                finish(index, result)
+                if should_stop and should_stop():
+                    # 取消排队中的任务，只等待正在处理的几张图片
+                    for pending in futures:
+                        pending.cancel()
+    
+    if manifest is not None:
+        manifest.save()
+    return results
+
+
+def record_results(results):
+    """把缩略图、派生图路径、占位信息和EXIF写入照片目录中对应的照片（按src匹配），并重新导出photos.json和catalog/"""
+    updates = {}
+    for result in results:
+        if result['status'] == 'error':
+            continue
+        fields = {}
+        if result['thumbnail']:
+            fields['thumbnailPath'] = result['thumbnail']
+        if result['renditions']:
+            fields['renditions'] = result['renditions']
+        if result['placeholder']:
+            fields.update(result['placeholder'])
+        if result['exif']:
+            fields['exif'] = result['exif']
+        if fields:
+            updates[result['source'].replace(os.sep, '/')] = fields
+    if not updates:
+        return 0
+
+    store = CatalogStore()
+    try:
+        store.sync_from_json()
+        # 重新运行时跳过的图片字段与目录相同，不改写、不重新导出；只有内容变化的照片才写入
+        changed, _ = store.update_by_src(updates)
+        if changed:
+            write_catalog(store.export_json())
+        return changed
+    finally:
+        store.close()
+
+
+def record_exif_state(results, state):
+    """把生成派生图时一并提取的EXIF记入增量状态（ExifState），之后单独提取EXIF时这些原图直接跳过"""
+    for result in results:
+        if result is not None and result['exif_extracted'] and 'stat' in result:
+            state.record(result['source'], result['stat']['size'], result['stat']['mtime_ns'],
+                         bool(result['exif']))
+    state.save()
+
+
+def print_progress(done, total, result):
+    """命令行进度输出"""
+    filename = os.path.basename(result['source'])
+    prefix = f"[{done}/{total}]"
+    if result['status'] == 'generated':
+        width, height = result['size']
+        print(f"{prefix} ✅ 生成 {filename} 缩略图 ({width}x{height})，派生图 {len(result['renditions'])} 档")
+    elif result['status'] == 'copied':
+        print(f"{prefix} 📋 复制 {filename}（原图已足够小）")
+    elif result['status'] == 'skipped':
+        print(f"{prefix} ⏭️  跳过 {filename}（原图未变化）")
+    else:
+        print(f"{prefix} ❌ 处理 {filename} 时出错：{result['error']}")
+
+
+def list_source_images(data_dir='data', index=None):
+    """data文件夹中的全部原图：路径索引中的分片原图，加上顶层尚未迁移的图片
+
+    只列出data/顶层（迁移后只有分片目录和新复制进来的文件），不遍历分片目录。
+    """
+    sources = [path for path in (index or PathIndex()).sources() if os.path.isfile(path)]
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if (not entry.name.startswith('.') and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+                    and entry.is_file()):
+                sources.append(f'{data_dir}/{entry.name}')
+    return sources
+
+
+def generate_thumbnails(workers=DEFAULT_WORKERS, renditions=True, rendition_formats=RENDITION_FORMATS, exif=False):
+    """为data文件夹中的所有图片生成缩略图和响应式派生图（exif为True时同时提取EXIF）"""
+    
+    # 检查Pillow库是否可用
+    if not PIL_AVAILABLE:
+        print("❌ 错误：Pillow库未安装")
+        print("💡 请运行：pip install Pillow")
+        return
+    print("✅ Pillow库已安装")
+    
+    # 检查data文件夹是否存在
+    if not os.path.exists('data'):
+        print("❌ 错误：data文件夹不存在")
+        return
+    
+    # 创建thumbnails文件夹
+    if not os.path.exists(THUMBNAIL_DIR):
+        os.makedirs(THUMBNAIL_DIR)
+        print("📁 创建thumbnails文件夹")
+    
+    # 获取data文件夹中的所有图片（分片目录中的原图从路径索引读取）
+    source_paths = list_source_images()
+    
+    if not source_paths:
+        print("❌ 在data文件夹中没有找到图片文件")
+        return
+    
+    print(f"📸 找到 {len(source_paths)} 张图片")
+    print(f"🔄 开始生成缩略图（{workers} 个进程）...")
+    if renditions:
+        print(f"🖼️  派生图宽度：{', '.join(map(str, RENDITION_WIDTHS))}，格式：{', '.join(rendition_formats)}")
+    
+    # 缓存清单记录每张原图的内容哈希，只重新生成新增或被修改过的图片
+    manifest = DerivativeManifest()
+    results = generate_thumbnails_parallel(source_paths, workers=workers, progress=print_progress,
+                                           renditions=renditions, rendition_formats=rendition_formats,
+                                           manifest=manifest, exif=exif)
+    if exif:
+        record_exif_state(results, ExifState())
+    
+    # 清理已删除原图的派生文件（按缓存清单记录的输出删除，不遍历派生图目录）
+    removed_count = manifest.collect_garbage()
+    manifest.save()
+    
+    success_count = sum(1 for r in results if r['status'] in ('generated', 'copied'))
+    skipped_count = sum(1 for r in results if r['status'] == 'skipped')
+    error_count = sum(1 for r in results if r['status'] == 'error')
+    recorded_count = record_results(results)
+    
+    print("\n" + "="*50)
+    print(f"🎉 缩略图生成完成！")
+    print(f"✅ 成功：{success_count} 张")
+    if skipped_count > 0:
+        print(f"⏭️  跳过：{skipped_count} 张")
+    if error_count > 0:
+        print(f"❌ 失败：{error_count} 张")
+    if removed_count > 0:
+        print(f"🧹 清理过期派生文件：{removed_count} 个")
+    print(f"📁 缩略图保存在：thumbnails/ 文件夹")
+    if renditions:
+        print(f"📁 派生图保存在：{RENDITION_DIR}/ 文件夹，已更新photos.json中 {recorded_count} 张照片")
+    if exif:
+        extracted_count = sum(1 for r in results if r['exif_extracted'])
+        print(f"🔍 同一次读取中提取EXIF：{extracted_count} 张（未变化而跳过的照片可用 extract_exif.py 补充）")
+    print("💡 现在可以刷新网页，浏览页面将使用缩略图，点击查看原图")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='为data文件夹中的图片生成缩略图和响应式派生图')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'并行进程数（默认等于CPU核心数：{DEFAULT_WORKERS}）')
+    parser.add_argument('--no-renditions', action='store_true', help='只生成缩略图，不生成多尺寸派生图')
+    parser.add_argument('--exif', action='store_true',
+                        help='同时提取EXIF写入photos.json（与派生图共用一次读取，省去单独运行extract_exif.py）')
+    parser.add_argument('--formats', default=','.join(RENDITION_FORMATS),
+                        help='派生图格式，逗号分隔，可选 jpeg,webp,avif（默认%(default)s）')
+    args = parser.parse_args()
+    
+    requested = tuple(fmt.strip().lower() for fmt in args.formats.split(',') if fmt.strip())
+    unknown = [fmt for fmt in requested if fmt not in RENDITION_EXTENSIONS]
+    if unknown:
+        parser.error(f"不支持的格式：{', '.join(unknown)}")
+    formats = supported_rendition_formats(requested)
+    for fmt in requested:
+        if fmt not in formats:
+            print(f"⚠️  当前Pillow不支持编码 {fmt}，已跳过")
+    
+    generate_thumbnails(workers=max(1, args.workers), renditions=not args.no_renditions and bool(formats),
+                        rendition_formats=formats, exif=args.exif)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+存储布局迁移脚本
+把data/顶层平铺保存的原图和对应的缩略图移动到按内容哈希分片的目录：
+    data/<时间戳>_<原文件名>    ->  data/ab/cd/<sha256>.<扩展名>
+    thumbnails/<时间戳>_<原文件名>  ->  thumbnails/ab/cd/<sha256>.<扩展名>
+    renditions/<原文件名>_<哈希前缀>_<宽度>.<扩展名>  ->  renditions/ab/cd/<sha256>_<宽度>.<扩展名>
+文件只是改名（修改时间不变），派生图缓存清单、EXIF增量状态和照片目录中的路径同步改写，迁移后不需要重新生成；
+旧路径记入路径索引（storage.db），服务器仍可以按旧路径返回文件。内容相同的原图只保留一份。
+每张图片移动后立即登记到路径索引，中途中断后重新运行即可继续。
+迁移前请先停止服务器。
+运行方式：
+    python migrate_storage.py [--dry-run]   迁移data/顶层的图片
+    python migrate_storage.py rebuild       路径索引丢失时（例如新克隆的仓库）遍历分片目录重新登记原图
+"""
+
+import os
+import sys
+import argparse
+
+from build_catalog import write_catalog
+from catalog_store import CatalogStore
+from derivative_cache import DerivativeManifest, file_digest, remove_file
+from extract_exif import ExifState
+from generate_thumbnails import IMAGE_EXTENSIONS, RENDITION_EXTENSIONS, rendition_path
+from storage_layout import PathIndex, DATA_DIR, SHARD_LEVELS, shard_path, thumbnail_path_for
+
+
+def loose_images(data_dir=DATA_DIR):
+    """data/顶层尚未迁移的图片 [(路径, 大小, 修改时间)]"""
+    images = []
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if (entry.name.startswith('.') or os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS
+                    or not entry.is_file()):
+                continue
+            stat = entry.stat()
+            images.append((f'{data_dir}/{entry.name}', stat.st_size, stat.st_mtime_ns))
+    return sorted(images)
+
+
+def content_hash(path, size, mtime_ns, manifest):
+    """原图未变化时直接使用缓存清单中的内容哈希，否则重新计算"""
+    entry = manifest.entries.get(path)
+    if entry and entry.get('sha256') and entry.get('size') == size and entry.get('mtime_ns') == mtime_ns:
+        return entry['sha256']
+    return file_digest(path)
+
+
+def move_file(source, target):
+    """移动到分片目录；目标已存在时（内容相同）删除源文件。返回是否实际移动"""
+    if os.path.exists(target):
+        remove_file(source)
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(source, target)
+    return True
+
+
+def rewrite_value(value, aliases):
+    """按路径映射改写路径字段：字符串、列表，以及派生图列表中的{'width', 'jpeg', 'webp', ...}"""
+    if isinstance(value, str):
+        return aliases.get(value, value)
+    if isinstance(value, list):
+        return [rewrite_value(item, aliases) for item in value]
+    if isinstance(value, dict):
+        return {key: rewrite_value(item, aliases) for key, item in value.items()}
+    return value
+
+
+def rewrite_entries(entries, aliases, fields=()):
+    """按路径映射改写以原图路径为键的条目，以及条目中的路径字段；返回改写的条目数"""
+    rewritten = 0
+    for path in list(entries):
+        entry = entries[path]
+        updated = {field: rewrite_value(entry[field], aliases) for field in fields if entry.get(field) is not None}
+        if path not in aliases and all(updated[field] == entry[field] for field in updated):
+            continue
+        entry.update(updated)
+        if path in aliases:
+            entries[aliases[path]] = entries.pop(path)
+        rewritten += 1
+    return rewritten
+
+
+def flat_renditions(manifest):
+    """缓存清单中还在平铺目录里的派生图 {旧路径: 分片路径}"""
+    moves = {}
+    for entry in manifest.entries.values():
+        digest = entry.get('sha256')
+        if not digest:
+            continue
+        for rendition in entry.get('renditions') or []:
+            for fmt in RENDITION_EXTENSIONS:
+                path = rendition.get(fmt)
+                if path:
+                    target = rendition_path(rendition['width'], fmt, digest)
+                    if path != target:
+                        moves[path] = target
+    return moves
+
+
+def rewrite_catalog(aliases):
+    """照片目录中的src、thumbnailPath和派生图路径改为分片路径，并重新导出photos.json和catalog/"""
+    store = CatalogStore()
+    try:
+        store.sync_from_json()
+        updates = {}
+        for photo in store.list_photos():
+            src = photo.get('src')
+            fields = {}
+            if src in aliases:
+                fields['src'] = aliases[src]
+            if photo.get('thumbnailPath') in aliases:
+                fields['thumbnailPath'] = aliases[photo['thumbnailPath']]
+            if photo.get('renditions'):
+                renditions = rewrite_value(photo['renditions'], aliases)
+                if renditions != photo['renditions']:
+                    fields['renditions'] = renditions
+            if fields:
+                updates[src] = fields
+        changed = 0
+        if updates:
+            changed, _ = store.update_by_src(updates)
+            if changed:
+                write_catalog(store.export_json())
+        return changed
+    finally:
+        store.close()
+
+
+def migrate(dry_run=False):
+    if not os.path.isdir(DATA_DIR):
+        print("❌ 错误：data文件夹不存在")
+        return 1
+
+    manifest = DerivativeManifest()
+    index = PathIndex()
+    images = loose_images()
+    print(f"📸 data/顶层有 {len(images)} 张图片需要迁移")
+
+    moved = duplicates = 0
+    for number, (source, size, mtime_ns) in enumerate(images, 1):
+        digest = content_hash(source, size, mtime_ns, manifest)
+        target = shard_path(DATA_DIR, digest, os.path.splitext(source)[1])
+        thumbnail = thumbnail_path_for(source)
+        thumbnail_target = thumbnail_path_for(target)
+        print(f"[{number}/{len(images)}] {source} -> {target}")
+        if dry_run:
+            continue
+        if move_file(source, target):
+            moved += 1
+        else:
+            duplicates += 1
+        if os.path.exists(thumbnail):
+            move_file(thumbnail, thumbnail_target)
+        index.record(sources=[(target, digest, size)],
+                     aliases={source: target, thumbnail.replace(os.sep, '/'): thumbnail_target.replace(os.sep, '/')})
+
+    # 旧版本平铺保存的派生图移到原图哈希对应的分片目录（内容相同的原图共用一份）
+    renditions = flat_renditions(manifest)
+    print(f"🖼️  平铺目录中有 {len(renditions)} 个派生图需要迁移")
+    if dry_run:
+        print("💡 以上为预览，没有移动任何文件")
+        return 0
+    for path, target in renditions.items():
+        if os.path.exists(path):
+            move_file(path, target)
+    index.record(aliases=renditions)
+
+    # 改写所有引用旧路径的地方；使用索引中的全部映射，上次中断时没来得及改写的也一并处理
+    index.load()
+    aliases = index.aliases
+    manifest_count = rewrite_entries(manifest.entries, aliases, ('thumbnail', 'renditions', 'outputs'))
+    if manifest_count:
+        manifest.save()
+    state = ExifState()
+    if rewrite_entries(state.entries, aliases):
+        state.save()
+    photo_count = rewrite_catalog(aliases)
+    index.close()
+
+    print("\n" + "="*50)
+    print(f"🎉 迁移完成！")
+    print(f"📦 移动到分片目录：{moved} 张，派生图 {len(renditions)} 个")
+    if duplicates:
+        print(f"♻️  与已有原图内容相同、只保留一份：{duplicates} 张")
+    print(f"🗂️  改写派生图缓存清单 {manifest_count} 条，照片目录 {photo_count} 张照片")
+    return 0
+
+
+def rebuild():
+    """遍历分片目录，重新登记其中的全部原图（只用于索引丢失时，正常运行不遍历目录）"""
+    index = PathIndex()
+    sources = []
+    for directory, subdirs, files in os.walk(DATA_DIR):
+        depth = os.path.relpath(directory, DATA_DIR).count(os.sep) + 1 if directory != DATA_DIR else 0
+        if depth < SHARD_LEVELS:
+            subdirs.sort()
+            continue
+        subdirs[:] = []
+        for name in sorted(files):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() in IMAGE_EXTENSIONS and shard_path(DATA_DIR, stem, extension) == \
+                    os.path.join(directory, name).replace(os.sep, '/'):
+                sources.append((f"{directory.replace(os.sep, '/')}/{name}", stem,
+                                os.path.getsize(os.path.join(directory, name))))
+    index.record(sources=sources)
+    index.close()
+    print(f"✅ 已登记分片目录中的 {len(sources)} 张原图")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='把data/和thumbnails/迁移为按内容哈希分片的目录布局')
+    parser.add_argument('command', nargs='?', choices=('migrate', 'rebuild'), default='migrate',
+                        help='migrate 迁移顶层的图片（默认），rebuild 遍历分片目录重建路径索引')
+    parser.add_argument('--dry-run', action='store_true', help='只显示迁移计划，不移动文件')
+    args = parser.parse_args(argv)
+    if args.command == 'rebuild':
+        return rebuild()
+    return migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
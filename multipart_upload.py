@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式multipart/form-data解析
+替代已废弃的cgi.FieldStorage：上传文件按块直接写入磁盘，边写边计算SHA-256，
+无论文件多大，每个请求占用的内存都只有一个读取块
+"""
+
+import os
+import re
+import hashlib
+import tempfile
+from email.parser import HeaderParser
+
+# 每次从连接读取的块大小
+READ_CHUNK_SIZE = 256 * 1024
+
+# 默认限制：单个文件、整个请求体、普通表单字段和每个分段头部的最大字节数
+MAX_FILE_BYTES = 200 * 1024 * 1024
+MAX_REQUEST_BYTES = 1024 * 1024 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+
+BOUNDARY_PATTERN = re.compile(r'boundary=(?:"([^"]+)"|([^;\s]+))', re.IGNORECASE)
+
+
+class UploadError(Exception):
+    """上传请求不合法，status为应返回的HTTP状态码"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadedFile:
+    """已写入临时文件的上传文件"""
+
+    __slots__ = ('field_name', 'filename', 'content_type', 'path', 'size', 'sha256')
+
+    def __init__(self, field_name, filename, content_type, path, size, sha256):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def discard(self):
+        """删除临时文件（未被移动到最终位置时）"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def safe_filename(filename):
+    """只保留文件名部分，防止客户端通过../或Windows路径写到上传目录之外"""
+    name = os.path.basename(filename.replace('\\', '/')).strip()
+    return name.lstrip('.') or 'upload'
+
+
+def parse_boundary(content_type):
+    """从Content-Type中取出multipart边界"""
+    if not content_type or not content_type.lower().startswith('multipart/form-data'):
+        raise UploadError(400, '请求必须是multipart/form-data')
+    match = BOUNDARY_PATTERN.search(content_type)
+    if not match:
+        raise UploadError(400, 'multipart请求缺少boundary')
+    return (match.group(1) or match.group(2)).encode('latin-1')
+
+
+class _BodyReader:
+    """按Content-Length读取请求体，不会越过本请求读到下一个请求"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self):
+        if self.remaining <= 0:
+            return b''
+        chunk = self.stream.read(min(READ_CHUNK_SIZE, self.remaining))
+        if not chunk:
+            raise UploadError(400, '请求体不完整，连接已断开')
+        self.remaining -= len(chunk)
+        return chunk
+
+
+def parse_multipart(stream, content_type, content_length, upload_dir,
+                    max_file_bytes=MAX_FILE_BYTES, max_request_bytes=MAX_REQUEST_BYTES):
+    """流式解析multipart请求体
+
+    文件分段写入upload_dir中的临时文件（与最终位置在同一文件系统，之后可以原子重命名），
+    普通字段解码为字符串。
+    返回 (fields, files)：fields为 {字段名: 值}，files为UploadedFile列表。
+    请求不合法或超出限制时删除已写入的临时文件并抛出UploadError。
+    """
+    if content_length is None:
+        raise UploadError(411, '上传请求缺少Content-Length')
+    if content_length > max_request_bytes:
+        raise UploadError(413, f'请求体超过上限 {max_request_bytes // (1024 * 1024)}MB')
+
+    boundary = parse_boundary(content_type)
+    reader = _BodyReader(stream, content_length)
+    # 在开头补上换行，使第一个边界和后续边界可以用同一个分隔符匹配
+    delimiter = b'\r\n--' + boundary
+    keep = len(delimiter) - 1
+    buffer = bytearray(b'\r\n')
+    fields = {}
+    files = []
+
+    def fill():
+        chunk = reader.read()
+        if not chunk:
+            raise UploadError(400, 'multipart请求体格式错误')
+        buffer.extend(chunk)
+
+    def stream_part(sink):
+        """把当前分段内容交给sink，直到遇到下一个边界"""
+        while True:
+            index = buffer.find(delimiter)
+            if index >= 0:
+                if index:
+                    sink(bytes(buffer[:index]))
+                del buffer[:index + len(delimiter)]
+                return
+            # 末尾保留可能是半个边界的字节，其余内容可以安全输出
+            if len(buffer) > keep:
+                sink(bytes(buffer[:-keep]))
+                del buffer[:-keep]
+            fill()
+
+    def read_headers():
+        while True:
+            index = buffer.find(b'\r\n\r\n')
+            if index >= 0:
+                raw = bytes(buffer[:index])
+                del buffer[:index + 4]
+                return HeaderParser().parsestr(raw.decode('utf-8', 'replace'))
+            if len(buffer) > MAX_HEADER_BYTES:
+                raise UploadError(400, 'multipart分段头部过长')
+            fill()
+
+    try:
+        # 跳过第一个边界之前的前导内容
+        stream_part(lambda data: None)
+        while True:
+            while len(buffer) < 2:
+                fill()
+            marker = bytes(buffer[:2])
+            del buffer[:2]
+            if marker == b'--':
+                break
+            if marker != b'\r\n':
+                raise UploadError(400, 'multipart边界格式错误')
+
+            headers = read_headers()
+            name = headers.get_param('name', header='content-disposition')
+            filename = headers.get_filename()
+            if filename is None:
+                # 普通表单字段：内容很小，保存在内存中
+                value = bytearray()
+
+                def collect(data):
+                    value.extend(data)
+                    if len(value) > MAX_FIELD_BYTES:
+                        raise UploadError(413, f'表单字段 {name} 过长')
+
+                stream_part(collect)
+                fields[name] = value.decode('utf-8', 'replace')
+                continue
+
+            # 文件字段：按块写入临时文件并同时计算哈希
+            fd, temp_path = tempfile.mkstemp(prefix='.upload-', suffix='.part', dir=upload_dir)
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                upload = UploadedFile(name, safe_filename(filename), headers.get_content_type(),
+                                      temp_path, 0, None)
+                files.append(upload)
+
+                def write(data):
+                    nonlocal size
+                    size += len(data)
+                    if size > max_file_bytes:
+                        raise UploadError(413, f'文件 {upload.filename} 超过上限 {max_file_bytes // (1024 * 1024)}MB')
+                    digest.update(data)
+                    f.write(data)
+
+                stream_part(write)
+            upload.size = size
+            upload.sha256 = digest.hexdigest()
+
+        # 读完结束边界之后的剩余内容，保持连接可以继续使用
+        while reader.read():
+            pass
+        return fields, files
+
+    except BaseException:
+        for upload in files:
+            upload.discard()
+        raise
@@ -102,6 +102,37 @@ let currentTagFilter = 'all';
 let currentPage = 1;
 const PAGE_SIZE = 12;
 
+// 响应式派生图：声明图片的显示宽度，浏览器据此从srcset中选择合适的分辨率
+const GRID_IMAGE_SIZES = '(max-width: 480px) 100vw, (max-width: 768px) 50vw, 400px';
+const LIGHTBOX_IMAGE_SIZES = '(max-width: 768px) 100vw, 75vw';
+
+// 服务器分页查询接口：可用时浏览器只持有当前页的照片，静态托管时回退到整体加载
+const PHOTOS_API_URL = '/api/photos';
+const SEARCH_API_URL = '/api/search';
+// 输入停顿多久后发起搜索（毫秒）
+const SEARCH_DEBOUNCE_MS = 200;
+let currentSearchQuery = '';
+let searchTimer = null;
+let useServerQuery = false;
+let serverTotal = 0;
+let serverTotalPages = 1;
+let serverTagCounts = {};
+let pageRequestSeq = 0;
+
+// 精简索引和详情分块（由build_catalog.py生成）；已加载的详情分块缓存在内存中
+const CATALOG_DIR = 'catalog';
+const CATALOG_INDEX_URL = `${CATALOG_DIR}/index.json`;
+const detailChunkCache = new Map();
+
+// 检测浏览器是否支持WebP
+const SUPPORTS_WEBP = (() => {
+    try {
+        return document.createElement('canvas').toDataURL('image/webp').startsWith('data:image/webp');
+    } catch (e) {
+        return false;
+    }
+})();
+
 // DOM 元素
 const photoGallery = document.getElementById("photoGallery");
 const lightbox = document.getElementById("lightbox");
@@ -121,20 +152,29 @@ document.addEventListener("DOMContentLoaded", function() {
 function renderPhotos() {
     photoGallery.innerHTML = "";
 
-    // 分页
-    const start = (currentPage - 1) * PAGE_SIZE;
+    // 分页；使用服务器查询时currentPhotos就是当前页
+    const start = useServerQuery ? 0 : (currentPage - 1) * PAGE_SIZE;
     const end = start + PAGE_SIZE;
     const pageItems = currentPhotos.slice(start, end);
+    
+    if (!pageItems.length && currentSearchQuery) {
+        photoGallery.innerHTML = '<div style="text-align:center;color:#6c757d;padding:40px;">没有找到匹配的照片</div>';
+    }
 
     pageItems.forEach((photo, index) => {
         const photoItem = document.createElement("div");
         photoItem.className = "photo-item";
         
-        // 优先使用缩略图，如果没有则使用原图
+        // 优先使用缩略图，如果没有则使用原图；有派生图时由浏览器按显示宽度选择分辨率
         const imageSrc = photo.thumbnail || photo.src;
+        const srcset = buildSrcset(photo);
+        const srcsetAttrs = srcset ? `srcset="${srcset}" sizes="${GRID_IMAGE_SIZES}"` : '';
+        // 原图尺寸让浏览器在缩略图到达前就按比例留出位置，模糊预览和主色调先画在图片背景上
+        const sizeAttrs = photo.width && photo.height ? `width="${photo.width}" height="${photo.height}"` : '';
+        const previewStyle = placeholderStyle(photo);
         
         photoItem.innerHTML = `
-            <img src="${imageSrc}" alt="${photo.title}" loading="lazy" data-original="${photo.src}">
+            <img src="${imageSrc}" ${srcsetAttrs} ${sizeAttrs} ${previewStyle ? `style="${previewStyle}"` : ''} alt="${photo.title}" loading="lazy" data-original="${photo.src}">
             <div class="photo-info">
                 <h3 class="photo-title">${photo.title}</h3>
                 <p class="photo-description">${photo.description}</p>
@@ -142,6 +182,12 @@ function renderPhotos() {
             </div>
         `;
         
+        // 图片加载完成后去掉预览背景（透明PNG不应透出预览）
+        const img = photoItem.querySelector('img');
+        if (previewStyle) {
+            img.addEventListener('load', () => { img.style.background = ''; }, { once: true });
+        }
+        
         const globalIndex = start + index;
         photoItem.addEventListener("click", () => openLightbox(globalIndex));
         photoGallery.appendChild(photoItem);
@@ -157,7 +203,7 @@ function renderPhotos() {
 function renderTagControls() {
     const controls = document.getElementById('tagControls');
     if (!controls) return;
-    const unique = new Set();
+    const unique = new Set(Object.keys(serverTagCounts));
     photos.forEach(p => (Array.isArray(p.tags) ? p.tags : []).forEach(t => unique.add(t)));
     // 清空“全部”之外的内容
     controls.innerHTML = '';
@@ -169,7 +215,7 @@ function renderTagControls() {
 
     // 全部按钮
     const allBtn = document.createElement('button');
-    allBtn.className = 'filter-btn active';
+    allBtn.className = currentTagFilter === 'all' ? 'filter-btn active' : 'filter-btn';
     allBtn.dataset.filter = 'all';
     allBtn.textContent = '全部';
     allBtn.addEventListener('click', () => {
@@ -189,9 +235,10 @@ function renderTagControls() {
         controls.appendChild(sep);
 
         const btn = document.createElement('button');
-        btn.className = 'filter-btn';
+        btn.className = tag === currentTagFilter ? 'filter-btn active' : 'filter-btn';
         btn.dataset.filter = tag;
         btn.textContent = tag;
+        if (serverTagCounts[tag]) btn.title = `${serverTagCounts[tag]} 张照片`;
         btn.addEventListener('click', () => {
             currentTagFilter = tag;
             currentPage = 1;
@@ -247,34 +294,168 @@ function setupEventListeners() {
     document.addEventListener("keydown", handleKeyboard);
 }
 
-// 从静态 JSON 拉取照片（兼容 {photos: []} 或直接数组）
-async function fetchPhotosFromJson() {
-    try {
-        const jsonPath = (window.PHOTOS_JSON_URL || 'photos.json') + '?v=' + Date.now();
-        const res = await fetch(jsonPath, { cache: 'no-store' });
-        if (!res.ok) throw new Error('HTTP ' + res.status);
-        const payload = await res.json();
-        const list = Array.isArray(payload) ? payload : (Array.isArray(payload.photos) ? payload.photos : []);
-        // 兼容旧结构：无 tags 则尝试用 category 映射
-        const normalized = list.map(p => {
-            if (!Array.isArray(p.tags)) {
-                const t = (p.category && typeof p.category === 'string') ? [p.category] : [];
-                return { ...p, tags: t };
+// 拉取照片列表：优先使用精简索引（catalog/index.json），不存在时回退到完整的photos.json
+async function loadPhotoList() {
+    // 使用协商缓存：未修改时服务器返回304，不再重复下载
+    if (!window.PHOTOS_JSON_URL) {
+        try {
+            const res = await fetch(CATALOG_INDEX_URL, { cache: 'no-cache' });
+            if (res.ok) {
+                const index = await res.json();
+                if (Array.isArray(index.photos)) return index.photos;
             }
-            return p;
-        });
-        
-        // 为每张照片添加缩略图路径（如果存在）
-        const withThumbnails = normalized.map(p => {
-            // 如果原图在data文件夹中，尝试生成对应的缩略图路径
-            if (p.src && p.src.startsWith('data/')) {
-                const thumbnailPath = p.src.replace('data/', 'thumbnails/');
-                return { ...p, thumbnail: thumbnailPath };
+        } catch (e) {
+            console.warn('加载照片索引失败，改用 photos.json', e);
+        }
+    }
+    const jsonPath = window.PHOTOS_JSON_URL || 'photos.json';
+    const res = await fetch(jsonPath, { cache: 'no-cache' });
+    if (!res.ok) throw new Error('HTTP ' + res.status);
+    const payload = await res.json();
+    return Array.isArray(payload) ? payload : (Array.isArray(payload.photos) ? payload.photos : []);
+}
+
+// 按需加载照片详情（EXIF等），同一分块只请求一次
+function loadPhotoDetail(photo) {
+    if (typeof photo.detail !== 'number') return Promise.resolve(photo);
+    const url = `${CATALOG_DIR}/details-${photo.detail}.json`;
+    if (!detailChunkCache.has(url)) {
+        const request = fetch(url, { cache: 'no-cache' })
+            .then(res => {
+                if (!res.ok) throw new Error('HTTP ' + res.status);
+                return res.json();
+            })
+            .catch(e => {
+                // 失败的请求不缓存，下次打开灯箱时重试
+                detailChunkCache.delete(url);
+                throw e;
+            });
+        detailChunkCache.set(url, request);
+    }
+    return detailChunkCache.get(url).then(chunk => {
+        Object.assign(photo, (chunk.photos || {})[photo.src] || {});
+        delete photo.detail;
+        return photo;
+    });
+}
+
+// 在灯箱信息面板中显示EXIF；详情尚未加载时先隐藏，加载完成后若仍是当前照片再显示
+function showPhotoExif(photo) {
+    const exifSection = document.getElementById('exifSection');
+    const exifGrid = document.getElementById('exifGrid');
+    const render = () => {
+        if (photo.exif && Object.keys(photo.exif).length > 0) {
+            displayExifData(photo.exif, exifGrid);
+            if (exifSection) exifSection.style.display = 'block';
+        } else {
+            if (exifSection) exifSection.style.display = 'none';
+        }
+    };
+    
+    if (typeof photo.detail !== 'number') {
+        render();
+        return;
+    }
+    if (exifSection) exifSection.style.display = 'none';
+    loadPhotoDetail(photo)
+        .then(() => {
+            if (currentPhotos[currentPhotoIndex] === photo && lightbox.classList.contains('show')) render();
+        })
+        .catch(e => console.warn('加载照片详情失败', e));
+}
+
+// 兼容旧结构并补充缩略图路径
+function normalizePhotos(list) {
+    // 兼容旧结构：无 tags 则尝试用 category 映射
+    const normalized = list.map(p => {
+        if (!Array.isArray(p.tags)) {
+            const t = (p.category && typeof p.category === 'string') ? [p.category] : [];
+            return { ...p, tags: t };
+        }
+        return p;
+    });
+    
+    // 为每张照片添加缩略图路径（如果存在）
+    return normalized.map(p => {
+        // 如果原图在data文件夹中，尝试生成对应的缩略图路径
+        if (p.src && p.src.startsWith('data/')) {
+            const thumbnailPath = p.src.replace('data/', 'thumbnails/');
+            return { ...p, thumbnail: thumbnailPath };
+        }
+        return p;
+    });
+}
+
+// 从服务器查询一页照片；返回false表示服务器不支持（静态托管），改为整体加载
+async function loadServerPage(page, tag = currentTagFilter) {
+    const params = new URLSearchParams({ page: String(page), size: String(PAGE_SIZE) });
+    if (tag !== 'all') params.set('tag', tag);
+    // 有搜索词时在当前标签内搜索
+    if (currentSearchQuery) params.set('q', currentSearchQuery);
+    const url = currentSearchQuery ? SEARCH_API_URL : PHOTOS_API_URL;
+    const seq = ++pageRequestSeq;
+    const res = await fetch(`${url}?${params}`, { cache: 'no-store' });
+    if (!res.ok) return false;
+    const result = await res.json();
+    if (!Array.isArray(result.photos)) return false;
+    // 快速连续切换标签或页码时，只显示最后一次请求的结果
+    if (seq !== pageRequestSeq) return true;
+    
+    useServerQuery = true;
+    currentTagFilter = tag;
+    currentPage = result.page;
+    currentPhotos = normalizePhotos(result.photos);
+    serverTotal = result.total;
+    serverTotalPages = result.totalPages;
+    // 搜索结果不带标签计数，保留之前的
+    if (result.tags) serverTagCounts = result.tags;
+    renderPhotos();
+    return true;
+}
+
+// 搜索框：输入停顿后向服务器搜索，清空后恢复标签筛选结果
+function setupSearch() {
+    const container = document.getElementById('gallerySearch');
+    const input = document.getElementById('searchInput');
+    if (!container || !input) return;
+    container.hidden = false;
+    input.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            const query = input.value.trim();
+            if (query === currentSearchQuery) return;
+            currentSearchQuery = query;
+            loadServerPage(1).catch(e => console.warn('搜索失败', e));
+        }, SEARCH_DEBOUNCE_MS);
+    });
+}
+
+// 翻页：服务器查询模式下请求对应的一页，否则在本地切片
+function goToPage(page) {
+    if (!useServerQuery) {
+        currentPage = page;
+        renderPhotos();
+        return Promise.resolve();
+    }
+    return loadServerPage(page).catch(e => console.warn('加载照片失败', e));
+}
+
+// 拉取照片：优先使用服务器分页查询，不可用时从静态 JSON 加载（兼容 {photos: []} 或直接数组）
+async function fetchPhotosFromJson() {
+    if (!window.PHOTOS_JSON_URL) {
+        try {
+            if (await loadServerPage(1)) {
+                renderTagControls();
+                setupSearch();
+                return;
             }
-            return p;
-        });
-        
-        photos.splice(0, photos.length, ...withThumbnails);
+        } catch (e) {
+            // 静态托管没有查询接口
+        }
+    }
+    try {
+        const list = await loadPhotoList();
+        photos.splice(0, photos.length, ...normalizePhotos(list));
         currentPhotos = [...photos];
         renderPhotos();
         renderTagControls();
@@ -286,6 +467,10 @@ async function fetchPhotosFromJson() {
 
 // 过滤照片（按标签）
 function filterPhotosByTag(tag) {
+    if (useServerQuery) {
+        loadServerPage(1, tag).catch(e => console.warn('加载照片失败', e));
+        return;
+    }
     if (tag === 'all') {
         currentPhotos = [...photos];
     } else {
@@ -298,7 +483,7 @@ function filterPhotosByTag(tag) {
 function renderPagination() {
     if (!pagination) return;
     pagination.innerHTML = '';
-    const total = currentPhotos.length;
+    const total = useServerQuery ? serverTotal : currentPhotos.length;
     const totalPages = Math.max(1, Math.ceil(total / PAGE_SIZE));
     if (totalPages <= 1) return;
 
@@ -307,8 +492,7 @@ function renderPagination() {
     prev.disabled = currentPage === 1;
     prev.addEventListener('click', () => {
         if (currentPage > 1) {
-            currentPage -= 1;
-            renderPhotos();
+            goToPage(currentPage - 1);
         }
     });
     pagination.appendChild(prev);
@@ -317,7 +501,7 @@ function renderPagination() {
         const b = document.createElement('button');
         b.textContent = String(p);
         if (p === currentPage) b.classList.add('active');
-        b.addEventListener('click', () => { currentPage = p; renderPhotos(); });
+        b.addEventListener('click', () => goToPage(p));
         return b;
     };
     const addEllipsis = () => {
@@ -352,216 +536,230 @@ function renderPagination() {
     next.disabled = currentPage === totalPages;
     next.addEventListener('click', () => {
         if (currentPage < totalPages) {
-            currentPage += 1;
-            renderPhotos();
+            goToPage(currentPage + 1);
         }
     });
     pagination.appendChild(next);
 }
 
-// 打开灯箱
-function openLightbox(index) {
+// 照片入库时生成的占位预览（模糊小图和主色调），没有时返回空字符串
+function placeholderStyle(photo) {
+    const layers = [];
+    if (photo.lqip) layers.push(`url('${photo.lqip}') center / cover no-repeat`);
+    if (photo.dominantColor) layers.push(photo.dominantColor);
+    return layers.length ? `background: ${layers.join(', ')};` : '';
+}
+
+// 灯箱占位符：有占位预览时按原图比例显示模糊小图，原图下载期间先看到画面轮廓
+function showImagePlaceholder(placeholder, photo) {
+    const hasPreview = Boolean(photo.lqip);
+    placeholder.classList.toggle('has-preview', hasPreview);
+    placeholder.style.background = hasPreview ? `url('${photo.lqip}') center / contain no-repeat` : (photo.dominantColor || '');
+    placeholder.style.display = 'flex';
+}
+
+// 根据派生图列表生成srcset（优先WebP，没有派生图时返回空字符串）
+function buildSrcset(photo) {
+    const renditions = Array.isArray(photo.renditions) ? photo.renditions : [];
+    if (!renditions.length) return '';
+    const format = (SUPPORTS_WEBP && renditions.every(r => r.webp)) ? 'webp' : 'jpeg';
+    return renditions
+        .filter(r => r[format])
+        .map(r => `${r[format]} ${r.width}w`)
+        .join(', ');
+}
+
+// 设置图片地址：有派生图时使用srcset/sizes，原图作为兜底
+function setResponsiveSource(img, photo, sizes) {
+    const srcset = buildSrcset(photo);
+    if (srcset) {
+        // 先设置sizes再设置srcset，避免浏览器按默认尺寸多下载一次
+        img.sizes = sizes;
+        img.srcset = srcset;
+    } else {
+        img.removeAttribute('srcset');
+        img.removeAttribute('sizes');
+    }
+    img.src = photo.src;
+}
+
+// 灯箱图片调度：当前照片加载并解码完成后再显示，随后按翻页方向预取并解码相邻的照片，
+// 翻到已预取的照片时直接显示；缓存有上限，按最近使用淘汰，翻页后不再需要的加载会被取消
+const LIGHTBOX_PREFETCH_AHEAD = 2;
+const LIGHTBOX_PREFETCH_BEHIND = 1;
+const LIGHTBOX_CACHE_SIZE = 6;
+const lightboxImageCache = new Map();
+let lightboxLoadSeq = 0;
+
+// 释放图片：清空地址会中止尚未完成的下载
+function releaseLightboxImage(entry) {
+    entry.img.removeAttribute('srcset');
+    entry.img.removeAttribute('src');
+}
+
+// 加载并解码照片，同一张照片只加载一次；返回的Promise在可以直接显示时完成
+function loadLightboxImage(photo, priority) {
+    let entry = lightboxImageCache.get(photo.src);
+    if (entry) {
+        // 移到最近使用的位置
+        lightboxImageCache.delete(photo.src);
+        lightboxImageCache.set(photo.src, entry);
+        return entry.promise;
+    }
+    const img = new Image();
+    img.fetchPriority = priority;
+    entry = { img, ready: false };
+    entry.promise = new Promise((resolve, reject) => {
+        img.onload = resolve;
+        img.onerror = reject;
+    })
+        // 解码失败不影响显示，浏览器会在绘制时再解码
+        .then(() => img.decode ? img.decode().catch(() => {}) : undefined)
+        .then(() => { entry.ready = true; }, (error) => {
+            // 失败的照片不缓存，下次翻到时重新加载
+            if (lightboxImageCache.get(photo.src) === entry) lightboxImageCache.delete(photo.src);
+            throw error;
+        });
+    lightboxImageCache.set(photo.src, entry);
+    setResponsiveSource(img, photo, LIGHTBOX_IMAGE_SIZES);
+    
+    // 超出容量时淘汰最久未使用的照片
+    for (const [src, oldest] of lightboxImageCache) {
+        if (lightboxImageCache.size <= LIGHTBOX_CACHE_SIZE) break;
+        lightboxImageCache.delete(src);
+        releaseLightboxImage(oldest);
+    }
+    return entry.promise;
+}
+
+// 当前照片前后需要预取的照片，翻页方向上多取几张；服务器分页时不跨页循环
+function lightboxNeighbors(index, direction) {
+    const count = currentPhotos.length;
+    const wrap = !(useServerQuery && serverTotalPages > 1);
+    const neighbors = [];
+    // 翻页方向上的照片排在前面，先开始加载
+    const offsets = [];
+    for (let i = 1; i <= LIGHTBOX_PREFETCH_AHEAD; i++) offsets.push(i * direction);
+    for (let i = 1; i <= LIGHTBOX_PREFETCH_BEHIND; i++) offsets.push(-i * direction);
+    for (const offset of offsets) {
+        let target = index + offset;
+        if (wrap) target = (target % count + count) % count;
+        if (target < 0 || target >= count || target === index) continue;
+        const photo = currentPhotos[target];
+        if (photo && photo.src && !neighbors.includes(photo)) neighbors.push(photo);
+    }
+    return neighbors;
+}
+
+// 取消不再需要的加载（用户连续翻页时跳过的照片），已经加载完成的照片保留在缓存中
+function cancelStaleLightboxLoads(wanted) {
+    const keep = new Set(wanted.map(photo => photo.src));
+    for (const [src, entry] of lightboxImageCache) {
+        if (!entry.ready && !keep.has(src)) {
+            lightboxImageCache.delete(src);
+            releaseLightboxImage(entry);
+        }
+    }
+}
+
+// 在灯箱中显示第index张照片，direction为翻页方向（1向后，-1向前）
+function showLightboxPhoto(index, direction = 1) {
     currentPhotoIndex = index;
     const photo = currentPhotos[index];
-    
-    // 先显示灯箱，立即显示UI布局
-    lightbox.classList.add("show");
-    document.body.style.overflow = "hidden";
-    
-    // 重置图片加载状态
-    lightboxImage.classList.remove('loaded');
-    
-    // 显示占位符
-    const placeholder = document.getElementById('imagePlaceholder');
-    if (placeholder) {
-        placeholder.style.display = 'flex';
-    }
+    const seq = ++lightboxLoadSeq;
     
     // 设置图片信息
     const t = document.getElementById('infoTitle');
     const d = document.getElementById('infoDesc');
     const tg = document.getElementById('infoTags');
-    const exifSection = document.getElementById('exifSection');
-    const exifGrid = document.getElementById('exifGrid');
     
     if (t) t.textContent = photo.title || '';
     if (d) d.textContent = photo.description || '';
     if (tg) tg.innerHTML = Array.isArray(photo.tags) ? photo.tags.map(x => `<span class=\"tag\">${x}</span>`).join('') : '';
     
-    // 显示EXIF元数据
-    if (photo.exif && Object.keys(photo.exif).length > 0) {
-        displayExifData(photo.exif, exifGrid);
-        if (exifSection) exifSection.style.display = 'block';
-    } else {
-        if (exifSection) exifSection.style.display = 'none';
+    // 显示EXIF元数据（使用精简索引时按需加载）
+    showPhotoExif(photo);
+    
+    const neighbors = lightboxNeighbors(index, direction);
+    cancelStaleLightboxLoads([photo, ...neighbors]);
+    
+    // 已预取的照片直接显示，否则先显示占位符
+    const cached = lightboxImageCache.get(photo.src);
+    const placeholder = document.getElementById('imagePlaceholder');
+    lightboxImage.classList.remove('loaded');
+    if (placeholder && !(cached && cached.ready)) {
+        showImagePlaceholder(placeholder, photo);
     }
     
-    // 预加载图片
-    const img = new Image();
-    img.onload = function() {
-        // 图片加载完成后，设置src并显示
-        lightboxImage.src = photo.src;
+    loadLightboxImage(photo, 'high').then(() => {
+        // 等待期间已经翻到其他照片
+        if (seq !== lightboxLoadSeq) return;
+        setResponsiveSource(lightboxImage, photo, LIGHTBOX_IMAGE_SIZES);
         lightboxImage.alt = photo.title;
-        
-        // 隐藏占位符
-        const placeholder = document.getElementById('imagePlaceholder');
         if (placeholder) {
             placeholder.style.display = 'none';
         }
-        
         // 添加淡入效果
-        setTimeout(() => {
-            lightboxImage.classList.add('loaded');
-        }, 100);
-    };
-    
-    img.onerror = function() {
+        requestAnimationFrame(() => lightboxImage.classList.add('loaded'));
+    }, () => {
+        if (seq !== lightboxLoadSeq) return;
         // 图片加载失败时，显示错误信息
+        lightboxImage.removeAttribute('srcset');
         lightboxImage.src = '';
         lightboxImage.alt = '图片加载失败';
         lightboxImage.classList.add('loaded');
-        
-        // 隐藏占位符
-        const placeholder = document.getElementById('imagePlaceholder');
         if (placeholder) {
             placeholder.style.display = 'none';
         }
-    };
-    
-    // 开始加载图片
-    img.src = photo.src;
+    }).then(() => {
+        // 当前照片显示后再预取相邻照片，不与当前照片争抢带宽
+        if (seq !== lightboxLoadSeq || !lightbox.classList.contains('show')) return;
+        neighbors.forEach(neighbor => loadLightboxImage(neighbor, 'low').catch(() => {}));
+    });
+}
+
+// 打开灯箱
+function openLightbox(index, direction = 1) {
+    // 先显示灯箱，立即显示UI布局
+    lightbox.classList.add("show");
+    document.body.style.overflow = "hidden";
+    showLightboxPhoto(index, direction);
 }
 
 // 关闭灯箱
 function closeLightboxHandler() {
     lightbox.classList.remove("show");
     document.body.style.overflow = "";
+    // 停止预取，已加载的照片保留，再次打开时直接显示
+    lightboxLoadSeq++;
+    cancelStaleLightboxLoads([]);
+}
+
+// 服务器查询模式下灯箱翻过当前页的首尾时，加载相邻的一页（首尾循环）再继续显示
+function turnLightboxPage(delta) {
+    const page = ((currentPage - 1 + delta + serverTotalPages) % serverTotalPages) + 1;
+    goToPage(page).then(() => {
+        if (!currentPhotos.length || !lightbox.classList.contains('show')) return;
+        openLightbox(delta > 0 ? 0 : currentPhotos.length - 1, delta);
+    });
 }
 
 // 显示上一张
 function showPrevPhoto() {
-    currentPhotoIndex = (currentPhotoIndex - 1 + currentPhotos.length) % currentPhotos.length;
-    const photo = currentPhotos[currentPhotoIndex];
-    
-    // 重置图片加载状态
-    lightboxImage.classList.remove('loaded');
-    
-    // 设置图片信息
-    const t = document.getElementById('infoTitle');
-    const d = document.getElementById('infoDesc');
-    const tg = document.getElementById('infoTags');
-    const exifSection = document.getElementById('exifSection');
-    const exifGrid = document.getElementById('exifGrid');
-    
-    if (t) t.textContent = photo.title || '';
-    if (d) d.textContent = photo.description || '';
-    if (tg) tg.innerHTML = Array.isArray(photo.tags) ? photo.tags.map(x => `<span class=\"tag\">${x}</span>`).join('') : '';
-    
-    // 显示EXIF元数据
-    if (photo.exif && Object.keys(photo.exif).length > 0) {
-        displayExifData(photo.exif, exifGrid);
-        if (exifSection) exifSection.style.display = 'block';
-    } else {
-        if (exifSection) exifSection.style.display = 'none';
-    }
-    
-    // 显示占位符
-    const placeholder = document.getElementById('imagePlaceholder');
-    if (placeholder) {
-        placeholder.style.display = 'flex';
+    if (useServerQuery && serverTotalPages > 1 && currentPhotoIndex === 0) {
+        turnLightboxPage(-1);
+        return;
     }
-    
-    // 预加载图片
-    const img = new Image();
-    img.onload = function() {
-        lightboxImage.src = photo.src;
-        lightboxImage.alt = photo.title;
-        
-        // 隐藏占位符
-        if (placeholder) {
-            placeholder.style.display = 'none';
-        }
-        
-        setTimeout(() => {
-            lightboxImage.classList.add('loaded');
-        }, 100);
-    };
-    
-    img.onerror = function() {
-        lightboxImage.src = '';
-        lightboxImage.alt = '图片加载失败';
-        lightboxImage.classList.add('loaded');
-        
-        // 隐藏占位符
-        if (placeholder) {
-            placeholder.style.display = 'none';
-        }
-    };
-    
-    img.src = photo.src;
+    showLightboxPhoto((currentPhotoIndex - 1 + currentPhotos.length) % currentPhotos.length, -1);
 }
 
 // 显示下一张
 function showNextPhoto() {
-    currentPhotoIndex = (currentPhotoIndex + 1) % currentPhotos.length;
-    const photo = currentPhotos[currentPhotoIndex];
-    
-    // 重置图片加载状态
-    lightboxImage.classList.remove('loaded');
-    
-    // 设置图片信息
-    const t = document.getElementById('infoTitle');
-    const d = document.getElementById('infoDesc');
-    const tg = document.getElementById('infoTags');
-    const exifSection = document.getElementById('exifSection');
-    const exifGrid = document.getElementById('exifGrid');
-    
-    if (t) t.textContent = photo.title || '';
-    if (d) d.textContent = photo.description || '';
-    if (tg) tg.innerHTML = Array.isArray(photo.tags) ? photo.tags.map(x => `<span class=\"tag\">${x}</span>`).join('') : '';
-    
-    // 显示EXIF元数据
-    if (photo.exif && Object.keys(photo.exif).length > 0) {
-        displayExifData(photo.exif, exifGrid);
-        if (exifSection) exifSection.style.display = 'block';
-    } else {
-        if (exifSection) exifSection.style.display = 'none';
+    if (useServerQuery && serverTotalPages > 1 && currentPhotoIndex === currentPhotos.length - 1) {
+        turnLightboxPage(1);
+        return;
     }
-    
-    // 显示占位符
-    const placeholder = document.getElementById('imagePlaceholder');
-    if (placeholder) {
-        placeholder.style.display = 'flex';
-    }
-    
-    // 预加载图片
-    const img = new Image();
-    img.onload = function() {
-        lightboxImage.src = photo.src;
-        lightboxImage.alt = photo.title;
-        
-        // 隐藏占位符
-        if (placeholder) {
-            placeholder.style.display = 'none';
-        }
-        
-        setTimeout(() => {
-            lightboxImage.classList.add('loaded');
-        }, 100);
-    };
-    
-    img.onerror = function() {
-        lightboxImage.src = '';
-        lightboxImage.alt = '图片加载失败';
-        lightboxImage.classList.add('loaded');
-        
-        // 隐藏占位符
-        if (placeholder) {
-            placeholder.style.display = 'none';
-        }
-    };
-    
-    img.src = photo.src;
+    showLightboxPhoto((currentPhotoIndex + 1) % currentPhotos.length, 1);
 }
 
 // 键盘事件
@@ -581,41 +779,73 @@ function handleKeyboard(e) {
     }
 }
 
+// EXIF显示字段：photos.json中保存带类型的规范化字段，显示时才转换为中文标签和单位
+const EXIF_DISPLAY_FIELDS = [
+    { key: 'make', label: '相机品牌' },
+    { key: 'model', label: '相机型号' },
+    { key: 'lens', label: '镜头型号' },
+    { key: 'focalLength', label: '焦距', format: value => `${value}mm` },
+    { key: 'fNumber', label: '光圈值', format: value => `f/${value}` },
+    { key: 'exposureTime', label: '快门速度', format: formatExposureTime },
+    { key: 'iso', label: 'ISO感光度', format: value => `ISO ${value}` },
+    { key: 'takenAt', label: '拍摄时间', format: formatTakenAt }
+];
+
+// 旧版photos.json中以中文显示名保存的字段
+const LEGACY_EXIF_FIELDS = [
+    { key: '相机品牌', alias: '相机品牌' },
+    { key: '相机型号', alias: '相机型号' },
+    { key: '镜头型号', alias: '镜头型号' },
+    { key: '焦距', alias: '焦距' },
+    { key: '光圈值', alias: '光圈值' },
+    { key: '曝光时间', alias: '快门速度' },
+    { key: 'ISO感光度', alias: 'ISO感光度' },
+    { key: '原始拍摄时间', alias: '拍摄时间' }
+];
+
+// 曝光时间：小于1秒显示为分数
+function formatExposureTime(seconds) {
+    if (seconds > 0 && seconds < 1) {
+        return `1/${Math.round(1 / seconds)}秒`;
+    }
+    return `${seconds}秒`;
+}
+
+// 拍摄时间：ISO 8601 -> 2022-10-23 17:15:54（保持拍摄地的本地时间，不做时区换算）
+function formatTakenAt(value) {
+    return String(value).slice(0, 19).replace('T', ' ');
+}
+
 // 显示EXIF元数据
 function displayExifData(exifData, container) {
     if (!container) return;
     
-    // 定义所有参数（使用暗色显示）
-    const cameraParams = [
-        '相机品牌', '相机型号', '镜头型号', '焦距', '光圈值', '曝光时间', 'ISO感光度', '原始拍摄时间'
-    ];
-    
-    // 定义参数显示顺序和别名
-    const paramOrder = [
-        { key: '相机品牌', alias: '相机品牌' },
-        { key: '相机型号', alias: '相机型号' },
-        { key: '镜头型号', alias: '镜头型号' },
-        { key: '焦距', alias: '焦距' },
-        { key: '光圈值', alias: '光圈值' },
-        { key: '曝光时间', alias: '快门速度' },
-        { key: 'ISO感光度', alias: 'ISO感光度' },
-        { key: '原始拍摄时间', alias: '拍摄时间' }
-    ];
-    
     let html = '';
     
-            paramOrder.forEach(param => {
+    const appendItem = (label, value) => {
+        html += `
+            <div class="exif-item camera-param">
+                <div class="exif-label">${label}</div>
+                <div class="exif-value">${value}</div>
+            </div>
+        `;
+    };
+    
+    if ('make' in exifData || 'takenAt' in exifData || 'iso' in exifData) {
+        EXIF_DISPLAY_FIELDS.forEach(field => {
+            const value = exifData[field.key];
+            if (value !== undefined && value !== null && value !== '') {
+                appendItem(field.label, field.format ? field.format(value) : value);
+            }
+        });
+    } else {
+        // 兼容尚未迁移的旧版数据（值已经是格式化好的字符串）
+        LEGACY_EXIF_FIELDS.forEach(param => {
             if (exifData[param.key]) {
-                const value = exifData[param.key];
-                
-                html += `
-                    <div class="exif-item camera-param">
-                        <div class="exif-label">${param.alias}</div>
-                        <div class="exif-value">${value}</div>
-                    </div>
-                `;
+                appendItem(param.alias, exifData[param.key]);
             }
         });
+    }
     
     // 如果没有找到任何参数，显示提示信息
     if (!html) {
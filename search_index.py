@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+照片搜索分词
+把照片的标题、描述、标签、相机/镜头型号和拍摄日期切分为检索词，写入照片目录数据库的倒排表（photo_terms）。
+- 英文和数字按单词切分，统一小写，查询的最后一个词按前缀匹配（输入过程中即可出结果）
+- 中日韩文字没有空格分词，按单字和相邻两字（bigram）建立索引，查询时按相邻两字匹配
+- 拍摄日期按年、年月、年月日分别建立索引，可以搜索 2022、2022-10 或 2022-10-23
+"""
+
+import re
+import unicodedata
+
+# 分词规则变化后递增，数据库打开时发现版本不一致会重建整个倒排表
+SEARCH_INDEX_VERSION = 1
+
+# 中日韩文字：平假名/片假名、CJK统一汉字及扩展A、兼容汉字、韩文音节
+CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+
+TOKEN_PATTERN = re.compile(rf'\d{{4}}-\d{{2}}(?:-\d{{2}})?|[{CJK_CHARS}]+|[^\W_{CJK_CHARS}]+')
+CJK_PATTERN = re.compile(rf'[{CJK_CHARS}]')
+
+# 参与检索的EXIF字段
+EXIF_TEXT_FIELDS = ('make', 'model', 'lens')
+
+
+def normalize(text):
+    """全角转半角、统一小写"""
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def split_words(text):
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def index_terms(text):
+    """文本的全部索引词：中日韩文字取单字和相邻两字，其他词原样保留"""
+    terms = set()
+    for word in split_words(text):
+        if CJK_PATTERN.match(word):
+            terms.update(word)
+            terms.update(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.add(word)
+    return terms
+
+
+def date_terms(value):
+    """拍摄时间（ISO 8601）按年、年月、年月日建立索引"""
+    match = re.match(r'(\d{4})-(\d{2})-(\d{2})', value)
+    if not match:
+        return set()
+    year, month, day = match.groups()
+    return {year, f'{year}-{month}', f'{year}-{month}-{day}'}
+
+
+def photo_terms(photo):
+    """照片的全部索引词"""
+    texts = [photo.get('title'), photo.get('description')]
+    tags = photo.get('tags')
+    if isinstance(tags, list):
+        texts.extend(tags)
+    exif = photo.get('exif')
+    terms = set()
+    if isinstance(exif, dict):
+        texts.extend(exif.get(field) for field in EXIF_TEXT_FIELDS)
+        if isinstance(exif.get('takenAt'), str):
+            terms.update(date_terms(exif['takenAt']))
+    for text in texts:
+        if isinstance(text, str):
+            terms.update(index_terms(text))
+    return terms
+
+
+def query_terms(query):
+    """把查询切分为 [(检索词, 是否前缀匹配)]，所有检索词都需要命中
+
+    中日韩文字按相邻两字匹配（单个字时按单字匹配）；最后一个非中日韩的词按前缀匹配。
+    """
+    words = split_words(query)
+    terms = []
+    for position, word in enumerate(words):
+        if CJK_PATTERN.match(word):
+            if len(word) == 1:
+                terms.append((word, False))
+            else:
+                terms.extend((word[i:i + 2], False) for i in range(len(word) - 1))
+        else:
+            terms.append((word, position == len(words) - 1))
+    # 去重并保持顺序
+    return list(dict.fromkeys(terms))
@@ -6,45 +6,911 @@
 """
 
 import os
+import re
 import json
 import shutil
 import time
 import mimetypes
 import signal
-import sys
+import argparse
+import threading
+import uuid
+import gzip
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
-import cgi
-import base64
+from urllib.parse import urlparse, parse_qs, unquote
+from http import HTTPStatus
+from email.utils import formatdate, parsedate_to_datetime
 
-# 图片处理库
+# 图片处理库：服务器本身不处理图片，只检查后台任务能否生成缩略图
+PIL_AVAILABLE = importlib.util.find_spec('PIL') is not None
+if not PIL_AVAILABLE:
+    print("⚠️  警告：Pillow库未安装，无法生成缩略图")
+    print("💡 请运行：pip install Pillow")
+
+# Brotli压缩（可选）：未安装时只提供gzip
 try:
-    from PIL import Image
-    from PIL.ExifTags import TAGS
-    PIL_AVAILABLE = True
+    import brotli
+    BROTLI_AVAILABLE = True
 except ImportError:
-    PIL_AVAILABLE = False
-    print("⚠️  警告：Pillow库未安装，无法生成缩略图和提取EXIF")
-    print("💡 请运行：pip install Pillow")
+    BROTLI_AVAILABLE = False
+
+from generate_thumbnails import (
+    generate_thumbnails_parallel, record_exif_state, DEFAULT_WORKERS as THUMBNAIL_WORKERS
+)
+from derivative_cache import DerivativeManifest
+from build_catalog import write_catalog
+from catalog_store import CatalogStore, GenerationConflict, parse_photo_id, SORT_ORDERS, DEFAULT_SORT
+from extract_exif import extract_exif_batch, is_legacy_exif, ExifState
+from multipart_upload import parse_multipart, UploadError, MAX_FILE_BYTES, MAX_REQUEST_BYTES
+from metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from storage_layout import PathIndex, shard_path, thumbnail_path_for
+from watcher import DirectoryWatcher, manifest_baseline, DEFAULT_DEBOUNCE as DEFAULT_WATCH_DEBOUNCE, \
+    DEFAULT_POLL_INTERVAL as DEFAULT_WATCH_INTERVAL
 
 # 全局服务器变量
 httpd = None
 
+# 分片存储的路径索引：迁移前的平铺路径到分片路径的映射在启动时读入内存
+storage_index = PathIndex()
+
+# data/文件夹监视（--watch），新增或修改的图片自动提交处理任务
+directory_watcher = None
+
+# 并发配置：工作线程数与监听队列长度
+# 静态文件和照片接口主要等待磁盘和网络，线程数与CPU核数无关；单核主机上也要足够多，几个慢连接不会占满线程池
+DEFAULT_WORKERS = 32
+DEFAULT_BACKLOG = 128
+
+# 等待请求行和请求头的超时（秒）：空闲的长连接和迟迟不发请求头的慢客户端很快释放工作线程
+HEADER_TIMEOUT = 5
+
+# 不能使用sendfile时，流式发送文件的分块大小
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# 单段字节范围，例如 bytes=0-499、bytes=500-、bytes=-500
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# 静态文件内存缓存：总容量和单个文件大小上限
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_FILE_SIZE = 1024 * 1024
+
+# 压缩传输：文本类文件（页面、脚本、样式、photos.json）按Accept-Encoding返回压缩版本，
+# 首次请求时压缩一次并放入静态文件缓存，原文件修改后重新压缩；JPEG等已压缩的格式不处理
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 256
+MAX_COMPRESS_SIZE = 32 * 1024 * 1024
+# 压缩版本在缓存中的单个大小上限（高于普通文件的上限，大图库的photos.json压缩后也能放入缓存）
+COMPRESSED_CACHE_FILE_SIZE = 8 * 1024 * 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+# 按服务器偏好排列，客户端权重相同时优先使用靠前的格式
+SUPPORTED_ENCODINGS = ('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',)
+
+# 文件名包含内容哈希、内容永不改变的目录，可永久缓存
+IMMUTABLE_DIRS = ('renditions',)
+# 文件名不随内容变化的目录（原图可能被同名覆盖，缩略图随之重新生成），短期缓存后用ETag验证
+REVALIDATE_DIRS = ('data', 'thumbnails')
+REVALIDATE_MAX_AGE = 3600
+
+# 照片目录保存在SQLite中（photos.db），单张照片的修改只写一行
+catalog_store = CatalogStore()
+
+# 目录修改后photos.json和catalog/需要重新导出；在被请求、修改停止一段时间后或服务器停止时导出
+catalog_export_pending = threading.Event()
+
+# 目录修改后等待多久再导出（秒）；这段时间内的多次保存（例如拖拽排序）合并为一次写入
+DEFAULT_EXPORT_DELAY = 2.0
+
+# 暂存更新的检查与合并、photos.json的导出需要串行化
+catalog_lock = threading.Lock()
+
+# 批量生成缩略图时独占派生图缓存清单
+derivative_lock = threading.Lock()
+
+# EXIF增量提取状态文件同一时间只允许一个任务读写
+exif_lock = threading.Lock()
+
+# 后台任务：并发执行的任务数和保留的已结束任务数
+DEFAULT_JOB_WORKERS = 2
+JOB_HISTORY_SIZE = 100
+JOB_PATH_PATTERN = re.compile(r'^/jobs/([0-9a-f]+)(/cancel)?$')
+
+# 单张照片接口：/api/photos/<id>
+PHOTO_PATH_PATTERN = re.compile(r'^/api/photos/([^/]+)$')
+
+# 分页查询接口：/api/photos?tag=&page=&size=&sort=
+DEFAULT_PAGE_SIZE = 12
+MAX_PAGE_SIZE = 100
+
+# JSON请求体的最大字节数
+MAX_JSON_BYTES = 16 * 1024 * 1024
+
+# 访问日志级别：all 记录每个请求，errors 只记录状态码>=400的请求，off 关闭访问日志和错误日志
+ACCESS_LOG_LEVELS = ('all', 'errors', 'off')
+DEFAULT_ACCESS_LOG = 'all'
+
+# 指标中按路由统计的接口路径；其他路径按顶层目录归并，避免每个文件、每张照片产生一条时间序列
+METRIC_ROUTES = (
+    '/health', '/metrics', '/cache-stats', '/jobs', '/api/photos', '/api/search', '/photos.json',
+    '/copy-image', '/save-json', '/extract-exif', '/generate-thumbnails'
+)
+METRIC_STATIC_DIRS = ('data', 'thumbnails', 'renditions', 'catalog')
+# 后台任务耗时的分桶（秒）
+JOB_DURATION_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+# 上传后由后台任务生成的字段，管理面板尚未把新照片保存到目录时先暂存，保存时再合并；
+# 按暂存顺序排列，超过上限时丢弃最早的（监视到大量从未加入目录的图片时内存不会无限增长），原图被删除时一并丢弃
+MAX_PENDING_PHOTO_UPDATES = 2000
+pending_photo_updates = OrderedDict()
+
 def signal_handler(signum, frame):
     """信号处理函数"""
     print(f"\n🛑 收到信号 {signum}，正在停止服务器...")
-    if httpd:
-        httpd.shutdown()
-        httpd.server_close()
-    print("服务器已停止")
-    sys.exit(0)
+    # 信号处理函数运行在serve_forever所在的主线程中，
+    # 此时直接调用httpd.shutdown()会一直等待自身退出而死锁，
+    # 因此抛出KeyboardInterrupt，由run_server中的finally统一关闭服务器
+    raise KeyboardInterrupt
 
 # 注册信号处理器
 signal.signal(signal.SIGINT, signal_handler)
 if hasattr(signal, 'SIGTERM'):
     signal.signal(signal.SIGTERM, signal_handler)
 
+def parse_range_header(value, size):
+    """解析Range请求头，返回(start, end)闭区间
+
+    只支持单个字节范围；多段范围或无法识别的格式返回None（按完整文件响应），
+    范围超出文件大小时抛出ValueError（应返回416）。
+    """
+    match = RANGE_PATTERN.match(value.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # 后缀范围：bytes=-500 表示最后500字节
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError('range not satisfiable')
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise ValueError('range not satisfiable')
+    return start, min(end, size - 1)
+
+
+@lru_cache(maxsize=256)
+def guess_content_type(extension):
+    """根据扩展名猜测MIME类型（按扩展名缓存结果）"""
+    content_type, _ = mimetypes.guess_type('file' + extension)
+    return content_type or 'application/octet-stream'
+
+
+def parse_page_params(params):
+    """解析分页查询参数，返回 (标签, 页码, 每页数量, 排序)；参数不正确时抛出ValueError"""
+    tag = params.get('tag', [''])[0] or None
+    sort = params.get('sort', [DEFAULT_SORT])[0] or DEFAULT_SORT
+    try:
+        page = int(params.get('page', ['1'])[0] or 1)
+        size = int(params.get('size', [str(DEFAULT_PAGE_SIZE)])[0] or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('page和size必须是整数')
+    if page < 1 or not 1 <= size <= MAX_PAGE_SIZE:
+        raise ValueError(f'page必须大于0，size必须在1到{MAX_PAGE_SIZE}之间')
+    if sort not in SORT_ORDERS:
+        raise ValueError(f"sort必须是{'、'.join(SORT_ORDERS)}之一")
+    return tag, page, size, sort
+
+
+def is_compressible(content_type):
+    """文本类内容压缩效果好；图片（SVG除外）等已压缩的格式不再压缩"""
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+def negotiate_encoding(accept_encoding):
+    """按Accept-Encoding选择压缩格式，客户端不接受任何支持的格式时返回None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class StaticFileEntry:
+    """静态文件的元数据和预先计算好的响应头，缓存命中时还包含文件内容
+
+    压缩版本是单独的条目：key包含压缩格式，size和ETag对应压缩后的内容，
+    source_size仍是原文件大小，用于判断原文件是否被修改。
+    """
+
+    __slots__ = ('key', 'path', 'size', 'source_size', 'mtime', 'mtime_ns', 'etag', 'last_modified',
+                 'content_type', 'cache_control', 'encoding', 'vary', 'content')
+
+    def __init__(self, file_path, stat):
+        self.key = file_path
+        self.path = file_path
+        self.size = stat.st_size
+        self.source_size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.mtime_ns = stat.st_mtime_ns
+        self.etag = make_etag(stat)
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = guess_content_type(os.path.splitext(file_path)[1].lower())
+        self.cache_control = cache_control_for(file_path)
+        self.encoding = None
+        # 可压缩的文件按Accept-Encoding返回不同内容，需要告知中间缓存
+        self.vary = is_compressible(self.content_type)
+        self.content = None
+
+    def matches(self, stat):
+        """文件的修改时间和大小未变化时缓存仍然有效"""
+        return self.mtime_ns == stat.st_mtime_ns and self.source_size == stat.st_size
+
+    def encoded(self, encoding, content):
+        """返回该文件压缩后的条目"""
+        entry = StaticFileEntry.__new__(StaticFileEntry)
+        for name in self.__slots__:
+            setattr(entry, name, getattr(self, name))
+        entry.key = (self.path, encoding)
+        entry.size = len(content)
+        # 不同压缩格式的内容不同，使用不同的强ETag
+        entry.etag = f'{self.etag[:-1]}-{encoding}"'
+        entry.encoding = encoding
+        entry.content = content
+        return entry
+
+
+class StaticFileCache:
+    """热点静态文件的内存缓存
+
+    按总字节数限制容量，超出时淘汰最久未使用的文件（LRU）；
+    只缓存不超过max_file_size的小文件（缩略图、页面、脚本、photos.json），
+    原图等大文件仍然走sendfile流式发送。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, max_file_size=DEFAULT_CACHE_FILE_SIZE):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def accepts(self, size, max_file_size=None):
+        """判断该大小的文件是否应该放入缓存（max_file_size覆盖默认的单个文件上限）"""
+        return 0 < size <= min(max_file_size or self.max_file_size, self.max_bytes)
+
+    def get(self, key, stat):
+        """查找缓存（key为文件路径，压缩版本为 (路径, 压缩格式)）；文件已被修改时丢弃旧条目并返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.matches(stat):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, entry):
+        """加入缓存，并按LRU顺序淘汰超出预算的条目"""
+        with self._lock:
+            if entry.key in self._entries:
+                self._remove(entry.key)
+            self._entries[entry.key] = entry
+            self.current_bytes += entry.size
+            while self.current_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRatio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.size
+
+
+def make_etag(stat):
+    """根据文件修改时间和大小生成强ETag"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def cache_control_for(file_path):
+    """返回静态文件的Cache-Control策略
+
+    renditions/中的文件名包含原图内容哈希，可以永久缓存；
+    data/和thumbnails/的文件可能被同名覆盖，缓存一小时后用ETag重新验证；
+    页面、脚本、样式和photos.json每次都需要向服务器验证。
+    """
+    top_dir = file_path.split(os.sep)[0]
+    if top_dir in IMMUTABLE_DIRS:
+        return 'public, max-age=31536000, immutable'
+    if top_dir in REVALIDATE_DIRS:
+        return f'public, max-age={REVALIDATE_MAX_AGE}'
+    return 'no-cache'
+
+
+static_cache = StaticFileCache()
+
+# 运行指标，GET /metrics 以Prometheus文本格式导出
+metrics = MetricsRegistry()
+request_duration = metrics.histogram('gallery_http_request_duration_seconds', '请求处理耗时（秒）',
+                                     ('method', 'route', 'status'))
+response_bytes = metrics.counter('gallery_http_response_bytes_total', '发送的响应字节数（含响应头）', ('route',))
+requests_in_flight = metrics.gauge('gallery_http_requests_in_flight', '正在处理的请求数')
+metrics.counter('gallery_static_cache_hits_total', '静态文件缓存命中次数', func=lambda: static_cache.hits)
+metrics.counter('gallery_static_cache_misses_total', '静态文件缓存未命中次数', func=lambda: static_cache.misses)
+metrics.counter('gallery_static_cache_evictions_total', '静态文件缓存淘汰次数', func=lambda: static_cache.evictions)
+metrics.gauge('gallery_static_cache_hit_ratio', '静态文件缓存命中率', func=lambda: static_cache.stats()['hitRatio'])
+metrics.gauge('gallery_static_cache_bytes', '静态文件缓存占用字节数', func=lambda: static_cache.current_bytes)
+job_duration = metrics.histogram('gallery_job_duration_seconds', '后台任务（缩略图、EXIF、上传处理）耗时（秒）',
+                                 ('kind', 'status'), buckets=JOB_DURATION_BUCKETS)
+job_items = metrics.counter('gallery_job_items_total', '后台任务处理的照片数', ('kind', 'result'))
+catalog_export_duration = metrics.histogram('gallery_catalog_export_duration_seconds',
+                                            '导出photos.json和catalog/的耗时（秒）')
+
+
+def route_label(path):
+    """把请求路径归并为有限的路由名，作为指标标签"""
+    path = urlparse(path).path
+    if path in METRIC_ROUTES:
+        return path
+    if PHOTO_PATH_PATTERN.match(path):
+        return '/api/photos/<id>'
+    match = JOB_PATH_PATTERN.match(path)
+    if match:
+        return '/jobs/<id>/cancel' if match.group(2) else '/jobs/<id>'
+    top = unquote(path).lstrip('/').split('/')[0]
+    if top in METRIC_STATIC_DIRS:
+        return f'/{top}/'
+    return 'static'
+
+
+class CountingWriter:
+    """包装连接的写入流，统计发送的字节数（sendfile发送的部分由调用方累加）"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_written = 0
+
+    def write(self, data):
+        written = self.raw.write(data)
+        self.bytes_written += len(data) if written is None else written
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+# 不使用压缩版本的文件：{(路径, 压缩格式): ETag}，压缩后没有变小或放不进缓存，该版本之后直接发送原文件
+uncompressed_variants = {}
+uncompressed_variants_lock = threading.Lock()
+
+
+def compressed_entry(file_path, stat, encoding):
+    """返回静态文件压缩后的条目
+
+    每个文件版本最多压缩一次：首次请求时读取并压缩，结果放入静态文件缓存，之后的请求不再消耗CPU；
+    压缩后没有变小或放不进缓存时记住该版本，返回None（按原文件发送），文件修改后才重新尝试。
+    """
+    key = (file_path, encoding)
+    entry = static_cache.get(key, stat)
+    if entry is not None:
+        return entry
+    with uncompressed_variants_lock:
+        if uncompressed_variants.get(key) == make_etag(stat):
+            return None
+    with open(file_path, 'rb') as f:
+        source = StaticFileEntry(file_path, os.fstat(f.fileno()))
+        data = f.read()
+    if len(data) != source.size:
+        # 读取过程中文件被修改
+        return None
+    content = compress(data, encoding)
+    cacheable = static_cache.accepts(len(content), COMPRESSED_CACHE_FILE_SIZE)
+    if len(content) >= len(data) or not cacheable:
+        with uncompressed_variants_lock:
+            uncompressed_variants[key] = source.etag
+    if len(content) >= len(data):
+        return None
+    entry = source.encoded(encoding, content)
+    if cacheable:
+        static_cache.put(entry)
+    return entry
+
+
+def merge_photo_updates(updates):
+    """把按src索引的字段更新合并进照片目录
+
+    只改写对应照片的行，批量任务期间管理面板对其他照片的修改不会被覆盖。
+    照片还不在目录中（刚上传、管理面板尚未保存）时，更新暂存在pending_photo_updates，
+    照片被保存时再合并；暂存超过MAX_PENDING_PHOTO_UPDATES张时丢弃最早的。
+    """
+    if not updates:
+        return
+    with catalog_lock:
+        changed, remaining = catalog_store.update_by_src(updates)
+        if changed:
+            export_scheduler.schedule()
+        for src, fields in remaining.items():
+            pending_photo_updates.setdefault(src, {}).update(fields)
+            pending_photo_updates.move_to_end(src)
+        while len(pending_photo_updates) > MAX_PENDING_PHOTO_UPDATES:
+            pending_photo_updates.popitem(last=False)
+
+
+class ExportScheduler:
+    """延迟导出photos.json和catalog/
+
+    第一次修改时开始计时，delay秒内的后续修改合并到同一次导出，
+    连续保存时每delay秒最多整体重写一次文件。
+    """
+
+    def __init__(self, delay=DEFAULT_EXPORT_DELAY):
+        self.delay = delay
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def schedule(self):
+        """标记目录有未导出的修改，并在delay秒后导出"""
+        catalog_export_pending.set()
+        if self.delay <= 0:
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self._run)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            export_catalog()
+        except Exception as e:
+            print(f"⚠️  导出照片目录失败：{e}")
+
+
+export_scheduler = ExportScheduler()
+
+
+def validate_catalog(photos_data):
+    """检查要保存的目录结构，不正确时抛出ValueError（在写入数据库之前）"""
+    if not isinstance(photos_data, dict) or not isinstance(photos_data.get('photos'), list):
+        raise ValueError('请求体必须是 {"photos": [...]} 格式的JSON对象')
+    for index, photo in enumerate(photos_data['photos']):
+        if not isinstance(photo, dict):
+            raise ValueError(f'第{index + 1}张照片不是JSON对象')
+        photo_id = photo.get('id')
+        if photo_id is not None and (isinstance(photo_id, bool) or not isinstance(photo_id, (int, str))):
+            raise ValueError(f'第{index + 1}张照片的id必须是整数或字符串')
+        if 'tags' in photo and not isinstance(photo['tags'], list):
+            raise ValueError(f'第{index + 1}张照片的tags必须是数组')
+
+
+def export_catalog(force=False):
+    """目录有未导出的修改时重新生成photos.json、精简索引和详情分块"""
+    with catalog_lock:
+        if not force and not catalog_export_pending.is_set():
+            return
+        catalog_export_pending.clear()
+        started = time.perf_counter()
+        photos_data = catalog_store.export_json()
+        try:
+            write_catalog(photos_data)
+        except Exception as e:
+            # 索引生成失败不影响photos.json的导出，前端会回退到photos.json
+            print(f"⚠️  生成照片索引失败：{e}")
+        catalog_export_duration.observe(time.perf_counter() - started)
+
+
+def apply_pending_updates(photos):
+    """把暂存的后台任务结果合并进即将保存的照片（调用方持有catalog_lock）
+
+    返回是否有照片被更新。
+    """
+    changed = False
+    for photo in photos:
+        fields = pending_photo_updates.pop(photo.get('src', ''), None)
+        if fields:
+            photo.update(fields)
+            changed = True
+    return changed
+
+
+class JobCancelled(Exception):
+    """后台任务被取消"""
+
+
+class Job:
+    """一个后台任务及其进度"""
+
+    def __init__(self, kind, total=0):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = 'queued'
+        self.total = total
+        self.done = 0
+        self.failed = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """在任务的检查点调用，已请求取消时中止任务"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def advance(self, count=1, error=None, src=None):
+        """完成count个步骤；error不为空时记录该照片的失败原因"""
+        self.done += count
+        if error is not None:
+            self.failed.append({'src': src, 'error': str(error)})
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.kind,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'result': self.result,
+            'error': self.error,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at
+        }
+
+
+class JobManager:
+    """后台任务队列
+
+    上传后的缩略图/EXIF处理以及整个图库的批量任务都在这里的线程池中执行，
+    HTTP请求只负责提交任务并立即返回任务ID，客户端通过/jobs/<id>查询进度或取消。
+    任务函数的第一个参数是Job，需要定期调用job.check_cancelled()响应取消。
+    """
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, history=JOB_HISTORY_SIZE):
+        self.history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    def submit(self, kind, func, *args, total=0):
+        """提交任务，返回Job"""
+        job = Job(kind, total)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        job.future = self._executor.submit(self._run, job, func, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """按提交时间从新到旧返回所有任务"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id):
+        """请求取消任务；排队中的任务直接取消，运行中的任务在下一个检查点结束"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job._cancel.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, 'cancelled')
+        return job
+
+    def shutdown(self):
+        """停止服务器时取消所有任务，不等待运行中的任务"""
+        for job in self.list():
+            if job.status in ('queued', 'running'):
+                self.cancel(job.id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, func, args):
+        if job.cancelled:
+            self._finish(job, 'cancelled')
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = func(job, *args)
+            self._finish(job, 'cancelled' if job.cancelled else 'succeeded')
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            print(f"❌ 后台任务 {job.kind} ({job.id}) 失败：{e}")
+            job.error = str(e)
+            self._finish(job, 'failed')
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        if job.started_at is not None:
+            job_duration.observe(job.finished_at - job.started_at, kind=job.kind, status=status)
+        job_items.inc(job.done - len(job.failed), kind=job.kind, result='ok')
+        job_items.inc(len(job.failed), kind=job.kind, result='error')
+
+    def _trim(self):
+        """只保留最近的已结束任务，运行中和排队中的任务不会被清理"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+
+job_manager = JobManager()
+
+
+def run_thumbnail_job(job, sources, collect_garbage=True, exif=False, content_hashes=None):
+    """后台任务：生成缩略图和派生图，并写入照片目录
+
+    exif为True时在读取原图的同一次处理中提取EXIF，一起写入照片目录；
+    content_hashes为上传时已经算好的内容哈希，不再为哈希重新读取原图。
+    """
+    def report_progress(done, total, item):
+        if item['status'] == 'error':
+            print(f"❌ [{done}/{total}] 生成缩略图失败 {item['source']}: {item['error']}")
+            job.advance(error=item['error'], src=item['source'])
+            return
+        if item['status'] == 'skipped':
+            print(f"⏭️  [{done}/{total}] 原图未变化: {item['source']}")
+        else:
+            print(f"✅ [{done}/{total}] 已生成缩略图: {item['thumbnail']}")
+        job.advance()
+    
+    # 多进程并行生成缩略图，按缓存清单只处理新增或被修改过的原图
+    with derivative_lock:
+        job.check_cancelled()
+        manifest = DerivativeManifest()
+        results = generate_thumbnails_parallel(sources, workers=THUMBNAIL_WORKERS, progress=report_progress,
+                                               manifest=manifest, should_stop=lambda: job.cancelled,
+                                               exif=exif, content_hashes=content_hashes)
+        if collect_garbage and not job.cancelled:
+            manifest.collect_garbage()
+            manifest.save()
+    
+    # 已完成的部分即使任务被取消也写入照片目录
+    thumbnail_updates = {}
+    for item in results:
+        if item is not None and item['status'] != 'error':
+            thumbnail_updates[item['source']] = {
+                'thumbnailPath': item['thumbnail'],
+                'renditions': item['renditions'],
+                # 尺寸、宽高比、主色调和模糊预览，前端据此在图片到达前排版并绘制预览
+                **(item['placeholder'] or {})
+            }
+            if item['exif']:
+                thumbnail_updates[item['source']]['exif'] = item['exif']
+    generated = len(thumbnail_updates)
+    
+    summary = {'generated': generated}
+    if exif:
+        # 派生图已存在而跳过、或处理失败的图片没有读取原图，单独读取文件头提取EXIF
+        pending = [item['source'] for item in results if item is not None and not item['exif_extracted']]
+        with exif_lock:
+            state = ExifState()
+            record_exif_state(results, state)
+            if pending and not job.cancelled:
+                updates, _ = extract_exif_batch(pending, state=state, should_stop=lambda: job.cancelled)
+                for src, exif_data in updates.items():
+                    thumbnail_updates.setdefault(src, {})['exif'] = exif_data
+        summary['updated'] = sum(1 for fields in thumbnail_updates.values() if 'exif' in fields)
+    merge_photo_updates(thumbnail_updates)
+    return summary
+
+
+def run_exif_job(job, sources, existing=()):
+    """后台任务：提取EXIF数据，并写入照片目录
+
+    只读取文件头、多线程并行，自上次提取后没有变化的原图直接跳过。
+    existing为目录中已有EXIF的原图路径。
+    """
+    def report_progress(done, total, src, status):
+        if status == 'extracted':
+            print(f"✅ 已提取EXIF: {src}")
+        elif status == 'empty':
+            print(f"⚠️  无EXIF数据: {src}")
+        job.advance()
+    
+    with exif_lock:
+        job.check_cancelled()
+        updates, skipped = extract_exif_batch(sources, state=ExifState(),
+                                              existing=set(existing), progress=report_progress,
+                                              should_stop=lambda: job.cancelled)
+    
+    # 只更新目录中对应照片的EXIF
+    merge_photo_updates({src: {'exif': exif_data} for src, exif_data in updates.items()})
+    return {'updated': len(updates), 'skipped': skipped}
+
+
+def run_ingest_job(job, sources, content_hashes=None):
+    """后台任务：处理刚上传的图片
+
+    每张图片只读取一次、解码一次，同时得到缩略图、派生图、占位信息和EXIF；
+    上传时边写边算的内容哈希直接使用，不再为哈希重新读取原图。
+    """
+    return run_thumbnail_job(job, sources, collect_garbage=False, exif=True, content_hashes=content_hashes)
+
+
+def submit_watched_changes(changed, removed):
+    """data/中新增或修改的图片提交为处理任务；删除的原图丢弃暂存的更新，派生文件由下次全量生成时清理"""
+    if removed:
+        with catalog_lock:
+            for src in removed:
+                pending_photo_updates.pop(src, None)
+    for src in removed:
+        print(f"🗑️  原图已删除：{src}")
+    if changed:
+        print(f"👀 发现 {len(changed)} 张新增或修改的图片")
+        job_manager.submit('watch', run_ingest_job, changed, total=len(changed))
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """线程池HTTP服务器
+
+    每个连接交给固定大小的线程池处理，慢请求（批量任务、大文件传输）
+    不会阻塞其他访客。所有工作线程都忙时，accept循环暂停，
+    新连接在内核监听队列（backlog）中排队，内存占用有上限。
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS, backlog=DEFAULT_BACKLOG):
+        self.workers = workers
+        self.request_queue_size = backlog
+        self._slots = threading.BoundedSemaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        """把连接交给线程池，线程池满时在此等待空闲线程"""
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # 线程池已关闭（服务器正在停止）
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 class AdminHandler(BaseHTTPRequestHandler):
+    # 请求头到达后读取请求体、发送响应的超时（秒）；等待请求头的超时见HEADER_TIMEOUT
+    timeout = 60
+    # 上传限制：单个文件和整个请求体的最大字节数
+    max_upload_bytes = MAX_FILE_BYTES
+    max_request_bytes = MAX_REQUEST_BYTES
+    # 访问日志级别（见ACCESS_LOG_LEVELS）
+    access_log = DEFAULT_ACCESS_LOG
+
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+
+    def handle_one_request(self):
+        """处理一个请求，结束后记录耗时、状态码和发送字节数"""
+        self.request_started = None
+        self.connection.settimeout(HEADER_TIMEOUT)
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_started is not None:
+                self.record_request()
+
+    def parse_request(self):
+        ok = super().parse_request()
+        if ok:
+            # 上传的请求体和大文件响应可能需要较长时间，请求头到达后恢复为较长的读写超时
+            self.connection.settimeout(self.timeout)
+            # 请求行和请求头解析成功后开始计时（等待长连接下一个请求的时间不计入）
+            self.request_started = time.perf_counter()
+            self.request_bytes_start = self.wfile.bytes_written
+            self.response_status = None
+            requests_in_flight.inc()
+        return ok
+
+    def record_request(self):
+        elapsed = time.perf_counter() - self.request_started
+        sent = self.wfile.bytes_written - self.request_bytes_start
+        route = route_label(self.path)
+        status = self.response_status
+        requests_in_flight.dec()
+        request_duration.observe(elapsed, method=self.command, route=route,
+                                 status=status if status is not None else 'none')
+        response_bytes.inc(sent, route=route)
+        if self.access_log == 'all' or (self.access_log == 'errors' and (status is None or status >= 400)):
+            self.log_message('"%s" %s %d %.1fms', self.requestline, status or '-', sent, elapsed * 1000)
+
+    def log_request(self, code='-', size='-'):
+        """send_response时调用：只记下状态码，访问日志在请求结束后带上耗时统一输出"""
+        self.response_status = code.value if isinstance(code, HTTPStatus) else code
+
+    def log_error(self, format, *args):
+        if self.access_log != 'off':
+            super().log_error(format, *args)
+
     def do_GET(self):
         """处理GET请求"""
         if self.path == '/health':
@@ -55,45 +921,232 @@ class AdminHandler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps({'status': 'ok'}).encode())
             return
         
+        if self.path == '/metrics':
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', METRICS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        
+        if self.path == '/cache-stats':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Cache-Control', 'no-store')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(static_cache.stats()).encode())
+            return
+        
+        if self.path == '/jobs':
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Cache-Control', 'no-store')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps({'jobs': [job.to_dict() for job in job_manager.list()]}).encode())
+            return
+        
+        match = JOB_PATH_PATTERN.match(self.path)
+        if match and not match.group(2):
+            self.handle_job_status(job_manager.get(match.group(1)))
+            return
+        
+        match = PHOTO_PATH_PATTERN.match(self.path)
+        if match:
+            self.handle_photo_request('GET', parse_photo_id(unquote(match.group(1))))
+            return
+        
+        parsed = urlparse(self.path)
+        if parsed.path == '/api/photos':
+            self.handle_photo_query(parse_qs(parsed.query))
+            return
+        if parsed.path == '/api/search':
+            self.handle_search(parse_qs(parsed.query))
+            return
+        
+        self.serve_static_file()
+    
+    def do_HEAD(self):
+        """处理HEAD请求（只返回响应头）"""
+        self.serve_static_file(head_only=True)
+    
+    def serve_static_file(self, head_only=False):
+        """流式发送静态文件，支持Range断点续传"""
         # 处理静态文件
         if self.path == '/':
             self.path = '/index.html'
         
+        # 获取文件路径，去除查询参数
+        file_path = unquote(self.path.split('?')[0]).lstrip('/')
+        if not file_path:
+            file_path = 'index.html'
+        # 迁移到分片目录之前的路径（旧的photos.json、书签）通过路径索引找到文件，不列目录
+        file_path = os.path.normpath(storage_index.resolve(file_path))
+        
+        # 禁止访问站点目录之外的文件
+        if os.path.isabs(file_path) or file_path.split(os.sep)[0] == '..':
+            self.send_error(403, 'Forbidden')
+            return
+        
+        # photos.json和catalog/由照片目录导出，有未导出的修改时先重新生成
+        if file_path == 'photos.json' or file_path.split(os.sep)[0] == 'catalog':
+            export_catalog()
+        
         try:
-            # 获取文件路径，去除查询参数
-            file_path = self.path.split('?')[0].lstrip('/')
-            if not file_path:
-                file_path = 'index.html'
-            
-            # 调试信息
-            print(f"请求路径: {self.path}")
-            print(f"处理文件: {file_path}")
-            print(f"文件是否存在: {os.path.exists(file_path)}")
-            print(f"当前工作目录: {os.getcwd()}")
-            
-            # 检查文件是否存在
-            if not os.path.exists(file_path):
-                self.send_error(404, f'File not found: {file_path}')
-                return
-            
-            # 获取文件类型
-            content_type, _ = mimetypes.guess_type(file_path)
-            if content_type is None:
-                content_type = 'application/octet-stream'
-            
-            # 读取并发送文件
-            with open(file_path, 'rb') as f:
+            stat = os.stat(file_path)
+        except (FileNotFoundError, NotADirectoryError):
+            self.send_error(404, f'File not found: {file_path}')
+            return
+        except OSError as e:
+            print(f"处理文件时出错: {str(e)}")
+            self.send_error(500, f'Internal server error: {str(e)}')
+            return
+        
+        # 文本类文件按Accept-Encoding返回压缩版本
+        content_type = guess_content_type(os.path.splitext(file_path)[1].lower())
+        if is_compressible(content_type) and MIN_COMPRESS_SIZE <= stat.st_size <= MAX_COMPRESS_SIZE:
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+            if encoding is not None:
+                try:
+                    entry = compressed_entry(file_path, stat, encoding)
+                except OSError:
+                    entry = None
+                if entry is not None:
+                    self.send_static_entry(entry, head_only)
+                    return
+        
+        # 热点小文件直接从内存缓存返回
+        entry = static_cache.get(file_path, stat)
+        if entry is not None:
+            self.send_static_entry(entry, head_only)
+            return
+        
+        try:
+            f = open(file_path, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            self.send_error(404, f'File not found: {file_path}')
+            return
+        except OSError as e:
+            print(f"处理文件时出错: {str(e)}")
+            self.send_error(500, f'Internal server error: {str(e)}')
+            return
+        
+        with f:
+            entry = StaticFileEntry(file_path, os.fstat(f.fileno()))
+            if static_cache.accepts(entry.size):
                 content = f.read()
-            
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
+                if len(content) == entry.size:
+                    entry.content = content
+                    static_cache.put(entry)
+            self.send_static_entry(entry, head_only, f)
+    
+    def send_static_entry(self, entry, head_only=False, f=None):
+        """按条件请求和Range发送静态文件，内容来自缓存或打开的文件"""
+        # 条件请求：客户端缓存仍然有效时返回304，不发送文件内容
+        if self.is_not_modified(entry.etag, entry.mtime):
+            self.send_response(304)
+            self.send_header('ETag', entry.etag)
+            self.send_header('Last-Modified', entry.last_modified)
+            self.send_header('Cache-Control', entry.cache_control)
+            if entry.vary:
+                self.send_header('Vary', 'Accept-Encoding')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            self.wfile.write(content)
-            
-        except Exception as e:
-            print(f"处理文件时出错: {str(e)}")
-            self.send_error(500, f'Internal server error: {str(e)}')
+            return
+        
+        # 解析Range请求；If-Range与文件当前版本不一致时返回完整文件
+        size = entry.size
+        byte_range = None
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and (if_range is None or if_range in (entry.etag, entry.last_modified)):
+            try:
+                byte_range = parse_range_header(range_header, size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                return
+        
+        if byte_range is None:
+            start, length = 0, size
+            self.send_response(200)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        
+        self.send_header('Content-type', entry.content_type)
+        if entry.encoding:
+            self.send_header('Content-Encoding', entry.encoding)
+        if entry.vary:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', entry.etag)
+        self.send_header('Last-Modified', entry.last_modified)
+        self.send_header('Cache-Control', entry.cache_control)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        
+        if head_only or length == 0:
+            return
+        
+        try:
+            if entry.content is not None:
+                self.wfile.write(memoryview(entry.content)[start:start + length])
+            else:
+                self.send_file_body(f, start, length)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中断下载（例如关闭灯箱），之后可以用Range续传
+            self.close_connection = True
+    
+    def is_not_modified(self, etag, mtime):
+        """判断条件GET是否命中客户端缓存
+
+        If-None-Match优先；没有该请求头时才检查If-Modified-Since。
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            if if_none_match.strip() == '*':
+                return True
+            # 弱比较：忽略W/前缀
+            candidates = [tag.strip() for tag in if_none_match.split(',')]
+            return any(tag.removeprefix('W/') == etag for tag in candidates)
+        
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since is None:
+                return False
+            # HTTP日期只精确到秒
+            return int(mtime) <= since.timestamp()
+        return False
+    
+    def send_file_body(self, f, offset, count):
+        """发送文件内容：优先使用sendfile零拷贝，否则分块读写"""
+        try:
+            self.wfile.bytes_written += self.connection.sendfile(f, offset, count)
+            return
+        except (AttributeError, NotImplementedError):
+            pass
+        f.seek(offset)
+        remaining = count
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
     
     def do_POST(self):
         """处理POST请求"""
@@ -105,285 +1158,140 @@ class AdminHandler(BaseHTTPRequestHandler):
             self.handle_extract_exif()
         elif self.path == '/generate-thumbnails':
             self.handle_generate_thumbnails()
+        elif self.path == '/api/photos':
+            self.handle_photo_request('POST')
+        elif JOB_PATH_PATTERN.match(self.path) and self.path.endswith('/cancel'):
+            self.handle_job_status(job_manager.cancel(JOB_PATH_PATTERN.match(self.path).group(1)))
         else:
             self.send_response(404)
             self.end_headers()
             self.wfile.write(b'Not Found')
     
-    def extract_exif_from_image(self, image_path):
-        """从图片中提取EXIF数据"""
-        try:
-            with Image.open(image_path) as img:
-                exif_data = img._getexif()
-                if exif_data is None:
-                    return None
-                
-                exif_info = {}
-                
-                # 常见的EXIF标签映射
-                exif_tags = {
-                    'Make': '相机品牌',
-                    'Model': '相机型号',
-                    'Software': '软件',
-                    'DateTime': '拍摄时间',
-                    'Artist': '摄影师',
-                    'Copyright': '版权信息',
-                    'DateTimeOriginal': '原始拍摄时间',
-                    'ExposureTime': '曝光时间',
-                    'FNumber': '光圈值',
-                    'ExposureProgram': '曝光程序',
-                    'ISOSpeedRatings': 'ISO感光度',
-                    'ShutterSpeedValue': '快门速度值',
-                    'ApertureValue': '光圈值',
-                    'BrightnessValue': '亮度值',
-                    'ExposureBiasValue': '曝光偏差值',
-                    'MaxApertureValue': '最大光圈值',
-                    'SubjectDistance': '主体距离',
-                    'MeteringMode': '测光模式',
-                    'LightSource': '光源',
-                    'Flash': '闪光灯',
-                    'FocalLength': '焦距',
-                    'SubjectArea': '主体区域',
-                    'MakerNote': '制造商注释',
-                    'UserComment': '用户注释',
-                    'FlashPixVersion': 'FlashPix版本',
-                    'ColorSpace': '色彩空间',
-                    'PixelXDimension': '像素X尺寸',
-                    'PixelYDimension': '像素Y尺寸',
-                    'RelatedSoundFile': '相关音频文件',
-                    'InteroperabilityIFDPointer': '互操作性IFD指针',
-                    'FlashEnergy': '闪光灯能量',
-                    'SpatialFrequencyResponse': '空间频率响应',
-                    'FocalPlaneXResolution': '焦平面X分辨率',
-                    'FocalPlaneYResolution': '焦平面Y分辨率',
-                    'FocalPlaneResolutionUnit': '焦平面分辨率单位',
-                    'SubjectLocation': '主体位置',
-                    'ExposureIndex': '曝光指数',
-                    'SensingMethod': '感光方法',
-                    'FileSource': '文件源',
-                    'SceneType': '场景类型',
-                    'CFAPattern': 'CFA模式',
-                    'CustomRendered': '自定义渲染',
-                    'ExposureMode': '曝光模式',
-                    'WhiteBalance': '白平衡',
-                    'DigitalZoomRatio': '数字变焦比',
-                    'FocalLengthIn35mmFilm': '35mm胶片等效焦距',
-                    'SceneCaptureType': '场景捕获类型',
-                    'GainControl': '增益控制',
-                    'Contrast': '对比度',
-                    'Saturation': '饱和度',
-                    'Sharpness': '锐度',
-                    'SubjectDistanceRange': '主体距离范围',
-                    'ImageUniqueID': '图像唯一ID',
-                    'OwnerName': '所有者姓名',
-                    'SerialNumber': '序列号',
-                    'LensMake': '镜头品牌',
-                    'LensModel': '镜头型号',
-                    'LensSpecification': '镜头规格',
-                    'LensSerialNumber': '镜头序列号',
-                    'GPSLatitude': 'GPS纬度',
-                    'GPSLongitude': 'GPS经度',
-                    'GPSAltitude': 'GPS海拔',
-                    'GPSTimeStamp': 'GPS时间戳',
-                    'GPSDateStamp': 'GPS日期戳',
-                    'GPSProcessingMethod': 'GPS处理方法',
-                    'GPSAreaInformation': 'GPS区域信息',
-                    'GPSDifferential': 'GPS差分',
-                    'GPSVersionID': 'GPS版本ID'
-                }
-                
-                # 提取EXIF数据
-                for tag_id, value in exif_data.items():
-                    tag_name = TAGS.get(tag_id, tag_id)
-                    if tag_name in exif_tags:
-                        chinese_name = exif_tags[tag_name]
-                        
-                        # 格式化特殊值
-                        if tag_name == 'ExposureTime':
-                            if isinstance(value, tuple) and len(value) == 2:
-                                formatted_value = f"{value[0]}/{value[1]}秒"
-                            else:
-                                formatted_value = str(value)
-                        elif tag_name == 'FNumber':
-                            if isinstance(value, tuple) and len(value) == 2:
-                                formatted_value = f"f/{value[0]}/{value[1]}"
-                            else:
-                                formatted_value = f"f/{value}"
-                        elif tag_name == 'ISOSpeedRatings':
-                            formatted_value = f"ISO {value}"
-                        elif tag_name == 'FocalLength':
-                            if isinstance(value, tuple) and len(value) == 2:
-                                formatted_value = f"{value[0]}/{value[1]}mm"
-                            else:
-                                formatted_value = f"{value}mm"
-                        elif tag_name == 'DateTimeOriginal':
-                            formatted_value = str(value)
-                        else:
-                            formatted_value = str(value)
-                        
-                        exif_info[chinese_name] = formatted_value
-                
-                return exif_info
-                
-        except Exception as e:
-            print(f"提取EXIF数据时出错: {str(e)}")
-            return None
+    def do_PUT(self):
+        """处理PUT请求：新增或整体替换单张照片"""
+        self.dispatch_photo_request('PUT')
     
-    def generate_thumbnail(self, image_path):
-        """为图片生成缩略图"""
-        try:
-            # 创建thumbnails文件夹
-            if not os.path.exists('thumbnails'):
-                os.makedirs('thumbnails')
-            
-            # 生成缩略图文件名
-            filename = os.path.basename(image_path)
-            thumbnail_path = os.path.join('thumbnails', filename)
-            
-            # 如果缩略图已存在，跳过
-            if os.path.exists(thumbnail_path):
-                return thumbnail_path
-            
-            # 打开图片
-            with Image.open(image_path) as img:
-                # 转换为RGB模式
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # 计算缩略图尺寸
-                max_width = 400
-                max_height = 300
-                width, height = img.size
-                
-                # 计算缩放比例
-                ratio = min(max_width / width, max_height / height)
-                
-                # 如果图片已经很小，直接复制
-                if ratio >= 1:
-                    shutil.copy2(image_path, thumbnail_path)
-                else:
-                    # 计算新尺寸
-                    new_width = int(width * ratio)
-                    new_height = int(height * ratio)
-                    
-                    # 生成缩略图
-                    thumbnail = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    
-                    # 保存缩略图
-                    thumbnail.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-            
-            return thumbnail_path
-            
-        except Exception as e:
-            print(f"生成缩略图时出错: {str(e)}")
-            return None
+    def do_PATCH(self):
+        """处理PATCH请求：修改单张照片的部分字段"""
+        self.dispatch_photo_request('PATCH')
+    
+    def do_DELETE(self):
+        """处理DELETE请求：删除单张照片"""
+        self.dispatch_photo_request('DELETE')
+    
+    def dispatch_photo_request(self, method):
+        match = PHOTO_PATH_PATTERN.match(self.path)
+        if not match:
+            self.send_response(404)
+            self.end_headers()
+            self.wfile.write(b'Not Found')
+            return
+        self.handle_photo_request(method, parse_photo_id(unquote(match.group(1))))
     
     def handle_copy_image(self):
-        """处理图片复制请求"""
+        """处理图片复制请求（支持一次上传多张图片）"""
         try:
-            # 解析multipart/form-data
-            form = cgi.FieldStorage(
-                fp=self.rfile,
-                headers=self.headers,
-                environ={'REQUEST_METHOD': 'POST'}
-            )
-            
-            # 获取上传的图片文件
-            if 'image' in form:
-                image_file = form['image']
-                if image_file.filename:
-                    # 创建data文件夹（如果不存在）
-                    if not os.path.exists('data'):
-                        os.makedirs('data')
-                    
-                    # 创建thumbnails文件夹（如果不存在）
-                    if not os.path.exists('thumbnails'):
-                        os.makedirs('thumbnails')
-                    
-                    # 生成唯一文件名
-                    timestamp = int(time.time() * 1000)
-                    file_name = f"{timestamp}_{image_file.filename}"
-                    file_path = os.path.join('data', file_name)
-                    thumbnail_path = os.path.join('thumbnails', file_name)
-                    
-                    # 保存原图到data文件夹
-                    with open(file_path, 'wb') as f:
-                        f.write(image_file.file.read())
-                    
-                    # 生成缩略图
-                    thumbnail_generated = False
-                    if PIL_AVAILABLE:
-                        try:
-                            # 打开图片
-                            with Image.open(file_path) as img:
-                                # 转换为RGB模式（处理RGBA等格式）
-                                if img.mode in ('RGBA', 'LA', 'P'):
-                                    img = img.convert('RGB')
-                                
-                                # 计算缩略图尺寸（保持宽高比）
-                                max_width = 400
-                                max_height = 300
-                                
-                                # 获取原始尺寸
-                                width, height = img.size
-                                
-                                # 计算缩放比例
-                                ratio = min(max_width / width, max_height / height)
-                                
-                                # 如果图片已经很小，不需要缩放
-                                if ratio >= 1:
-                                    # 直接复制原图作为缩略图
-                                    shutil.copy2(file_path, thumbnail_path)
-                                else:
-                                    # 计算新尺寸
-                                    new_width = int(width * ratio)
-                                    new_height = int(height * ratio)
-                                    
-                                    # 生成缩略图
-                                    thumbnail = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                    
-                                    # 保存缩略图，优化质量
-                                    thumbnail.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-                                
-                                thumbnail_generated = True
-                                print(f"✅ 缩略图已生成：{thumbnail_path}")
-                                
-                        except Exception as e:
-                            print(f"⚠️  生成缩略图时出错：{str(e)}")
-                            # 如果生成缩略图失败，复制原图作为缩略图
-                            shutil.copy2(file_path, thumbnail_path)
-                            thumbnail_generated = True
-                    else:
-                        # 如果没有Pillow库，直接复制原图作为缩略图
-                        shutil.copy2(file_path, thumbnail_path)
-                        thumbnail_generated = True
-                    
+            # 创建data文件夹（如果不存在）
+            if not os.path.exists('data'):
+                os.makedirs('data')
+
+            # 创建thumbnails文件夹（如果不存在）
+            if not os.path.exists('thumbnails'):
+                os.makedirs('thumbnails')
+
+            # 流式解析multipart/form-data：文件按块写入data文件夹中的临时文件，同时计算哈希
+            content_length = self.headers.get('Content-Length')
+            try:
+                fields, uploads = parse_multipart(
+                    self.rfile,
+                    self.headers.get('Content-Type'),
+                    int(content_length) if content_length else None,
+                    'data',
+                    max_file_bytes=self.max_upload_bytes,
+                    max_request_bytes=self.max_request_bytes
+                )
+            except UploadError as e:
+                # 请求体可能没有读完，不能继续复用这个连接
+                self.close_connection = True
+                self.send_response(e.status)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.wfile.write(json.dumps({'success': False, 'error': str(e)}).encode())
+                return
+
+            try:
+                # 空文件不保存；没有移动到最终位置的临时文件（空文件、中途出错）在finally中删除
+                nonempty = [upload for upload in uploads if upload.size > 0]
+                if not nonempty:
+                    # 如果没有文件，返回错误
                     result = {
-                        'success': True,
-                        'filePath': f'data/{file_name}',
-                        'thumbnailPath': f'thumbnails/{file_name}' if thumbnail_generated else None,
-                        'message': f'图片已保存到：{file_path}' + (f'，缩略图已生成：{thumbnail_path}' if thumbnail_generated else '，缩略图生成失败')
+                        'success': False,
+                        'error': '没有找到图片文件'
                     }
-                    
-                    self.send_response(200)
+
+                    self.send_response(400)
                     self.send_header('Content-type', 'application/json')
                     self.send_header('Access-Control-Allow-Origin', '*')
                     self.end_headers()
                     self.wfile.write(json.dumps(result).encode())
                     return
-            
-            # 如果没有文件，返回错误
-            result = {
-                'success': False,
-                'error': '没有找到图片文件'
-            }
-            
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
-            
+
+                saved = []
+                for upload in nonempty:
+                    # 按上传时计算的内容哈希放入分片目录，临时文件原子重命名为最终文件；
+                    # 内容相同的图片已经存在时直接使用已有文件
+                    file_path = shard_path('data', upload.sha256, os.path.splitext(upload.filename)[1])
+                    thumbnail_path = thumbnail_path_for(file_path).replace(os.sep, '/')
+                    if not os.path.exists(file_path):
+                        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                        os.replace(upload.path, file_path)
+                    storage_index.record(sources=[(file_path, upload.sha256, upload.size)])
+
+                    if not PIL_AVAILABLE:
+                        # 如果没有Pillow库，直接复制原图作为缩略图
+                        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+                        shutil.copy2(file_path, thumbnail_path)
+
+                    saved.append({
+                        'filePath': file_path,
+                        'thumbnailPath': thumbnail_path,
+                        'originalName': upload.filename,
+                        'size': upload.size,
+                        'sha256': upload.sha256
+                    })
+
+                # 文件已落盘即返回，缩略图、派生图和EXIF由后台任务生成后写入照片目录
+                job = None
+                if PIL_AVAILABLE:
+                    sources = list(dict.fromkeys(item['filePath'] for item in saved))
+                    content_hashes = {item['filePath']: item['sha256'] for item in saved}
+                    job = job_manager.submit('ingest', run_ingest_job, sources, content_hashes, total=len(sources))
+
+                # 单张上传时保持原有的响应字段，多张时通过files返回每张图片
+                first = saved[0]
+                result = {
+                    'success': True,
+                    'filePath': first['filePath'],
+                    'thumbnailPath': first['thumbnailPath'],
+                    'sha256': first['sha256'],
+                    'files': saved,
+                    'jobId': job.id if job else None,
+                    'statusUrl': f'/jobs/{job.id}' if job else None,
+                    'message': (f'已保存{len(saved)}张图片到data文件夹' if len(saved) > 1 else f"图片已保存到：{first['filePath']}")
+                               + ('，缩略图正在后台生成' if job else '，已复制原图作为缩略图')
+                }
+
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(json.dumps(result).encode())
+            finally:
+                for upload in uploads:
+                    upload.discard()
+
         except Exception as e:
             self.send_response(500)
             self.send_header('Content-type', 'application/json')
@@ -394,33 +1302,38 @@ class AdminHandler(BaseHTTPRequestHandler):
     def handle_save_json(self):
         """处理JSON保存请求"""
         try:
-            print(f"收到保存JSON请求，路径: {self.path}")
-            print(f"请求头: {dict(self.headers)}")
-            
-            content_length = int(self.headers['Content-Length'])
-            json_data = self.rfile.read(content_length)
-            
-            print(f"JSON数据长度: {content_length}")
-            print(f"JSON数据预览: {json_data[:200]}...")
+            # 写入数据库之前先完整解析并检查结构，格式不正确的请求不会改动目录
+            try:
+                photos_data = self.read_json_body()
+                validate_catalog(photos_data)
+                expected_generation = self.expected_generation()
+            except ValueError as e:
+                self.send_json_response(400, {'success': False, 'error': str(e)})
+                return
             
-            # 保存到photos.json文件
-            with open('photos.json', 'w', encoding='utf-8') as f:
-                f.write(json_data.decode('utf-8'))
+            # 保存到照片目录：只改写内容或顺序有变化的照片
+            with catalog_lock:
+                # 合并后台任务为刚上传的照片生成的缩略图、派生图和EXIF
+                if pending_photo_updates:
+                    apply_pending_updates(photos_data['photos'])
+                changed = catalog_store.replace_all(photos_data, expected_generation=expected_generation)
+                generation = catalog_store.last_generation
+                if changed:
+                    # 短时间内的多次保存合并为一次photos.json导出
+                    export_scheduler.schedule()
             
-            print(f"JSON文件已保存到: photos.json")
+            print(f"照片目录已保存，{changed} 张照片有变化")
             
-            result = {
+            self.send_json_response(200, {
                 'success': True,
                 'message': 'JSON文件已保存',
+                'changed': changed,
+                'generation': generation,
                 'timestamp': time.time()
-            }
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            })
             
+        except GenerationConflict as e:
+            self.send_json_response(412, {'success': False, 'error': str(e), 'generation': e.current})
         except Exception as e:
             print(f"保存JSON时出错: {str(e)}")
             self.send_response(500)
@@ -434,20 +1347,7 @@ class AdminHandler(BaseHTTPRequestHandler):
         try:
             print("开始提取EXIF数据...")
             
-            # 检查photos.json是否存在
-            if not os.path.exists('photos.json'):
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'photos.json文件不存在'}).encode())
-                return
-            
-            # 读取photos.json
-            with open('photos.json', 'r', encoding='utf-8') as f:
-                photos_data = json.load(f)
-            
-            photos = photos_data.get('photos', [])
+            photos = catalog_store.list_photos()
             if not photos:
                 self.send_response(400)
                 self.send_header('Content-type', 'application/json')
@@ -456,52 +1356,32 @@ class AdminHandler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps({'error': '没有找到照片数据'}).encode())
                 return
             
-            # 检查Pillow库是否可用
-            if not PIL_AVAILABLE:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Pillow库未安装，无法提取EXIF数据'}).encode())
-                return
-            
-            processed = 0
-            updated = 0
+            processed = len(photos)
             
-            # 处理每张照片
+            # 收集需要处理的照片
+            sources = []
             for photo in photos:
-                processed += 1
                 src = photo.get('src', '')
-                
                 if not src or not os.path.exists(src):
                     print(f"跳过不存在的文件: {src}")
                     continue
-                
-                try:
-                    # 提取EXIF数据
-                    exif_data = self.extract_exif_from_image(src)
-                    if exif_data:
-                        photo['exif'] = exif_data
-                        updated += 1
-                        print(f"✅ 已提取EXIF: {src}")
-                    else:
-                        print(f"⚠️  无EXIF数据: {src}")
-                        
-                except Exception as e:
-                    print(f"❌ 提取EXIF失败 {src}: {str(e)}")
+                if src not in sources:
+                    sources.append(src)
             
-            # 保存更新后的photos.json
-            with open('photos.json', 'w', encoding='utf-8') as f:
-                json.dump(photos_data, f, ensure_ascii=False, indent=2)
+            # 提交后台任务，立即返回任务ID，进度通过/jobs/<id>查询
+            existing = [photo['src'] for photo in photos
+                        if photo.get('exif') and photo.get('src') and not is_legacy_exif(photo['exif'])]
+            job = job_manager.submit('extract-exif', run_exif_job, sources, existing, total=len(sources))
             
             result = {
                 'success': True,
+                'jobId': job.id,
+                'statusUrl': f'/jobs/{job.id}',
                 'processed': processed,
-                'updated': updated,
-                'message': f'EXIF提取完成，处理了{processed}张照片，更新了{updated}张'
+                'message': f'EXIF提取任务已开始，共{len(sources)}张照片'
             }
             
-            self.send_response(200)
+            self.send_response(202)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
@@ -520,20 +1400,7 @@ class AdminHandler(BaseHTTPRequestHandler):
         try:
             print("开始生成缩略图...")
             
-            # 检查photos.json是否存在
-            if not os.path.exists('photos.json'):
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'photos.json文件不存在'}).encode())
-                return
-            
-            # 读取photos.json
-            with open('photos.json', 'r', encoding='utf-8') as f:
-                photos_data = json.load(f)
-            
-            photos = photos_data.get('photos', [])
+            photos = catalog_store.list_photos()
             if not photos:
                 self.send_response(400)
                 self.send_header('Content-type', 'application/json')
@@ -551,47 +1418,30 @@ class AdminHandler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps({'error': 'Pillow库未安装，无法生成缩略图'}).encode())
                 return
             
-            # 创建thumbnails文件夹
-            if not os.path.exists('thumbnails'):
-                os.makedirs('thumbnails')
-            
-            processed = 0
-            generated = 0
+            processed = len(photos)
             
-            # 处理每张照片
+            # 收集需要处理的照片
+            sources = []
             for photo in photos:
-                processed += 1
                 src = photo.get('src', '')
-                
                 if not src or not os.path.exists(src):
                     print(f"跳过不存在的文件: {src}")
                     continue
-                
-                try:
-                    # 生成缩略图
-                    thumbnail_path = self.generate_thumbnail(src)
-                    if thumbnail_path:
-                        photo['thumbnailPath'] = thumbnail_path
-                        generated += 1
-                        print(f"✅ 已生成缩略图: {thumbnail_path}")
-                    else:
-                        print(f"⚠️  缩略图生成失败: {src}")
-                        
-                except Exception as e:
-                    print(f"❌ 生成缩略图失败 {src}: {str(e)}")
+                if src not in sources:
+                    sources.append(src)
             
-            # 保存更新后的photos.json
-            with open('photos.json', 'w', encoding='utf-8') as f:
-                json.dump(photos_data, f, ensure_ascii=False, indent=2)
+            # 提交后台任务，立即返回任务ID，进度通过/jobs/<id>查询
+            job = job_manager.submit('generate-thumbnails', run_thumbnail_job, sources, total=len(sources))
             
             result = {
                 'success': True,
+                'jobId': job.id,
+                'statusUrl': f'/jobs/{job.id}',
                 'processed': processed,
-                'generated': generated,
-                'message': f'缩略图生成完成，处理了{processed}张照片，生成了{generated}张缩略图'
+                'message': f'缩略图生成任务已开始，共{len(sources)}张照片'
             }
             
-            self.send_response(200)
+            self.send_response(202)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
@@ -605,20 +1455,214 @@ class AdminHandler(BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(json.dumps({'error': str(e)}).encode())
     
+    def handle_job_status(self, job):
+        """返回后台任务的状态和进度"""
+        if job is None:
+            self.send_response(404)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': '任务不存在'}).encode())
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(job.to_dict()).encode())
+    
+    def handle_photo_request(self, method, photo_id=None):
+        """单张照片接口，只读写数据库中的一行
+
+        GET读取，PUT新增或整体替换，PATCH合并部分字段，DELETE删除，
+        POST /api/photos 新增照片（没有ID时自动分配）。
+        写入请求可以带 If-Match: <目录版本号>，目录在此之后被修改过时返回412。
+        """
+        try:
+            if method != 'GET':
+                try:
+                    expected_generation = self.expected_generation()
+                except ValueError as e:
+                    self.send_json_response(400, {'success': False, 'error': str(e)})
+                    return
+            
+            if method == 'GET':
+                photo = catalog_store.get(photo_id)
+                if photo is None:
+                    self.send_json_response(404, {'error': '照片不存在'})
+                else:
+                    self.send_json_response(200, photo)
+                return
+            
+            if method == 'DELETE':
+                # 与其他写入一样在catalog_lock中删除并标记导出，并发的导出不会用删除前的快照把照片写回photos.json
+                with catalog_lock:
+                    if not catalog_store.delete(photo_id, expected_generation=expected_generation):
+                        self.send_json_response(404, {'error': '照片不存在'})
+                        return
+                    generation = catalog_store.last_generation
+                    export_scheduler.schedule()
+                self.send_json_response(200, {'success': True, 'id': photo_id, 'generation': generation})
+                return
+            
+            try:
+                fields = self.read_json_body()
+            except ValueError as e:
+                self.send_json_response(400, {'success': False, 'error': str(e)})
+                return
+            
+            with catalog_lock:
+                if method == 'PATCH':
+                    fields.pop('id', None)
+                    photo = catalog_store.update(photo_id, fields, expected_generation=expected_generation)
+                    if photo is None:
+                        self.send_json_response(404, {'error': '照片不存在'})
+                        return
+                    created = False
+                else:
+                    if photo_id is not None:
+                        fields['id'] = photo_id
+                    # 合并后台任务为刚上传的照片生成的缩略图、派生图和EXIF
+                    apply_pending_updates([fields])
+                    photo, created = catalog_store.upsert(fields, expected_generation=expected_generation)
+                generation = catalog_store.last_generation
+                export_scheduler.schedule()
+            
+            self.send_json_response(201 if created else 200, {'success': True, 'photo': photo,
+                                                              'generation': generation})
+            
+        except GenerationConflict as e:
+            self.send_json_response(412, {'success': False, 'error': str(e), 'generation': e.current})
+        except Exception as e:
+            print(f"照片接口处理失败: {str(e)}")
+            self.send_json_response(500, {'error': str(e)})
+    
+    def handle_photo_query(self, params):
+        """分页查询照片：按标签筛选、排序，只返回一页照片和总数、标签计数"""
+        try:
+            try:
+                tag, page, size, sort = parse_page_params(params)
+            except ValueError as e:
+                self.send_json_response(400, {'error': str(e)})
+                return
+            
+            photos, total = catalog_store.query(tag=tag, page=page, size=size, sort=sort)
+            self.send_json_response(200, {
+                'photos': photos,
+                'page': page,
+                'size': size,
+                'sort': sort,
+                'tag': tag,
+                'total': total,
+                'totalPages': max(1, -(-total // size)),
+                'totalPhotos': catalog_store.count(),
+                'generation': catalog_store.generation(),
+                'tags': catalog_store.tag_counts()
+            })
+            
+        except Exception as e:
+            print(f"照片查询失败: {str(e)}")
+            self.send_json_response(500, {'error': str(e)})
+    
+    def handle_search(self, params):
+        """全文搜索：标题、描述、标签、相机/镜头型号和拍摄日期，最后一个词按前缀匹配"""
+        try:
+            query = params.get('q', [''])[0]
+            try:
+                tag, page, size, sort = parse_page_params(params)
+            except ValueError as e:
+                self.send_json_response(400, {'error': str(e)})
+                return
+            
+            photos, total, exact = catalog_store.search(query, tag=tag, page=page, size=size, sort=sort)
+            self.send_json_response(200, {
+                'q': query,
+                'photos': photos,
+                'page': page,
+                'size': size,
+                'sort': sort,
+                'tag': tag,
+                'total': total,
+                'totalExact': exact,
+                'totalPages': max(1, -(-total // size))
+            })
+            
+        except Exception as e:
+            print(f"搜索失败: {str(e)}")
+            self.send_json_response(500, {'error': str(e)})
+    
+    def expected_generation(self):
+        """乐观并发：If-Match请求头中的目录版本号，没有该请求头或为*时返回None"""
+        value = self.headers.get('If-Match')
+        if value is None or value.strip() == '*':
+            return None
+        value = value.strip().removeprefix('W/').strip('"')
+        if not value.isdigit():
+            raise ValueError('If-Match必须是目录版本号（generation）')
+        return int(value)
+    
+    def read_json_body(self):
+        """读取JSON对象请求体，格式不正确或过大时抛出ValueError"""
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if content_length > MAX_JSON_BYTES:
+            # 请求体没有读取，不能继续复用这个连接
+            self.close_connection = True
+            raise ValueError(f'请求体超过上限 {MAX_JSON_BYTES // (1024 * 1024)}MB')
+        data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+        if not isinstance(data, dict):
+            raise ValueError('请求体必须是JSON对象')
+        return data
+    
+    def send_json_response(self, status, data):
+        """发送JSON响应"""
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(data, ensure_ascii=False).encode())
+    
     def do_OPTIONS(self):
         """处理CORS预检请求"""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, PATCH, DELETE, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-Match')
         self.end_headers()
 
-def run_server(port=8000):
+def run_server(port=8000, workers=DEFAULT_WORKERS, backlog=DEFAULT_BACKLOG, cache_bytes=DEFAULT_CACHE_BYTES,
+               max_upload_bytes=MAX_FILE_BYTES, export_delay=DEFAULT_EXPORT_DELAY, access_log=DEFAULT_ACCESS_LOG,
+               watch=False, watch_interval=DEFAULT_WATCH_INTERVAL, watch_debounce=DEFAULT_WATCH_DEBOUNCE):
     """启动服务器"""
-    global httpd
+    global httpd, directory_watcher
+    static_cache.max_bytes = cache_bytes
+    export_scheduler.delay = export_delay
+    AdminHandler.access_log = access_log
+    AdminHandler.max_upload_bytes = max_upload_bytes
+    AdminHandler.max_request_bytes = max(MAX_REQUEST_BYTES, max_upload_bytes)
+    # 首次启动或photos.json在服务器之外被修改过（手动编辑、git pull）时导入到数据库
+    imported = catalog_store.sync_from_json()
+    if imported is not None:
+        print(f"📥 已从photos.json导入 {imported} 张照片到照片目录数据库")
+    sharded = storage_index.load()
+    if sharded or storage_index.aliases:
+        print(f"🗂️  路径索引：分片目录中 {sharded} 张原图，{len(storage_index.aliases)} 条旧路径映射")
     server_address = ('127.0.0.1', port)
-    httpd = HTTPServer(server_address, AdminHandler)
+    httpd = ThreadPoolHTTPServer(server_address, AdminHandler, workers=workers, backlog=backlog)
     print(f"🚀 本地服务器已启动，端口：{port}")
+    print(f"🧵 工作线程：{workers}，监听队列：{backlog}")
+    print(f"🗄️  静态文件缓存：{cache_bytes // (1024 * 1024)}MB")
+    print(f"📤 单个上传文件上限：{max_upload_bytes // (1024 * 1024)}MB")
+    if watch and not PIL_AVAILABLE:
+        print("⚠️  Pillow库未安装，无法监视data/自动生成缩略图")
+    elif watch:
+        # 以派生图缓存清单为基准，服务器停止期间新增或修改的图片启动后立即处理
+        with derivative_lock:
+            baseline = manifest_baseline(DerivativeManifest())
+        directory_watcher = DirectoryWatcher(submit_watched_changes, baseline=baseline, debounce=watch_debounce,
+                                             poll_interval=watch_interval).start()
+        print(f"👀 正在监视data/（{directory_watcher.mode}）")
     print(f"📁 主页地址：http://localhost:{port}/")
     print(f"📁 管理面板地址：http://localhost:{port}/admin.html")
     print(f"💡 按 Ctrl+C 停止服务器")
@@ -633,9 +1677,59 @@ def run_server(port=8000):
     finally:
         if httpd:
             print("正在关闭服务器...")
+            if directory_watcher is not None:
+                directory_watcher.stop()
+            job_manager.shutdown()
+            export_scheduler.cancel()
+            # 停止前导出尚未写入photos.json的修改，静态托管使用的文件保持最新
+            export_catalog()
             httpd.shutdown()
             httpd.server_close()
             print("服务器已停止")
 
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='照片画廊本地服务器')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口（默认8000）')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'并发工作线程数（默认{DEFAULT_WORKERS}）')
+    parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG,
+                        help=f'监听队列长度（默认{DEFAULT_BACKLOG}）')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help='静态文件内存缓存容量，单位MB，0表示关闭（默认%(default)s）')
+    parser.add_argument('--max-upload', type=int, default=MAX_FILE_BYTES // (1024 * 1024),
+                        help='单个上传文件大小上限，单位MB（默认%(default)s）')
+    parser.add_argument('--export-delay', type=float, default=DEFAULT_EXPORT_DELAY,
+                        help='目录修改后延迟多少秒导出photos.json，期间的多次保存合并为一次写入，'
+                             '0表示只在被请求或停止时导出（默认%(default)s）')
+    parser.add_argument('--access-log', choices=ACCESS_LOG_LEVELS, default=DEFAULT_ACCESS_LOG,
+                        help='访问日志：all 每个请求，errors 只记录出错的请求，off 关闭（默认%(default)s）')
+    parser.add_argument('--watch', action='store_true',
+                        help='监视data/文件夹，新增或修改的图片自动生成缩略图并提取EXIF')
+    parser.add_argument('--watch-interval', type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help='没有inotify时轮询data/的间隔，单位秒（默认%(default)s）')
+    parser.add_argument('--watch-debounce', type=float, default=DEFAULT_WATCH_DEBOUNCE,
+                        help='最后一次文件变化后等待多少秒再处理，一次复制的多张图片合并为一个任务（默认%(default)s）')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers 必须大于0')
+    if args.backlog < 1:
+        parser.error('--backlog 必须大于0')
+    if args.cache_size < 0:
+        parser.error('--cache-size 不能为负数')
+    if args.max_upload < 1:
+        parser.error('--max-upload 必须大于0')
+    if args.export_delay < 0:
+        parser.error('--export-delay 不能为负数')
+    if args.watch_interval <= 0:
+        parser.error('--watch-interval 必须大于0')
+    if args.watch_debounce < 0:
+        parser.error('--watch-debounce 不能为负数')
+    return args
+
 if __name__ == '__main__':
-    run_server()
+    args = parse_args()
+    run_server(port=args.port, workers=args.workers, backlog=args.backlog,
+               cache_bytes=args.cache_size * 1024 * 1024, max_upload_bytes=args.max_upload * 1024 * 1024,
+               export_delay=args.export_delay, access_log=args.access_log,
+               watch=args.watch, watch_interval=args.watch_interval, watch_debounce=args.watch_debounce)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+原图和缩略图的分片存储布局与路径索引
+原图按内容哈希分两级目录保存：data/ab/cd/<sha256>.<扩展名>，缩略图使用相同的相对路径（thumbnails/ab/cd/...），
+每个目录最多几百个文件，十万张以上的图库也不会出现单个目录过大导致查找和列目录变慢。
+路径索引（storage.db）记录分片目录中的全部原图，以及迁移前的平铺路径到分片路径的映射：
+- 服务器启动时把映射读入内存，旧的photos.json、书签等引用的平铺路径查字典即可找到文件，请求路径上不列目录
+- 批量脚本从索引读取原图列表，不需要遍历所有分片目录
+平铺布局迁移到分片布局使用 migrate_storage.py。
+"""
+
+import os
+import sqlite3
+import threading
+
+# 分片的根目录
+DATA_DIR = 'data'
+THUMBNAIL_DIR = 'thumbnails'
+
+# 两级目录，每级取哈希的两个十六进制字符（每级256个子目录）
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+STORAGE_INDEX_PATH = 'storage.db'
+
+# 等待其他连接释放写锁的最长时间（毫秒）
+BUSY_TIMEOUT_MS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    path TEXT PRIMARY KEY,
+    target TEXT NOT NULL
+);
+"""
+
+
+def shard_path(root, digest, extension):
+    """分片路径：<root>/ab/cd/<digest><扩展名>（URL格式，使用/分隔，扩展名统一小写）"""
+    shards = [digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH] for level in range(SHARD_LEVELS)]
+    return '/'.join([root.rstrip('/'), *shards, digest + extension.lower()])
+
+
+def thumbnail_path_for(source_path, thumbnail_dir=THUMBNAIL_DIR, data_dir=DATA_DIR):
+    """原图对应的缩略图路径：data/下的相对路径原样放到thumbnails/下
+
+    平铺布局为 thumbnails/<文件名>，分片布局为 thumbnails/ab/cd/<sha256>.<扩展名>，
+    与前端从src推算缩略图路径（data/ 替换为 thumbnails/）的规则一致。
+    """
+    parts = source_path.replace(os.sep, '/').split('/')
+    if len(parts) > 2 and parts[0] == data_dir:
+        return os.path.join(thumbnail_dir, *parts[1:])
+    return os.path.join(thumbnail_dir, parts[-1])
+
+
+class PathIndex:
+    """分片布局的路径索引
+
+    写入（上传、迁移）逐行进入SQLite；读取路径映射只查内存中的字典（load()时读入）。
+    """
+
+    def __init__(self, path=STORAGE_INDEX_PATH):
+        self.path = path
+        self.aliases = {}
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def load(self):
+        """把路径映射读入内存，返回分片目录中的原图数"""
+        with self._lock:
+            self.aliases = dict(self.connection.execute('SELECT path, target FROM aliases'))
+            return self.connection.execute('SELECT COUNT(*) FROM sources').fetchone()[0]
+
+    def resolve(self, path):
+        """迁移前的平铺路径换成分片路径，其他路径原样返回（只查内存，不访问磁盘）"""
+        return self.aliases.get(path, path)
+
+    def sources(self):
+        """分片目录中的全部原图路径"""
+        with self._lock:
+            return [row[0] for row in self.connection.execute('SELECT path FROM sources ORDER BY path')]
+
+    def record(self, sources=(), aliases=None):
+        """在一个事务中登记原图 [(路径, sha256, 大小)] 和路径映射 {旧路径: 新路径}"""
+        aliases = aliases or {}
+        with self._lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO sources (path, sha256, size) VALUES (?, ?, ?)',
+                                        list(sources))
+            self.connection.executemany('INSERT OR REPLACE INTO aliases (path, target) VALUES (?, ?)',
+                                        list(aliases.items()))
+            self.aliases.update(aliases)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""exif_reader 对损坏的JPEG段长度的处理"""
+
+import io
+import struct
+
+from exif_reader import read_exif_stream
+
+
+class CountingBytesIO(io.BytesIO):
+    """记录读取的总字节数"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def tiff_with_make(make):
+    """只有一个Make（0x010F）标签的小端TIFF"""
+    value = make.encode('ascii') + b'\x00'
+    ifd = struct.pack('<H', 1) + struct.pack('<HHLL', 0x010F, 2, len(value), 26) + struct.pack('<L', 0)
+    return b'II*\x00' + struct.pack('<L', 8) + ifd + value
+
+
+def app1(payload, length=None):
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2 if length is None else length) + payload
+
+
+def test_valid_app1_is_parsed():
+    data = b'\xff\xd8' + app1(b'Exif\x00\x00' + tiff_with_make('Canon')) + b'\xff\xda'
+    assert read_exif_stream(io.BytesIO(data)) == {0x010F: 'Canon'}
+
+
+def test_corrupt_segment_length_stops_without_reading_rest_of_file():
+    for length in (0, 1):
+        f = CountingBytesIO(b'\xff\xd8' + app1(b'', length) + b'\x00' * 1024 * 1024)
+        assert read_exif_stream(f) is None
+        assert f.bytes_read < 64
+
+
+def test_corrupt_length_on_skipped_segment_does_not_seek_backwards():
+    f = CountingBytesIO(b'\xff\xd8' + b'\xff\xe0\x00\x00' + b'\xff\xd8' * 100)
+    assert read_exif_stream(f) is None
+    assert f.bytes_read < 64
+
+
+def test_truncated_app1_returns_no_tags():
+    data = b'\xff\xd8' + app1(b'Exif\x00\x00' + tiff_with_make('Canon'), 4000)[:30]
+    assert not read_exif_stream(io.BytesIO(data))
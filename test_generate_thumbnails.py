@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""generate_thumbnails.rendition_plan 的档位边界"""
+
+from generate_thumbnails import rendition_plan
+
+
+def test_source_as_wide_as_largest_width_keeps_that_width():
+    assert rendition_plan(2560, 1440) == [(400, 225), (800, 450), (1600, 900), (2560, 1440)]
+
+
+def test_source_width_equal_to_a_middle_width_is_not_duplicated():
+    assert rendition_plan(800, 600) == [(400, 300), (800, 600)]
+
+
+def test_source_between_widths_adds_original_width():
+    assert rendition_plan(1000, 500) == [(400, 200), (800, 400), (1000, 500)]
+
+
+def test_source_wider_than_largest_width_is_not_kept():
+    assert [width for width, _ in rendition_plan(4000, 3000)] == [400, 800, 1600, 2560]
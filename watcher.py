@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+data文件夹监视脚本
+新增或被修改的图片自动生成缩略图、派生图、占位信息并提取EXIF，不需要手动运行批量脚本。
+- Linux上使用inotify，只在文件写入完成（或被移入）时收到通知，不扫描目录
+- 其他平台按间隔用os.scandir轮询，与上一次的 (路径, 大小, 修改时间) 快照比较
+- 一批连续到达的文件等待debounce秒没有新变化、且大小不再变化后才一起处理
+- 启动时以派生图缓存清单为基准，只处理服务器停止期间新增或被修改的图片
+运行方式：python watcher.py [--debounce 秒] [--poll 秒] [--workers N]
+也可以用 python server.py --watch 在服务器中运行。
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import signal
+import argparse
+import threading
+import ctypes
+import ctypes.util
+
+from generate_thumbnails import (
+    IMAGE_EXTENSIONS, PIL_AVAILABLE, DEFAULT_WORKERS, generate_thumbnails_parallel, record_results,
+    record_exif_state, print_progress
+)
+from derivative_cache import DerivativeManifest
+from extract_exif import ExifState
+
+# 监视的目录
+WATCH_DIR = 'data'
+
+# 最后一次变化后等待多久再处理（秒），一次复制很多文件时合并为一批
+DEFAULT_DEBOUNCE = 1.0
+# 没有inotify时的轮询间隔（秒）
+DEFAULT_POLL_INTERVAL = 2.0
+# 持续有文件写入时，第一次变化后最多等待多久就处理已经写完的文件（秒）
+MAX_BATCH_DELAY = 10.0
+
+# inotify事件：写入完成、移入、删除、移出，以及目录本身被删除/移走和事件队列溢出
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+INOTIFY_EVENT = struct.Struct('iIII')
+INOTIFY_READ_SIZE = 64 * 1024
+
+
+def load_inotify():
+    """加载libc中的inotify函数；非Linux或不可用时返回None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+INOTIFY = load_inotify()
+INOTIFY_AVAILABLE = INOTIFY is not None
+
+
+def is_watched_image(name):
+    """只处理图片文件；上传过程中的临时文件（.upload-*.part）等隐藏文件忽略"""
+    return not name.startswith('.') and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def source_path(directory, name):
+    """与photos.json中的src一致的路径格式（使用/分隔）"""
+    return f"{directory.rstrip('/')}/{name}"
+
+
+def file_signature(path):
+    """文件的 (大小, 修改时间)；文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def scan_directory(directory):
+    """列出目录中的图片及其 (大小, 修改时间)；scandir在大多数平台上不需要为每个文件单独stat"""
+    snapshot = {}
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return snapshot
+    with entries:
+        for entry in entries:
+            if not is_watched_image(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            snapshot[source_path(directory, entry.name)] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+class InotifySource:
+    """inotify事件源：返回发生变化的文件名"""
+
+    def __init__(self, directory):
+        self.fd = INOTIFY.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        if INOTIFY.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, os.strerror(error))
+
+    def wait(self, timeout):
+        """等待事件，返回 (文件名集合, 是否需要完整重新扫描)"""
+        names = set()
+        rescan = False
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return names, rescan
+        while True:
+            try:
+                data = os.read(self.fd, INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                    # 队列溢出丢失了事件，或目录本身被替换：退回到一次完整扫描
+                    rescan = True
+                elif name:
+                    names.add(os.fsdecode(name))
+        return names, rescan
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """监视目录中的图片，按批回调新增/修改和删除的文件
+
+    on_change(changed, removed) 在监视线程中调用，两个参数都是路径列表。
+    baseline为已经处理过的 {路径: (大小, 修改时间)}（例如派生图缓存清单），
+    启动时与目录比较，只回调不一致的文件；为None时以启动时的目录状态为基准。
+    """
+
+    def __init__(self, on_change, directory=WATCH_DIR, baseline=None, debounce=DEFAULT_DEBOUNCE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=None):
+        self.on_change = on_change
+        self.directory = directory
+        self.baseline = baseline
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = INOTIFY_AVAILABLE if use_inotify is None else use_inotify and INOTIFY_AVAILABLE
+        self.mode = None
+        self._snapshot = {}
+        self._pending = {}
+        self._first_change = None
+        self._last_change = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._source = None
+
+    def start(self):
+        """开始监视（在后台线程中运行）"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self.use_inotify:
+            try:
+                # 先注册监视再扫描，扫描期间写入的文件不会漏掉
+                self._source = InotifySource(self.directory)
+            except OSError as e:
+                print(f"⚠️  inotify不可用（{e}），改为每{self.poll_interval}秒轮询")
+        self.mode = 'inotify' if self._source else 'polling'
+        current = scan_directory(self.directory)
+        with self._lock:
+            if self.baseline is None:
+                self._snapshot = current
+            else:
+                self._snapshot = {path: tuple(signature) for path, signature in self.baseline.items()
+                                  if path in current}
+                self._merge_scan(current)
+        self._thread = threading.Thread(target=self._run, name='directory-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            timeout = self.poll_interval
+            if self._pending:
+                timeout = min(timeout, self.debounce)
+            if self._source is not None:
+                names, rescan = self._source.wait(timeout)
+                with self._lock:
+                    if rescan:
+                        self._merge_scan(scan_directory(self.directory))
+                    for name in names:
+                        if is_watched_image(name):
+                            path = source_path(self.directory, name)
+                            self._mark(path, file_signature(path))
+            else:
+                if self._stop.wait(timeout):
+                    break
+                current = scan_directory(self.directory)
+                with self._lock:
+                    self._merge_scan(current)
+            self._flush_if_settled()
+
+    def _merge_scan(self, current):
+        """把一次完整扫描与快照比较，差异加入待处理（调用方持有锁）"""
+        for path, signature in current.items():
+            if self._snapshot.get(path) != signature:
+                self._mark(path, signature)
+        for path in self._snapshot:
+            if path not in current:
+                self._mark(path, None)
+
+    def _mark(self, path, signature):
+        """记录一个文件的最新状态（None表示已删除），状态变化时重新开始计时（调用方持有锁）"""
+        if path in self._pending and self._pending[path] == signature:
+            return
+        if path not in self._pending and self._snapshot.get(path) == signature:
+            return
+        now = time.monotonic()
+        self._pending[path] = signature
+        self._last_change = now
+        if self._first_change is None:
+            self._first_change = now
+
+    def _flush_if_settled(self):
+        """待处理的文件在debounce秒内没有变化时回调；仍在写入的文件留到下一批"""
+        with self._lock:
+            if not self._pending:
+                return
+            now = time.monotonic()
+            waited_enough = now - self._first_change >= MAX_BATCH_DELAY
+            if now - self._last_change < self.debounce and not waited_enough:
+                return
+            changed, removed, growing = [], [], False
+            for path, signature in list(self._pending.items()):
+                current = file_signature(path)
+                if current != signature:
+                    # 轮询/事件之后又被写入：等它稳定
+                    self._pending[path] = current
+                    growing = True
+                    continue
+                del self._pending[path]
+                if signature is None:
+                    if self._snapshot.pop(path, None) is not None:
+                        removed.append(path)
+                elif self._snapshot.get(path) != signature:
+                    self._snapshot[path] = signature
+                    changed.append(path)
+            if growing:
+                self._last_change = now
+            self._first_change = now if self._pending else None
+        if changed or removed:
+            try:
+                self.on_change(sorted(changed), sorted(removed))
+            except Exception as e:
+                print(f"❌ 处理文件变化时出错：{e}")
+
+
+def manifest_baseline(manifest):
+    """派生图缓存清单中每张原图处理时的 (大小, 修改时间)，作为监视的起始基准"""
+    return {path: (entry.get('size'), entry.get('mtime_ns')) for path, entry in manifest.entries.items()}
+
+
+def process_changes(changed, removed, workers=DEFAULT_WORKERS):
+    """独立运行时的处理：一次读取生成派生图和EXIF，写入photos.json和增量状态"""
+    for path in removed:
+        print(f"🗑️  原图已删除：{path}（派生文件在下次运行generate_thumbnails.py时清理）")
+    if not changed:
+        return
+    print(f"🔄 处理 {len(changed)} 张新增或修改的图片...")
+    manifest = DerivativeManifest()
+    results = generate_thumbnails_parallel(changed, workers=workers, progress=print_progress,
+                                           manifest=manifest, exif=True)
+    record_exif_state(results, ExifState())
+    recorded = record_results(results)
+    print(f"✅ 完成，已更新photos.json中 {recorded} 张照片")
+
+
+def watch(debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL, workers=DEFAULT_WORKERS,
+          use_inotify=None):
+    """独立运行监视，直到Ctrl+C"""
+    if not PIL_AVAILABLE:
+        print("❌ 错误：Pillow库未安装")
+        print("💡 请运行：pip install Pillow")
+        return
+    watcher = DirectoryWatcher(lambda changed, removed: process_changes(changed, removed, workers),
+                               baseline=manifest_baseline(DerivativeManifest()), debounce=debounce,
+                               poll_interval=poll_interval, use_inotify=use_inotify)
+    watcher.start()
+    print(f"👀 正在监视 {WATCH_DIR}/（{watcher.mode}），按 Ctrl+C 停止")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    watcher.stop()
+    print("\n🛑 已停止监视")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='监视data文件夹，自动处理新增或修改的图片')
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help='最后一次变化后等待多少秒再处理（默认%(default)s）')
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='没有inotify时的轮询间隔，单位秒（默认%(default)s）')
+    parser.add_argument('--no-inotify', action='store_true', help='强制使用轮询')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'并行进程数（默认等于CPU核心数：{DEFAULT_WORKERS}）')
+    args = parser.parse_args()
+    if args.debounce < 0 or args.poll <= 0:
+        parser.error('--debounce 不能为负数，--poll 必须大于0')
+    watch(debounce=args.debounce, poll_interval=args.poll, workers=max(1, args.workers),
+          use_inotify=False if args.no_inotify else None)